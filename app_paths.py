@@ -0,0 +1,24 @@
+"""
+本地缓存目录
+"""
+
+import os
+import sys
+
+
+def user_cache_dir(*parts):
+    """
+    返回（并创建）本工具的用户缓存目录
+
+    Windows 使用 %LOCALAPPDATA%\\ExcelTool，其他系统使用 $XDG_CACHE_HOME/excel_tool
+    （默认 ~/.cache/excel_tool）。可用环境变量 EXCEL_TOOL_CACHE_DIR 覆盖。
+    """
+    base = os.environ.get("EXCEL_TOOL_CACHE_DIR")
+    if not base:
+        if sys.platform == "win32":
+            base = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "ExcelTool")
+        else:
+            base = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "excel_tool")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
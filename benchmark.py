@@ -0,0 +1,405 @@
+"""
+性能基准 - 在生成的数据上运行拆分、合并、结构检查，并与保存的基准结果比较
+
+用法:
+    python benchmark.py --save-baseline benchmark_baseline.json    # 在当前代码上生成基准
+    python benchmark.py --baseline benchmark_baseline.json         # 修改代码后比较，超出允许范围时退出码为 1
+    python benchmark.py --quick -o results.json                     # 小数据量快速运行
+    python benchmark.py --compare benchmark_baseline.json results.json
+
+基准与机器有关，请在同一台机器（或同一规格的 CI 主机）上生成和比较。
+
+判断是否退化：每个基准重复运行多次，比较最快一次的耗时（受其他进程干扰最小），
+用中位数绝对偏差（MAD）估计噪声，允许的变慢比例为
+max(--threshold, --noise-factor × 两次运行的相对噪声之和)；
+耗时增加不到 TIME_SLACK_SECONDS 时不算退化；
+峰值内存超出 --memory-threshold 且多于 MEMORY_SLACK_BYTES 时也算退化；
+基准中有、本次没有结果的基准（没有用 --only 排除的）同样算作退化。
+
+基准运行不更新拆分/合并的校准数据（设置 EXCEL_TOOL_NO_CALIBRATION，见 memory_budget.py）。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import statistics
+import tempfile
+
+from openpyxl import Workbook
+
+from memory_monitor import MemorySampler, format_bytes
+from memory_budget import NO_CALIBRATION_ENV
+
+# 生成数据的随机种子，保证每次数据相同
+SEED = 20240601
+
+# 峰值内存的变化小于该值时不算退化（采样误差）
+MEMORY_SLACK_BYTES = 8 << 20
+
+# 耗时增加不到该秒数时不算退化（很短的基准主要受调度抖动影响）
+TIME_SLACK_SECONDS = 0.05
+
+# 数据规模：(拆分行数, 合并文件数, 每个合并文件的行数)
+SCALES = {
+    "quick": (200, 4, 2000),
+    "default": (1000, 8, 10000),
+}
+
+# 列：前几列文本，其余为数字和日期；14 列保证覆盖 F1~M1 的表头填充
+COLUMNS = ["编号", "姓名", "部门", "城市", "备注"] + [f"数值{i}" for i in range(1, 8)] + ["日期", "金额"]
+
+
+def generate_workbook(path, rows, rng, start=0):
+    """生成一个测试工作簿（write_only，生成速度快）"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(COLUMNS)
+    departments = ["销售部", "研发部", "财务部", "人事部", "市场部"]
+    cities = ["北京", "上海", "广州", "深圳", "杭州", "成都"]
+    base_date = datetime.datetime(2024, 1, 1)
+    for i in range(start, start + rows):
+        # 约 2% 的行A列为空，拆分时会跳过
+        ws.append([
+            None if rng.random() < 0.02 else f"NO{i:07d}",
+            f"员工{rng.randrange(100000)}",
+            rng.choice(departments),
+            rng.choice(cities),
+            "备注" * rng.randrange(0, 6),
+        ] + [rng.randrange(1000000) for _ in range(7)] + [
+            base_date + datetime.timedelta(days=rng.randrange(365)),
+            round(rng.random() * 10000, 2),
+        ])
+    wb.save(path)
+
+
+def generate_corpus(directory, scale):
+    """生成拆分用的单个文件和合并用的一组文件"""
+    split_rows, merge_files, merge_rows = SCALES[scale]
+    rng = random.Random(SEED)
+    split_file = os.path.join(directory, "split_input.xlsx")
+    generate_workbook(split_file, split_rows, rng)
+    merge_dir = os.path.join(directory, "merge_input")
+    os.makedirs(merge_dir)
+    for idx in range(merge_files):
+        generate_workbook(os.path.join(merge_dir, f"part_{idx + 1:02d}.xlsx"), merge_rows, rng,
+                          start=idx * merge_rows)
+    return {"split_file": split_file, "merge_dir": merge_dir}
+
+
+def _quiet(message):
+    pass
+
+
+# 列选择和行筛选基准使用的条件：约五分之一的行、14 列中的 4 列
+FILTER_COLUMNS = ["编号", "部门", "日期", "金额"]
+FILTER_WHERE = '部门 == "销售部"'
+
+
+def bench_split(corpus, work_dir, engine, rows_per_file=1, columns=None, where=None):
+    from split_excel import split_excel_by_rows
+    rows = [0]
+
+    def progress(done, total, rows_done):
+        rows[0] = rows_done
+
+    split_excel_by_rows(corpus["split_file"], os.path.join(work_dir, "split_output"), log=_quiet,
+                        progress=progress, engine=engine, rows_per_file=rows_per_file, columns=columns,
+                        where=where)
+    return rows[0]
+
+
+def bench_split_chunked(corpus, work_dir, engine):
+    return bench_split(corpus, work_dir, engine, rows_per_file=100)
+
+
+def bench_split_filtered(corpus, work_dir, engine):
+    return bench_split(corpus, work_dir, engine, columns=FILTER_COLUMNS, where=FILTER_WHERE)
+
+
+def bench_merge(corpus, work_dir, engine, pipeline=False, columns=None, where=None, sort_by=None,
+                parse_cache=None):
+    from merge_excel import merge_excel_files
+    rows = [0]
+
+    def progress(done, total, rows_done):
+        rows[0] = rows_done
+
+    merge_excel_files(corpus["merge_dir"], os.path.join(work_dir, "merged.xlsx"), log=_quiet,
+                      progress=progress, engine=engine, pipeline=pipeline, columns=columns, where=where,
+                      sort_by=sort_by, parse_cache=parse_cache)
+    return rows[0]
+
+
+def bench_merge_filtered(corpus, work_dir, engine):
+    return bench_merge(corpus, work_dir, engine, columns=FILTER_COLUMNS, where=FILTER_WHERE)
+
+
+def bench_merge_pipeline(corpus, work_dir, engine):
+    return bench_merge(corpus, work_dir, engine, pipeline=True)
+
+
+def bench_merge_sorted(corpus, work_dir, engine):
+    # 按金额排序需要经过 SQLite 暂存库（临时文件）
+    return bench_merge(corpus, work_dir, engine, sort_by=["金额"])
+
+
+def bench_merge_cached(corpus, work_dir, engine):
+    # 缓存目录放在测试数据目录下，预热运行之后都命中缓存
+    from parse_cache import ParseCache
+    cache = ParseCache(os.path.join(os.path.dirname(corpus["merge_dir"]), "parse_cache"))
+    return bench_merge(corpus, work_dir, engine, parse_cache=cache)
+
+
+def bench_zip(corpus, work_dir, level):
+    # 打包拆分结果（每行一个 xlsx）；拆分只在第一次运行时进行，之后的运行只计打包时间
+    from split_excel import split_excel_by_rows
+    from zip_package import package_directory
+    split_dir = os.path.join(os.path.dirname(corpus["merge_dir"]), "zip_input")
+    if not os.path.isdir(split_dir):
+        split_excel_by_rows(corpus["split_file"], split_dir, log=_quiet)
+    stats = package_directory(split_dir, os.path.join(work_dir, "split.zip"), level=level, log=_quiet)
+    return stats["members"]
+
+
+def bench_inspect(corpus, work_dir, engine=None):
+    from check_excel_structure import find_excel_files, inspect_files
+    reports = inspect_files(find_excel_files([corpus["merge_dir"]]), jobs=1)
+    return sum(report["max_row"] or 0 for report in reports)
+
+
+# 基准名称 -> (函数, 处理方式)
+BENCHMARKS = {
+    "split_memory": (bench_split, "memory"),
+    "split_streaming": (bench_split, "streaming"),
+    "split_chunked": (bench_split_chunked, "streaming"),
+    "split_filtered": (bench_split_filtered, "streaming"),
+    "merge_memory": (bench_merge, "memory"),
+    "merge_streaming": (bench_merge, "streaming"),
+    "merge_pipeline": (bench_merge_pipeline, "memory"),
+    "merge_filtered": (bench_merge_filtered, "streaming"),
+    "merge_sorted": (bench_merge_sorted, "streaming"),
+    "merge_cached": (bench_merge_cached, "memory"),
+    # 打包基准的“处理方式”为压缩级别，行/秒即每秒打包的文件数
+    "zip_store": (bench_zip, "store"),
+    "zip_auto": (bench_zip, "auto"),
+    "zip_fast": (bench_zip, 1),
+    "zip_default": (bench_zip, 6),
+    "zip_best": (bench_zip, 9),
+    "inspect": (bench_inspect, None),
+}
+
+
+def median_abs_deviation(values):
+    center = statistics.median(values)
+    return statistics.median(abs(v - center) for v in values)
+
+
+def run_benchmark(name, corpus, repeats, warmup):
+    """运行一个基准，返回统计结果"""
+    func, engine = BENCHMARKS[name]
+    seconds = []
+    peaks = []
+    rows = 0
+    for run in range(warmup + repeats):
+        work_dir = tempfile.mkdtemp(prefix="bench_")
+        try:
+            with MemorySampler() as sampler:
+                start = time.perf_counter()
+                rows = func(corpus, work_dir, engine)
+                elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if run >= warmup:
+            seconds.append(elapsed)
+            peaks.append(sampler.peak_delta or 0)
+    best = min(seconds)
+    return {
+        "rows": rows,
+        "runs": seconds,
+        "best_seconds": best,
+        "median_seconds": statistics.median(seconds),
+        "mad_seconds": median_abs_deviation(seconds),
+        "rows_per_second": rows / best if best > 0 else None,
+        "peak_memory_bytes": statistics.median(peaks),
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_all(names, scale, repeats, warmup, log=print):
+    """生成数据并运行所有基准"""
+    results = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "scale": scale,
+        "repeats": repeats,
+        "environment": environment(),
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_corpus_") as corpus_dir:
+        log(f"正在生成测试数据（{scale}）...")
+        corpus = generate_corpus(corpus_dir, scale)
+        for name in names:
+            result = run_benchmark(name, corpus, repeats, warmup)
+            results["benchmarks"][name] = result
+            log(f"{name}: 最快 {result['best_seconds']:.3f} 秒, 中位数 {result['median_seconds']:.3f} 秒 "
+                f"(±{result['mad_seconds']:.3f}), "
+                f"{format_rate(result['rows_per_second'])} 行/秒, 峰值内存 {format_bytes(result['peak_memory_bytes'])}")
+    return results
+
+
+def format_rate(value):
+    """每秒行数；没有行数（耗时为 0）时为“-”"""
+    return "-" if value is None else f"{value:.0f}"
+
+
+def compare(baseline, current, threshold=0.10, noise_factor=3.0, memory_threshold=0.20, only=None):
+    """
+    逐个基准比较，返回 (比较结果列表, 是否有退化)
+
+    本次新增的基准只列出；基准中有、本次没有运行的基准算作退化（only 指定了只运行哪些基准时，
+    不检查其他基准）。数据规模不同时无法比较，直接报错。
+    """
+    if baseline.get("scale") != current.get("scale"):
+        raise ValueError(f"数据规模不同: 基准 {baseline.get('scale')}，本次 {current.get('scale')}")
+    rows = []
+    regressed = False
+    for name, now in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            rows.append({"benchmark": name, "status": "新增"})
+            continue
+        noise = (before["mad_seconds"] / before["median_seconds"] + now["mad_seconds"] / now["median_seconds"])
+        allowed = max(threshold, noise_factor * noise)
+        time_change = now["best_seconds"] / before["best_seconds"] - 1
+        memory_before = before["peak_memory_bytes"]
+        memory_now = now["peak_memory_bytes"]
+        memory_change = (memory_now / memory_before - 1) if memory_before else None
+        slow = time_change > allowed and now["best_seconds"] - before["best_seconds"] > TIME_SLACK_SECONDS
+        heavy = (memory_now - memory_before > MEMORY_SLACK_BYTES
+                 and (memory_change is None or memory_change > memory_threshold))
+        status = "退化" if slow or heavy else ("变快" if time_change < -allowed else "正常")
+        regressed = regressed or slow or heavy
+        rows.append({
+            "benchmark": name,
+            "baseline_rows_per_second": before["rows_per_second"],
+            "current_rows_per_second": now["rows_per_second"],
+            "time_change": time_change,
+            "allowed": allowed,
+            "baseline_memory": memory_before,
+            "current_memory": memory_now,
+            "memory_change": memory_change,
+            "status": status + ("（时间）" if slow else "") + ("（内存）" if heavy else ""),
+        })
+    for name in baseline["benchmarks"]:
+        if name not in current["benchmarks"] and (only is None or name in only):
+            rows.append({"benchmark": name, "status": "缺少（本次没有结果）"})
+            regressed = True
+    return rows, regressed
+
+
+def format_table(rows):
+    """比较结果的文本表格"""
+    header = ["基准", "基准 行/秒", "本次 行/秒", "耗时变化", "允许", "基准内存", "本次内存", "结果"]
+    lines = [header]
+    for row in rows:
+        if "time_change" not in row:
+            lines.append([row["benchmark"], "", "", "", "", "", "", row["status"]])
+            continue
+        lines.append([
+            row["benchmark"],
+            format_rate(row["baseline_rows_per_second"]),
+            format_rate(row["current_rows_per_second"]),
+            f"{row['time_change']:+.1%}",
+            f"{row['allowed']:.1%}",
+            format_bytes(row["baseline_memory"]),
+            format_bytes(row["current_memory"]),
+            row["status"],
+        ])
+
+    def width(text):
+        return sum(2 if ord(c) > 127 else 1 for c in text)
+
+    widths = [max(width(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell + " " * (widths[i] - width(cell)) for i, cell in enumerate(line)).rstrip()
+        for line in lines
+    )
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    # 生成的数据和重复运行不代表日常使用，不用于校准估算
+    os.environ.setdefault(NO_CALIBRATION_ENV, "1")
+    parser = argparse.ArgumentParser(description="运行性能基准并与基准结果比较")
+    parser.add_argument("--baseline", help="与该基准结果比较，有退化时退出码为 1")
+    parser.add_argument("--save-baseline", metavar="FILE", help="把本次结果保存为基准")
+    parser.add_argument("-o", "--output", help="把本次结果写入 JSON 文件")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="只比较两个已有的结果文件，不运行基准")
+    parser.add_argument("--quick", action="store_true", help="使用小数据量")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="只运行指定的基准")
+    parser.add_argument("--repeats", type=int, default=5, help="每个基准的重复次数（默认5）")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入结果的预热次数（默认1）")
+    parser.add_argument("--threshold", type=float, default=0.10, help="允许的最小变慢比例（默认0.10）")
+    parser.add_argument("--noise-factor", type=float, default=3.0, help="噪声放大系数（默认3）")
+    parser.add_argument("--memory-threshold", type=float, default=0.20, help="允许的峰值内存增长比例（默认0.20）")
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = (load_results(path) for path in args.compare)
+    else:
+        if args.repeats < 1:
+            parser.error("--repeats 必须大于0")
+        scale = "quick" if args.quick else "default"
+        names = args.only or list(BENCHMARKS)
+        current = run_all(names, scale, args.repeats, args.warmup)
+        if args.output:
+            save_results(current, args.output)
+        if args.save_baseline:
+            save_results(current, args.save_baseline)
+            print(f"基准已保存: {args.save_baseline}")
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+
+    if baseline.get("environment") != current.get("environment"):
+        print("警告: 基准与本次运行的环境不同，结果可能不可比")
+    try:
+        rows, regressed = compare(baseline, current, args.threshold, args.noise_factor, args.memory_threshold,
+                                  args.only)
+    except ValueError as e:
+        print(f"无法比较: {e}")
+        return 2
+    print()
+    print(format_table(rows))
+    if regressed:
+        print("\n性能退化超出允许范围")
+        return 1
+    print("\n没有发现性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
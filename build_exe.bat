@@ -21,8 +21,8 @@ echo.
 echo 开始打包...
 echo.
 
-REM 使用PyInstaller打包
-pyinstaller --name=Excel拆分合并工具 --onefile --windowed --clean excel_tool_gui.py
+REM 使用打包脚本（默认 fast 配置：单文件夹，启动最快；需要单个exe时运行 build_exe.bat --profile onefile）
+python build_exe.py %*
 
 if errorlevel 1 (
     echo.
@@ -36,10 +36,11 @@ echo ========================================
 echo 打包完成！
 echo ========================================
 echo.
-echo exe文件位置: dist\Excel拆分合并工具.exe
+echo exe文件位置: dist\Excel拆分合并工具\Excel拆分合并工具.exe
+echo 打包报告: dist\build_report.json
 echo.
 echo 提示：
-echo 1. 可以将此exe文件复制到其他Windows电脑上直接运行
+echo 1. 请将整个 dist\Excel拆分合并工具 文件夹复制到其他Windows电脑上运行
 echo 2. 不需要安装Python环境
 echo.
 pause
@@ -1,11 +1,56 @@
 """
 打包Excel工具为exe可执行文件的脚本
 使用 PyInstaller 进行打包
+
+用法:
+    python build_exe.py                      # 默认 fast 配置（单文件夹，启动最快）
+    python build_exe.py --profile onefile    # 单个exe文件
+    python build_exe.py --upx-dir C:\\upx     # 使用UPX压缩
 """
 
+import argparse
+import json
+import statistics
 import subprocess
 import sys
 import os
+import tempfile
+import time
+
+APP_NAME = "Excel拆分合并工具"
+
+# 打包配置
+BUILD_PROFILES = {
+    "fast": {
+        "description": "单文件夹，启动时无需解压（推荐）",
+        "onefile": False,
+        "startup_budget": 3.0,
+    },
+    "onefile": {
+        "description": "单个exe文件，方便分发，但每次启动都要解压到临时目录",
+        "onefile": True,
+        "startup_budget": 8.0,
+    },
+}
+
+# 程序用不到的模块，排除后体积更小、启动时需要加载的文件更少
+EXCLUDED_MODULES = [
+    "pandas.tests",
+    "pandas.plotting._matplotlib",
+    "numpy.tests",
+    "numpy.f2py",
+    "numpy.distutils",
+    "matplotlib",
+    "scipy",
+    "IPython",
+    "jinja2",
+    "pytest",
+    "streamlit",
+    "tkinter.test",
+    "lib2to3",
+    "pydoc_data",
+]
+
 
 def install_pyinstaller():
     """安装PyInstaller如果未安装"""
@@ -17,40 +62,168 @@ def install_pyinstaller():
         subprocess.check_call([sys.executable, "-m", "pip", "install", "pyinstaller"])
         print("PyInstaller 安装完成")
 
-def build_exe():
-    """打包为exe文件"""
-    # 检查并安装PyInstaller
-    install_pyinstaller()
-    
-    # PyInstaller命令参数
+
+def artifact_path(profile):
+    """打包生成的可执行文件路径"""
+    exe_name = APP_NAME + (".exe" if sys.platform == "win32" else "")
+    if BUILD_PROFILES[profile]["onefile"]:
+        return os.path.abspath(os.path.join("dist", exe_name))
+    return os.path.abspath(os.path.join("dist", APP_NAME, exe_name))
+
+
+def artifact_size(profile):
+    """打包结果的总字节数（单文件夹时统计整个文件夹）"""
+    path = artifact_path(profile)
+    if BUILD_PROFILES[profile]["onefile"]:
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(os.path.dirname(path)):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+
+def build_command(profile, upx_dir=None):
+    """生成 PyInstaller 命令参数"""
     cmd = [
         "pyinstaller",
-        "--name=Excel拆分合并工具",  # exe文件名
-        "--onefile",  # 打包为单个exe文件
+        f"--name={APP_NAME}",  # exe文件名
+        "--onefile" if BUILD_PROFILES[profile]["onefile"] else "--onedir",
         "--windowed",  # 不显示控制台窗口（GUI应用）
         "--icon=NONE",  # 可以指定图标文件
         "--clean",  # 清理临时文件
-        "excel_tool_gui.py"
+        "--noconfirm",  # 覆盖上次的输出
     ]
-    
+    for module in EXCLUDED_MODULES:
+        cmd.append(f"--exclude-module={module}")
+    if upx_dir:
+        cmd.append(f"--upx-dir={upx_dir}")
+    else:
+        cmd.append("--noupx")
+    cmd.append("excel_tool_gui.py")
+    return cmd
+
+
+def measure_startup(exe_path, runs=3, timeout=60):
+    """
+    多次启动打包结果，记录启动耗时
+
+    程序以 --startup-report 和 --exit-after-startup 参数启动，窗口首次显示后
+    写出导入耗时和首次显示窗口的耗时并退出；wall_seconds 是从启动进程到退出的总时间，
+    包含单文件模式的解压时间。
+    """
+    results = []
+    for run in range(1, runs + 1):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_path = os.path.join(tmp_dir, "startup.json")
+            start = time.perf_counter()
+            subprocess.run([exe_path, "--startup-report", report_path, "--exit-after-startup"],
+                           timeout=timeout, check=True)
+            wall_seconds = time.perf_counter() - start
+            with open(report_path, encoding="utf-8") as f:
+                report = json.load(f)
+        report["wall_seconds"] = round(wall_seconds, 4)
+        results.append(report)
+        print(f"启动测量 [{run}/{runs}]: 总耗时 {wall_seconds:.2f} 秒, "
+              f"导入 {report['import_seconds']:.2f} 秒, 首次显示窗口 {report['first_window_seconds']:.2f} 秒")
+    return results
+
+
+def build_exe(profile="fast", upx_dir=None, startup_budget=None, startup_runs=3,
+              skip_startup_check=False, report_file=os.path.join("dist", "build_report.json")):
+    """打包为exe文件，并检查启动耗时是否超出预算"""
+    # 检查并安装PyInstaller
+    install_pyinstaller()
+
+    # PyInstaller命令参数
+    cmd = build_command(profile, upx_dir)
+
+    print(f"打包配置: {profile} - {BUILD_PROFILES[profile]['description']}")
     print("开始打包...")
     print(f"执行命令: {' '.join(cmd)}")
-    
+
     try:
+        build_start = time.perf_counter()
         subprocess.check_call(cmd)
-        print("\n" + "="*50)
-        print("打包完成！")
-        print("="*50)
-        print(f"exe文件位置: {os.path.abspath('dist/Excel拆分合并工具.exe')}")
-        print("\n提示：")
-        print("1. exe文件位于 'dist' 文件夹中")
-        print("2. 可以将此exe文件复制到其他Windows电脑上直接运行")
-        print("3. 不需要安装Python环境")
+        build_seconds = time.perf_counter() - build_start
     except subprocess.CalledProcessError as e:
         print(f"打包失败: {e}")
         sys.exit(1)
 
-if __name__ == "__main__":
-    build_exe()
+    exe_path = artifact_path(profile)
+    print("\n" + "="*50)
+    print("打包完成！")
+    print("="*50)
+    print(f"exe文件位置: {exe_path}")
+
+    if startup_budget is None:
+        startup_budget = BUILD_PROFILES[profile]["startup_budget"]
+
+    report = {
+        "profile": profile,
+        "onefile": BUILD_PROFILES[profile]["onefile"],
+        "upx": bool(upx_dir),
+        "excluded_modules": EXCLUDED_MODULES,
+        "artifact": exe_path,
+        "artifact_bytes": artifact_size(profile),
+        "build_seconds": round(build_seconds, 2),
+        "startup_budget_seconds": startup_budget,
+    }
+
+    passed = True
+    if not skip_startup_check:
+        print("\n正在测量启动耗时...")
+        try:
+            runs = measure_startup(exe_path, runs=startup_runs)
+        except (subprocess.SubprocessError, OSError, ValueError) as e:
+            print(f"启动测量失败: {e}")
+            runs = []
+            passed = False
+        report["startup_runs"] = runs
+        if runs:
+            report["median_import_seconds"] = statistics.median(r["import_seconds"] for r in runs)
+            report["median_first_window_seconds"] = statistics.median(r["first_window_seconds"] for r in runs)
+            report["median_wall_seconds"] = statistics.median(r["wall_seconds"] for r in runs)
+            passed = report["median_wall_seconds"] <= startup_budget
+    report["passed"] = passed
 
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n打包报告: {os.path.abspath(report_file)}")
 
+    if not passed:
+        if "median_wall_seconds" in report:
+            print(f"启动耗时 {report['median_wall_seconds']:.2f} 秒，超出预算 {startup_budget:.2f} 秒")
+        sys.exit(1)
+
+    print("\n提示：")
+    if BUILD_PROFILES[profile]["onefile"]:
+        print("1. exe文件位于 'dist' 文件夹中")
+        print("2. 可以将此exe文件复制到其他Windows电脑上直接运行")
+    else:
+        print(f"1. 程序位于 'dist/{APP_NAME}' 文件夹中，请复制整个文件夹")
+        print("2. 可以在其他Windows电脑上直接运行文件夹中的exe")
+    print("3. 不需要安装Python环境")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="打包Excel工具为可执行文件")
+    parser.add_argument("--profile", choices=sorted(BUILD_PROFILES), default="fast",
+                        help="打包配置（默认 fast：单文件夹，启动最快）")
+    parser.add_argument("--upx-dir", help="UPX 所在目录；不指定则不使用 UPX 压缩")
+    parser.add_argument("--startup-budget", type=float,
+                        help="启动耗时预算（秒），超出时返回非零退出码；默认使用配置中的值")
+    parser.add_argument("--startup-runs", type=int, default=3, help="启动测量次数（取中位数）")
+    parser.add_argument("--skip-startup-check", action="store_true", help="跳过启动耗时测量")
+    parser.add_argument("--report", default=os.path.join("dist", "build_report.json"),
+                        help="打包报告的输出路径")
+    args = parser.parse_args()
+
+    build_exe(profile=args.profile, upx_dir=args.upx_dir, startup_budget=args.startup_budget,
+              startup_runs=args.startup_runs, skip_startup_check=args.skip_startup_check,
+              report_file=args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,159 @@
-from openpyxl import load_workbook
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl.utils import get_column_letter
+
+from sheet_reader import XlsxSheetSource
+
+
+# 报告中显示的前几行
+PREVIEW_ROWS = 5
+
+# 写入 CSV 报告的字段
+REPORT_FIELDS = [
+    "file", "size_bytes", "sheet_names", "active_sheet", "dimension", "max_row", "max_column",
+    "header", "a2_value", "merged_ranges", "empty_a_rows", "seconds", "error",
+]
+
+
+def inspect_workbook(input_file, preview_rows=PREVIEW_ROWS):
+    """
+    检查单个 Excel 文件的结构，返回报告字典
+
+    只流式读取前 preview_rows 行；合并单元格、最大行列和A列为空的行数
+    从工作表 XML 中直接扫描，不创建单元格对象。
+    """
+    start = time.perf_counter()
+    report = {
+        "file": os.path.abspath(input_file),
+        "size_bytes": None,
+        "error": None,
+    }
+    try:
+        # 文件不存在或无法访问时只记录在报告中，不影响同一批的其他文件
+        report["size_bytes"] = os.path.getsize(input_file)
+        with XlsxSheetSource(input_file) as source:
+            report["sheet_names"] = source.sheet_names
+            report["active_sheet"] = source.sheet_names[source.active_index]
+
+            rows = {row_number: values for row_number, values in source.iter_rows(max_row=preview_rows)}
+            report["header"] = rows.get(1, [])
+            report["preview_rows"] = [rows.get(row_number, []) for row_number in range(1, preview_rows + 1)]
+            a2_row = rows.get(2, [])
+            report["a2_value"] = a2_row[0] if a2_row else None
+
+            report.update(source.scan_sheet())
+    except Exception as e:
+        report["error"] = str(e)
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
+
 
 def check_excel_structure(input_file):
     """检查Excel文件的结构"""
-    try:
-        wb = load_workbook(input_file)
-        ws = wb.active
-        
-        print(f"Excel文件结构:")
-        print(f"最大行数: {ws.max_row}")
-        print(f"最大列数: {ws.max_column}")
+    report = inspect_workbook(input_file)
+    if report["error"]:
+        print(f"检查文件时出错: {report['error']}")
+        return report
+
+    print(f"Excel文件结构:")
+    print(f"工作表: {report['sheet_names']}（活动工作表: {report['active_sheet']}）")
+    print(f"最大行数: {report['max_row']}")
+    print(f"最大列数: {report['max_column']}")
+    print()
+
+    # 检查前几行的内容
+    for row, values in enumerate(report["preview_rows"], 1):
+        if row > report["max_row"]:
+            break
+        print(f"第{row}行内容:")
+        for col in range(1, min(20, report["max_column"] + 1)):  # 显示前19列
+            cell_value = values[col - 1] if col <= len(values) else None
+            print(f"  {get_column_letter(col)}{row}: {cell_value}")
         print()
-        
-        # 检查前几行的内容
-        for row in range(1, min(6, ws.max_row + 1)):
-            print(f"第{row}行内容:")
-            for col in range(1, min(20, ws.max_column + 1)):  # 显示前19列
-                cell_value = ws.cell(row=row, column=col).value
-                print(f"  {chr(64+col)}{row}: {cell_value}")
-            print()
-        
-        # 特别检查A2单元格内容
-        a2_value = ws.cell(row=2, column=1).value
-        print(f"A2单元格内容: {a2_value}")
-        
-        # 检查合并单元格
-        if ws.merged_cells:
-            print(f"\n合并单元格:")
-            for merged_range in ws.merged_cells:
-                print(f"  {merged_range}")
-        
-    except Exception as e:
-        print(f"检查文件时出错: {str(e)}")
 
-if __name__ == "__main__":
-    input_file = r"c:\Users\AllenHu\excel data\工作簿1.xlsx"
-    check_excel_structure(input_file)
+    # 特别检查A2单元格内容
+    print(f"A2单元格内容: {report['a2_value']}")
+    print(f"A列为空的数据行: {report['empty_a_rows']}")
+
+    # 检查合并单元格
+    if report["merged_ranges"]:
+        print(f"\n合并单元格:")
+        for merged_range in report["merged_ranges"]:
+            print(f"  {merged_range}")
+
+    return report
+
+
+def find_excel_files(paths):
+    """展开路径列表：文件原样保留，文件夹取其中的 .xlsx/.xlsm 文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith((".xlsx", ".xlsm")) and not name.startswith("~$"):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def inspect_files(files, jobs=None):
+    """并行检查多个文件，结果顺序与输入一致"""
+    if jobs == 1 or len(files) <= 1:
+        return [inspect_workbook(file) for file in files]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(inspect_workbook, files, chunksize=4))
+
 
+def write_report(reports, output_file):
+    """按扩展名把检查结果写成 JSON 或 CSV"""
+    if output_file.lower().endswith(".csv"):
+        with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for report in reports:
+                row = dict(report)
+                for key in ("sheet_names", "header", "merged_ranges"):
+                    if isinstance(row.get(key), list):
+                        row[key] = ";".join("" if v is None else str(v) for v in row[key])
+                writer.writerow(row)
+    else:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2, default=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查Excel文件结构")
+    parser.add_argument("paths", nargs="+", help="Excel 文件或包含 Excel 文件的文件夹")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数（默认CPU核数）")
+    parser.add_argument("-o", "--output", help="报告文件（.json 或 .csv）；不指定时打印到屏幕")
+    args = parser.parse_args()
+
+    files = find_excel_files(args.paths)
+    if not args.output and len(files) == 1:
+        check_excel_structure(files[0])
+        return
+
+    start = time.perf_counter()
+    reports = inspect_files(files, jobs=args.jobs)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for report in reports if report["error"])
+
+    if args.output:
+        write_report(reports, args.output)
+        print(f"已检查 {len(reports)} 个文件（失败 {failed} 个），用时 {elapsed:.2f} 秒，报告: {args.output}")
+    else:
+        for report in reports:
+            status = f"出错: {report['error']}" if report["error"] else \
+                f"{report['max_row']} 行, {report['max_column']} 列, A列为空 {report['empty_a_rows']} 行, " \
+                f"合并单元格 {len(report['merged_ranges'])} 个"
+            print(f"{os.path.basename(report['file'])}: {status}")
+
+
+if __name__ == "__main__":
+    main()
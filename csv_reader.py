@@ -0,0 +1,222 @@
+"""
+CSV / TSV 读取 - 与 sheet_reader.XlsxSheetSource 相同的接口，拆分、合并时可以和 xlsx 文件一起使用
+
+编码按文件开头判断：有 BOM 时为 UTF-8-BOM，能按 UTF-8 解码时为 UTF-8，否则按 GBK（GB18030）读取。
+分隔符：.tsv 为制表符，.csv 从开头几行判断（逗号、制表符、分号、竖线），判断不出时为逗号。
+
+逐行读取，内存占用与文件大小无关。第一行（表头）保持文字，其他行的单元格逐个转换：
+空白为 None，整数、小数、True / False 转换成对应类型（与 pandas.read_csv 的默认转换相近），其他保持文字。
+"""
+
+import io
+import re
+import csv
+import codecs
+
+CSV_EXTENSIONS = (".csv", ".tsv")
+
+# 判断编码和分隔符时读取的字节数
+SAMPLE_BYTES = 1 << 16
+
+# 统计行数时每次读取的字节数
+COUNT_CHUNK_SIZE = 1 << 20
+
+DELIMITER_CANDIDATES = ",\t;|"
+
+# 与 pandas.read_csv 默认的空值文字相同
+NA_VALUES = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+
+INT_RE = re.compile(r"[+-]?\d+")
+FLOAT_RE = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+BOOL_VALUES = {"True": True, "TRUE": True, "true": True, "False": False, "FALSE": False, "false": False}
+
+
+def is_csv_file(file_path):
+    return str(file_path).lower().endswith(CSV_EXTENSIONS)
+
+
+def detect_encoding(sample):
+    """按文件开头的字节判断编码：'utf-8-sig'、'utf-8' 或 'gb18030'（GBK 的超集）"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # 开头的样本可能在多字节字符中间截断，不要求最后一个字符完整
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def detect_delimiter(text, file_path=None):
+    """按扩展名或开头几行判断分隔符"""
+    if file_path is not None and str(file_path).lower().endswith(".tsv"):
+        return "\t"
+    lines = text.splitlines()[:20]
+    if len(lines) > 1:
+        # 最后一行可能不完整
+        lines = lines[:-1]
+    try:
+        return csv.Sniffer().sniff("\n".join(lines), delimiters=DELIMITER_CANDIDATES).delimiter
+    except csv.Error:
+        return ","
+
+
+def sniff(sample, file_path=None):
+    """按文件开头的字节判断 (编码, 分隔符)"""
+    encoding = detect_encoding(sample)
+    return encoding, detect_delimiter(sample.decode(encoding, errors="ignore"), file_path)
+
+
+def convert_value(text):
+    """单元格文字转换成 None / int / float / bool，其他保持文字"""
+    if text in NA_VALUES:
+        return None
+    if INT_RE.fullmatch(text):
+        return int(text)
+    if FLOAT_RE.fullmatch(text):
+        return float(text)
+    if text in BOOL_VALUES:
+        return BOOL_VALUES[text]
+    return text
+
+
+class CsvSource:
+    """
+    CSV / TSV 文件的流式读取，接口与 XlsxSheetSource 相同（probe_sheet、iter_rows）
+
+    file_path 可以是文件路径或二进制文件对象；encoding / delimiter 默认自动判断
+    """
+
+    def __init__(self, file_path, encoding=None, delimiter=None):
+        self.file_path = file_path
+        if hasattr(file_path, "read"):
+            file_path.seek(0)
+            sample = file_path.read(SAMPLE_BYTES)
+            file_path.seek(0)
+            name = getattr(file_path, "name", None)
+        else:
+            with open(file_path, "rb") as f:
+                sample = f.read(SAMPLE_BYTES)
+            name = file_path
+        detected_encoding, detected_delimiter = sniff(sample, name)
+        self.encoding = encoding or detected_encoding
+        self.delimiter = delimiter or detected_delimiter
+        self._files = []
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_text(self):
+        if hasattr(self.file_path, "read"):
+            self.file_path.seek(0)
+            f = io.TextIOWrapper(self.file_path, encoding=self.encoding, newline="")
+        else:
+            f = open(self.file_path, encoding=self.encoding, newline="")
+        self._files.append(f)
+        return f
+
+    def _release(self, f):
+        if f in self._files:
+            self._files.remove(f)
+        if hasattr(self.file_path, "read"):
+            # 不关闭调用方的文件对象
+            f.detach()
+        else:
+            f.close()
+
+    def probe_sheet(self, sheet=None):
+        """
+        返回 {'file_bytes', 'max_row', 'max_column'}
+
+        max_column 为表头的列数；max_row 按换行符个数估算（单元格中有换行时偏大），只用于显示进度。
+        """
+        first = next(self.iter_rows(max_row=1), None)
+        max_column = len(first[1]) if first else 0
+        lines = file_bytes = 0
+        last = b"\n"
+        if hasattr(self.file_path, "read"):
+            self.file_path.seek(0)
+            f = self.file_path
+        else:
+            f = open(self.file_path, "rb")
+        try:
+            while True:
+                chunk = f.read(COUNT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines += chunk.count(b"\n")
+                file_bytes += len(chunk)
+                last = chunk[-1:]
+        finally:
+            if f is not self.file_path:
+                f.close()
+        if last != b"\n":
+            lines += 1
+        return {"file_bytes": file_bytes, "max_row": lines or None, "max_column": max_column or None}
+
+    def iter_rows(self, sheet=None, min_row=1, max_row=None, columns=None, predicate=None, predicate_columns=None):
+        """
+        流式读取行，生成 (行号, [单元格值, ...])；行号从1开始，每条记录一行
+
+        没有内容的行不会生成；参数与 XlsxSheetSource.iter_rows 相同
+        """
+        f = self._open_text()
+        try:
+            reader = csv.reader(f, delimiter=self.delimiter)
+            header_seen = False
+            for row_number, texts in enumerate(reader, 1):
+                if max_row is not None and row_number > max_row:
+                    break
+                if not any(texts):
+                    continue
+                if not header_seen:
+                    header_seen = True
+                    if row_number < min_row:
+                        continue
+                    # 第一个有内容的行是表头，保持文字
+                    values = [text if text != "" else None for text in texts]
+                    if predicate is not None and not predicate(_pick(values, predicate_columns)):
+                        continue
+                    yield row_number, _pick(values, columns) if columns is not None else values
+                    continue
+                if row_number < min_row:
+                    continue
+                # 先只转换筛选用到的列
+                if predicate is not None and not predicate(
+                        [convert_value(texts[c - 1]) if 0 < c <= len(texts) else None for c in predicate_columns]):
+                    continue
+                if columns is not None:
+                    yield row_number, [convert_value(texts[c - 1]) if 0 < c <= len(texts) else None for c in columns]
+                else:
+                    values = [convert_value(text) for text in texts]
+                    while values and values[-1] is None:
+                        values.pop()
+                    yield row_number, values
+        finally:
+            self._release(f)
+
+
+def _pick(values, indices):
+    return [values[c - 1] if 0 < c <= len(values) else None for c in indices]
+
+
+def read_csv_frame(file_path, data=None, usecols=None):
+    """用 pandas 读取整个 CSV / TSV（编码和分隔符与 CsvSource 相同）"""
+    import pandas as pd
+    if data is None:
+        with open(file_path, "rb") as f:
+            sample = f.read(SAMPLE_BYTES)
+    else:
+        sample = data[:SAMPLE_BYTES]
+    encoding, delimiter = sniff(sample, file_path)
+    return pd.read_csv(io.BytesIO(data) if data is not None else file_path, sep=delimiter, encoding=encoding,
+                       usecols=usecols)
@@ -0,0 +1,258 @@
+"""
+Excel数据预览 - 只读流式分页读取
+
+只解析需要显示的行：数据行在第一次经过时按块缓存到临时文件，
+并记录每块的偏移，之后翻到已经过的页只需读取该页对应的块。
+
+使用解析结果缓存（parse_cache.py）时，完整翻过一遍的文件写入缓存，
+之后打开内容相同的文件直接从缓存分页（CachedSheetPager），不再解析。
+
+分页读取器用完后调用 close() 或用 with 语句，关闭工作簿并删除缓存文件；
+没有关闭的读取器在被回收时关闭。
+"""
+
+import os
+import pickle
+import tempfile
+import threading
+from itertools import islice
+
+from openpyxl import load_workbook
+
+from csv_reader import CsvSource, is_csv_file
+
+
+# 缓存块大小（行），页大小应为它的整数倍
+PREVIEW_BLOCK_ROWS = 50
+
+
+def read_header(file_path, name=None):
+    """只读取第1行表头，file_path 也可以是文件对象；name 为 CSV / TSV 文件名时按 CSV 读取"""
+    if is_csv_file(name or file_path):
+        with CsvSource(file_path) as source:
+            first = next(source.iter_rows(max_row=1), None)
+        return first[1] if first else []
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+            return list(row)
+        return []
+    finally:
+        wb.close()
+
+
+def read_dimensions(file_path):
+    """从工作表的 dimension 信息读取行列数，不解析单元格；未记录时返回 (None, None)"""
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        ws = wb.active
+        return ws.max_row, ws.max_column
+    finally:
+        wb.close()
+
+
+def merged_schema(files):
+    """
+    只读取各文件的表头，返回合并后的列结构
+
+    参数:
+        files: [(文件名, 文件路径或文件对象), ...]
+
+    返回:
+        [{'列名', '出现文件数', '缺失文件'}, ...]，列顺序与合并结果一致
+    """
+    # 列名与合并时相同（空表头为 Unnamed: n，重复列名加 .1、.2）
+    from profile_excel import column_names
+    columns = ['源文件']
+    present = {'源文件': [name for name, _ in files]}
+    names = [name for name, _ in files]
+
+    for name, source in files:
+        for column in column_names(read_header(source, name)):
+            if column not in present:
+                columns.append(column)
+                present[column] = []
+            if name not in present[column]:
+                present[column].append(name)
+
+    schema = []
+    for column in columns:
+        missing = [name for name in names if name not in present[column]]
+        schema.append({
+            '列名': column,
+            '出现文件数': len(present[column]),
+            '缺失文件': '、'.join(missing),
+        })
+    return schema
+
+
+class SheetPager:
+    """按行区间读取活动工作表的数据行（第2行起）"""
+
+    def __init__(self, file_path, block_rows=PREVIEW_BLOCK_ROWS, on_complete=None, name=None):
+        """
+        file_path 可以是文件路径或文件对象
+        on_complete: 完整经过所有行后以 (表头, [(行号, 值), ...], {'estimated_rows': ...}) 调用一次
+        name: 文件名；为 CSV / TSV 文件名时按 CSV 读取（file_path 为文件对象时用于判断格式）
+        """
+        self.file_path = file_path
+        self.block_rows = block_rows
+        self.on_complete = on_complete
+
+        self._wb = None
+        self._source = None
+        self._spool = None
+        if is_csv_file(name or file_path):
+            source = self._source = CsvSource(file_path)
+            # 按换行符个数估算
+            max_row = source.probe_sheet()["max_row"]
+            self.estimated_rows = max(max_row - 1, 0) if max_row else None
+            rows = source.iter_rows()
+            first = next(rows, None)
+            self.header = first[1] if first else []
+            self._rows = ((row_number, tuple(values)) for row_number, values in rows)
+        else:
+            self._wb = load_workbook(file_path, read_only=True, data_only=True)
+            ws = self._wb.active
+            # dimension 中记录的行数只用于估算页数
+            self.estimated_rows = max(ws.max_row - 1, 0) if ws.max_row else None
+
+            rows = ws.iter_rows(values_only=True)
+            self.header = list(next(rows, ()))
+            self._rows = enumerate(rows, 2)
+        self._spool = tempfile.TemporaryFile()
+        self._block_offsets = []  # 每块在缓存文件中的字节偏移
+        self.scanned_rows = 0  # 已缓存的行数
+        self._lock = threading.Lock()
+        self.exhausted = False
+
+    @property
+    def total_rows(self):
+        """已完整经过时返回准确行数，否则返回 None"""
+        return self.scanned_rows if self.exhausted else None
+
+    def read_rows(self, start, count):
+        """
+        读取数据行 [start, start + count)，start 从0开始
+
+        返回 [(Excel行号, (单元格值, ...)), ...]
+        """
+        if count <= 0:
+            return []
+        first_block = start // self.block_rows
+        last_block = (start + count - 1) // self.block_rows
+
+        rows = []
+        with self._lock:
+            while len(self._block_offsets) <= last_block and not self.exhausted:
+                self._spool_next_block()
+            for block_index in range(first_block, min(last_block + 1, len(self._block_offsets))):
+                rows.extend(self._read_block(block_index))
+
+        offset = start - first_block * self.block_rows
+        return rows[offset:offset + count]
+
+    def _spool_next_block(self):
+        """从只读迭代器中取下一块，写入缓存文件"""
+        block = list(islice(self._rows, self.block_rows))
+        if block:
+            self._spool.seek(0, os.SEEK_END)
+            self._block_offsets.append(self._spool.tell())
+            pickle.dump(block, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+            self.scanned_rows += len(block)
+        if len(block) < self.block_rows:
+            self._finish()
+            if self.on_complete is not None:
+                rows = []
+                for block_index in range(len(self._block_offsets)):
+                    rows.extend(self._read_block(block_index))
+                self.on_complete(self.header, rows, {"estimated_rows": self.estimated_rows})
+
+    def _read_block(self, block_index):
+        self._spool.seek(self._block_offsets[block_index])
+        return pickle.load(self._spool)
+
+    def _finish(self):
+        self.exhausted = True
+        self._rows = iter(())
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+    def close(self):
+        """关闭工作簿并删除缓存文件，可以重复调用"""
+        with self._lock:
+            self._finish()
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # 如 Streamlit 的缓存淘汰读取器时不会调用 close()
+        try:
+            if getattr(self, "_spool", None) is not None or getattr(self, "_wb", None) is not None:
+                self.close()
+        except Exception:
+            pass
+
+
+class CachedSheetPager:
+    """从解析结果缓存中分页读取，接口与 SheetPager 相同"""
+
+    def __init__(self, header, rows):
+        self.header = header
+        self._rows = rows
+        self.estimated_rows = self.scanned_rows = len(rows)
+        self.exhausted = True
+
+    @property
+    def total_rows(self):
+        return self.scanned_rows
+
+    def read_rows(self, start, count):
+        return self._rows[start:start + count] if count > 0 else []
+
+    def close(self):
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sheet_pager(file_path, parse_cache=None, block_rows=PREVIEW_BLOCK_ROWS, name=None):
+    """
+    打开分页读取器；有解析结果缓存时直接从缓存读取，否则逐块解析，完整经过后写入缓存
+
+    file_path 可以是文件路径或文件对象（按内容计算缓存键）；name 见 SheetPager
+    """
+    if parse_cache is None:
+        return SheetPager(file_path, block_rows, name=name)
+    data = None
+    if hasattr(file_path, "read"):
+        file_path.seek(0)
+        data = file_path.read()
+        file_path.seek(0)
+    reader = "csv" if is_csv_file(name or file_path) else "openpyxl"
+    key = parse_cache.sheet_key(None if data is not None else file_path, data, reader=reader, data_only=True)
+    cached = parse_cache.get_sheet(key)
+    if cached is not None:
+        header, rows, _ = cached
+        return CachedSheetPager(header, [(row_number, tuple(values)) for row_number, values in rows])
+
+    def store(header, rows, info):
+        parse_cache.put_sheet(key, header, [(row_number, list(values)) for row_number, values in rows], info)
+
+    return SheetPager(file_path, block_rows, on_complete=store, name=name)
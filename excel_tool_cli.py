@@ -0,0 +1,531 @@
+"""
+Excel工具命令行入口
+
+用法:
+    python excel_tool_cli.py split 工作簿1.xlsx -o split_files
+    python excel_tool_cli.py split 工作簿1.xlsx -n 500 --name-template "批次{index:03d}_{first}"
+    python excel_tool_cli.py split 工作簿1.xlsx --header-style header_style.json
+    python excel_tool_cli.py split 工作簿1.xlsx --zip 拆分.zip --zip-level store --zip-volume-size 1GB
+    python excel_tool_cli.py split 大文件.xlsx --dry-run          # 只估算输出文件数、大小、内存和用时
+    python excel_tool_cli.py merge data/ -o 合并后的Excel.xlsx --jobs 4
+    python excel_tool_cli.py merge a.xlsx b.xlsx -o merged.csv --chunk-rows 500000
+    python excel_tool_cli.py merge //share/data/ -o merged.xlsx --pipeline --prefetch 4
+    python excel_tool_cli.py merge data/ -o out.xlsx --columns "编号,金额" --where '状态 == "已完成"'
+    python excel_tool_cli.py merge data/ -o out.csv --staging merge.sqlite --sort-by 日期 --dedup-rows
+    python excel_tool_cli.py merge data/ -o out.xlsx --parse-cache    # 再次合并相同的文件时不再解析
+    python excel_tool_cli.py merge data/ -o out.xlsx --group-by 部门 --agg 金额:sum,mean --agg 编号:count
+    python excel_tool_cli.py merge 1月.xlsx 2月.xlsx -o out.xlsx --key 订单号 --keep latest --timestamp 更新时间
+    python excel_tool_cli.py export merge.sqlite -o 按金额.xlsx --sort-by 金额 --descending
+    python excel_tool_cli.py watch data/ -o 合并后的Excel.xlsx --debounce 5 --status watch_status.json
+    python excel_tool_cli.py inspect data/ -o report.json
+    python excel_tool_cli.py --summary summary.json --profile merge.prof merge data/ -o out.xlsx
+    python excel_tool_cli.py --trace trace.json split 工作簿1.xlsx    # 用 chrome://tracing 打开
+
+退出码:
+    0 成功；1 处理出错；2 参数错误；3 没有找到输入文件；4 部分文件检查失败；130 被中断
+
+--summary 写出 JSON 摘要（命令、状态、文件数、行数、用时、峰值内存、各阶段耗时），
+为 - 时打印到标准输出，此时日志改为输出到标准错误。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from memory_monitor import peak_rss_bytes, peak_child_rss_bytes
+from perf_trace import Tracer, NULL_TRACER
+from memory_budget import ENGINES, ENGINE_AUTO, parse_size, default_memory_budget
+from file_dedup import DUPLICATE_MODES, DUPLICATES_REUSE
+from row_filter import parse_column_list
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NO_INPUT = 3
+EXIT_PARTIAL = 4
+EXIT_INTERRUPTED = 130
+
+
+class NoInputError(Exception):
+    """没有找到要处理的文件"""
+
+
+def run_split(args, log, tracer):
+    """拆分：返回摘要字段"""
+    from split_excel import split_excel_by_rows
+
+    if not os.path.isfile(args.input):
+        raise NoInputError(f"文件不存在: {args.input}")
+    if args.dry_run:
+        from job_planner import plan_split
+        plan = plan_split(args.input, rows_per_file=args.rows_per_file, columns=parse_column_list(args.columns),
+                          where=args.where, memory_budget=args.memory_budget)
+        log(plan.describe())
+        return {"input_files": 1, "dry_run": True, "plan": plan.to_dict()}
+    header_style = None
+    if args.header_style:
+        from header_style import load_header_style
+        header_style = load_header_style(args.header_style)
+    rows = [0]
+    memory = {}
+    parse_cache = open_parse_cache(args)
+
+    def progress(done, total, rows_done):
+        rows[0] = rows_done
+
+    file_count = split_excel_by_rows(args.input, args.output, log=log, progress=progress,
+                                     tracer=tracer, engine=args.engine, memory_budget=args.memory_budget,
+                                     memory_report=memory.update, rows_per_file=args.rows_per_file,
+                                     filename_template=args.name_template, header_style=header_style,
+                                     columns=parse_column_list(args.columns), where=args.where,
+                                     parse_cache=parse_cache)
+    package = None
+    if args.zip and file_count:
+        from zip_package import package_directory
+        output_dir = args.output or os.path.join(os.path.dirname(args.input), "split_files")
+        package = package_directory(output_dir, args.zip, level=args.zip_level, jobs=args.zip_jobs,
+                                    volume_size=args.zip_volume_size, log=log, tracer=tracer)
+    return {"input_files": 1, "output_files": file_count, "rows": rows[0], "memory": memory or None,
+            "parse_cache": parse_cache.stats() if parse_cache is not None else None, "zip": package}
+
+
+def run_merge(args, log, tracer):
+    """合并：返回摘要字段"""
+    from merge_excel import collect_excel_files, merge_excel_files, output_format_of
+
+    excel_files = [f for f in collect_excel_files(args.paths) if os.path.isfile(f)]
+    if not excel_files:
+        raise NoInputError("没有找到 Excel 文件")
+    if args.dry_run:
+        from job_planner import plan_merge
+        plan = plan_merge(excel_files, args.output, output_format=args.format, chunk_rows=args.chunk_rows,
+                          columns=parse_column_list(args.columns), where=args.where,
+                          memory_budget=args.memory_budget, jobs=sorted({1, args.jobs}) if args.jobs > 1 else None)
+        log(plan.describe())
+        return {"input_files": len(excel_files), "dry_run": True, "plan": plan.to_dict()}
+
+    dtypes = column_widths = None
+    if args.column_profile:
+        from profile_excel import load_profile_report
+        dtypes, column_widths = load_profile_report(args.column_profile)
+
+    rows = [0]
+    memory = {}
+    pipeline = {}
+    upsert = {}
+    parse_cache = open_parse_cache(args)
+
+    def progress(done, total, rows_done):
+        rows[0] = rows_done
+
+    merged_df = merge_excel_files(
+        excel_files, args.output, log=log, progress=progress, dtypes=dtypes, column_widths=column_widths,
+        reader_engine=args.reader_engine, writer_engine=args.writer_engine,
+        output_format=args.format, chunk_rows=args.chunk_rows, jobs=args.jobs, tracer=tracer,
+        engine=args.engine, memory_budget=args.memory_budget, memory_report=memory.update,
+        pipeline=args.pipeline, prefetch=args.prefetch, pipeline_report=pipeline.update,
+        duplicates=args.duplicates, columns=parse_column_list(args.columns), where=args.where,
+        staging=args.staging, sort_by=parse_column_list(args.sort_by), descending=args.descending,
+        dedup_rows=dedup_rows_option(args.dedup_rows), parse_cache=parse_cache,
+        summaries=args.summaries, key_columns=parse_column_list(args.key), keep=args.keep,
+        timestamp_column=args.timestamp, upsert_report=upsert.update,
+    )
+    return {
+        "input_files": len(excel_files),
+        "rows": rows[0],
+        "columns": len(merged_df.columns) if merged_df is not None else None,
+        "output": os.path.abspath(args.output),
+        "output_format": args.format or output_format_of(args.output),
+        "memory": memory or None,
+        "pipeline": pipeline or None,
+        "parse_cache": parse_cache.stats() if parse_cache is not None else None,
+        "upsert": upsert or None,
+    }
+
+
+def run_export(args, log, tracer):
+    """从暂存文件导出：返回摘要字段"""
+    from merge_excel import output_format_of, write_summary as write_group_summary
+    from merge_summary import MergeSummary
+    from sqlite_staging import export_staging
+
+    if not os.path.isfile(args.staging):
+        raise NoInputError(f"暂存文件不存在: {args.staging}")
+    summary = MergeSummary(args.summaries) if args.summaries else None
+    rows, columns, output_files = export_staging(
+        args.staging, args.output, log=log, output_format=args.format, chunk_rows=args.chunk_rows,
+        sort_by=parse_column_list(args.sort_by), descending=args.descending,
+        dedup_rows=dedup_rows_option(args.dedup_rows), tracer=tracer, summary=summary)
+    write_group_summary(summary, args.output, args.format, log=log, tracer=tracer)
+    return {
+        "input_files": 1,
+        "output_files": len(output_files),
+        "rows": rows,
+        "columns": len(columns),
+        "output": os.path.abspath(args.output),
+        "output_format": args.format or output_format_of(args.output),
+    }
+
+
+def run_watch(args, log, tracer):
+    """监视文件夹持续合并，按 Ctrl+C 停止：返回摘要字段"""
+    from watch_merge import FolderMerger
+
+    if not os.path.isdir(args.directory):
+        raise NoInputError(f"文件夹不存在: {args.directory}")
+    merger = FolderMerger(
+        args.directory, args.output, staging_file=args.staging, log=log, settle=args.settle,
+        debounce=args.debounce, max_delay=args.max_delay, polling=args.polling, poll_interval=args.interval,
+        output_format=args.format, chunk_rows=args.chunk_rows, columns=parse_column_list(args.columns),
+        where=args.where, sort_by=parse_column_list(args.sort_by), descending=args.descending,
+        dedup_rows=dedup_rows_option(args.dedup_rows), summaries=args.summaries, status_file=args.status,
+        tracer=tracer)
+    try:
+        merger.run()
+    except KeyboardInterrupt:
+        log("已停止监视")
+    status = merger.status()
+    return {
+        "input_files": status["staged_files"],
+        "rows": status["rows"],
+        "output": os.path.abspath(args.output),
+        "staging": merger.staging_file,
+        "exports": status["exports"],
+        "latency": status["latency"],
+    }
+
+
+def run_inspect(args, log, tracer):
+    """检查结构：返回摘要字段；有文件检查失败时摘要中 failed 大于0"""
+    from check_excel_structure import find_excel_files, inspect_files, write_report
+
+    files = [f for f in find_excel_files(args.paths) if os.path.isfile(f)]
+    if not files:
+        raise NoInputError("没有找到 Excel 文件")
+
+    with tracer.span("inspect.files"):
+        reports = inspect_files(files, jobs=args.jobs)
+    failed = sum(1 for report in reports if report["error"])
+    if args.output:
+        write_report(reports, args.output)
+        log(f"报告: {args.output}")
+    for report in reports:
+        status = f"出错: {report['error']}" if report["error"] else \
+            f"{report['max_row']} 行, {report['max_column']} 列, A列为空 {report['empty_a_rows']} 行"
+        log(f"{os.path.basename(report['file'])}: {status}")
+    return {
+        "input_files": len(files),
+        "failed": failed,
+        "rows": sum(report.get("max_row") or 0 for report in reports),
+    }
+
+
+COMMANDS = {
+    "split": run_split,
+    "merge": run_merge,
+    "export": run_export,
+    "watch": run_watch,
+    "inspect": run_inspect,
+}
+
+
+def add_common_options(parser, default=None):
+    """--summary / --profile / --trace / --quiet 写在子命令前后都可以"""
+    parser.add_argument("--summary", metavar="FILE", default=default,
+                        help="写出 JSON 摘要（行数、文件数、用时、峰值内存）；为 - 时打印到标准输出")
+    parser.add_argument("--profile", metavar="FILE", default=default,
+                        help="用 cProfile 分析运行耗时，结果写入该文件")
+    parser.add_argument("--trace", metavar="FILE", default=default,
+                        help="记录各阶段耗时，写出 Chrome trace-event JSON")
+    parser.add_argument("-q", "--quiet", action="store_true", default=default or False,
+                        help="不输出处理日志")
+
+
+def memory_size(text):
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_memory_options(parser):
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只估算输出文件数、输出大小、峰值内存和各处理方式的用时，不写出文件（见 job_planner.py）")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_AUTO,
+                        help="memory: 整个读入内存；streaming: 逐行处理，内存固定；auto（默认）: 按内存预算选择")
+    parser.add_argument("--memory-budget", type=memory_size, metavar="SIZE",
+                        help="内存预算，如 512MB、2G；默认取环境变量 EXCEL_TOOL_MEMORY_BUDGET 或容器内存上限的 80%%")
+
+
+def add_cache_options(parser):
+    parser.add_argument("--parse-cache", nargs="?", const=True, metavar="DIR",
+                        help="缓存解析结果（见 parse_cache.py），内容相同的文件再次处理时不再解析；"
+                             "可指定缓存目录，默认为用户缓存目录")
+    parser.add_argument("--parse-cache-size", type=memory_size, metavar="SIZE",
+                        help="解析结果缓存的大小上限，如 500MB；默认取环境变量 EXCEL_TOOL_PARSE_CACHE_SIZE 或 2GB")
+
+
+def open_parse_cache(args):
+    """按 --parse-cache 选项创建 ParseCache，未指定时返回 None"""
+    if not args.parse_cache:
+        return None
+    from parse_cache import ParseCache
+    directory = args.parse_cache if isinstance(args.parse_cache, str) else None
+    return ParseCache(directory, max_bytes=args.parse_cache_size)
+
+
+def add_zip_options(parser):
+    from zip_package import LEVELS
+    parser.add_argument("--zip", metavar="FILE", help="拆分后把输出目录打包成 ZIP（多线程压缩）")
+    parser.add_argument("--zip-level", choices=LEVELS, default="auto",
+                        help="压缩级别：store 不压缩；1~9 deflate；auto 对 xlsx 等已压缩文件不压缩（默认）")
+    parser.add_argument("--zip-volume-size", type=memory_size, metavar="SIZE",
+                        help="每个压缩包的大小上限，如 1GB；超过时分成多个独立的压缩包")
+    parser.add_argument("--zip-jobs", type=int, metavar="N", help="压缩线程数，默认 CPU 核数")
+
+
+def add_filter_options(parser):
+    parser.add_argument("--columns", metavar="NAMES",
+                        help="只保留这些列，用逗号分隔，如 \"编号,姓名,金额\"")
+    parser.add_argument("--where", metavar="EXPR",
+                        help="只处理满足条件的行，如 '状态 == \"已完成\" and 金额 >= 1000'（见 row_filter.py）")
+
+
+def dedup_rows_option(value):
+    """--dedup-rows 不带列名时按所有列去重"""
+    if value is True or value is None:
+        return value
+    return parse_column_list(value)
+
+
+def add_order_options(parser):
+    parser.add_argument("--sort-by", metavar="NAMES", help="按这些列排序，用逗号分隔")
+    parser.add_argument("--descending", action="store_true", help="从大到小排序")
+    parser.add_argument("--dedup-rows", nargs="?", const=True, metavar="NAMES",
+                        help="去掉重复行，只保留第一行；可指定判断重复的列（逗号分隔），默认除源文件外的所有列")
+
+
+def add_group_options(parser):
+    parser.add_argument("--group-by", metavar="NAMES",
+                        help="合并时按这些列分组汇总（逗号分隔），结果写到“输出名_汇总”文件")
+    parser.add_argument("--agg", action="append", metavar="COLUMN:FUNCS",
+                        help="分组汇总的统计，如 金额:sum,mean；可多次指定。统计方式: sum count mean min max")
+    parser.add_argument("--group-config", metavar="FILE",
+                        help="分组汇总定义（JSON，可包含多个汇总，见 merge_summary.py）")
+
+
+def summaries_option(args):
+    """按 --group-config 或 --group-by / --agg 得到汇总定义，都未指定时返回 None"""
+    from merge_summary import load_summaries, parse_summary_spec
+    if args.group_config:
+        return load_summaries(args.group_config)
+    if args.group_by:
+        return parse_summary_spec(args.group_by, args.agg)
+    if args.agg:
+        raise ValueError("--agg 需要与 --group-by 一起使用")
+    return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="excel-tool", description="Excel文件拆分、合并与结构检查")
+    add_common_options(parser)
+    # 子命令中的同名选项不设默认值，避免覆盖写在子命令前面的选项
+    common = argparse.ArgumentParser(add_help=False)
+    add_common_options(common, default=argparse.SUPPRESS)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = subparsers.add_parser("split", parents=[common], help="按行拆分 Excel 文件，每行一个文件")
+    split_parser.add_argument("input", help="要拆分的 Excel 文件（也可以是 CSV / TSV）")
+    split_parser.add_argument("-o", "--output", help="输出目录，默认为源文件所在目录下的 split_files")
+    split_parser.add_argument("-n", "--rows-per-file", type=int, default=1,
+                              help="每个文件的数据行数（默认1，即每行一个文件）")
+    split_parser.add_argument("--name-template",
+                              help="文件名模板，可用 {first} {last} {index} {count}；分块时默认 {first}-{last}")
+    split_parser.add_argument("--header-style", metavar="FILE",
+                              help="表头样式配置（JSON，见 header_style.py），默认F~K列蓝色、L~M列红色")
+    add_filter_options(split_parser)
+    add_cache_options(split_parser)
+    add_zip_options(split_parser)
+    add_memory_options(split_parser)
+
+    merge_parser = subparsers.add_parser("merge", parents=[common], help="合并多个 Excel 文件")
+    merge_parser.add_argument("paths", nargs="+", help="Excel / CSV / TSV 文件或包含这些文件的文件夹")
+    merge_parser.add_argument("-o", "--output", required=True, help="输出文件（.xlsx 或 .csv）")
+    merge_parser.add_argument("-j", "--jobs", type=int, default=1, help="同时读取文件的进程数（默认1）")
+    merge_parser.add_argument("--reader-engine", choices=["openpyxl", "calamine", "xlrd"],
+                              help="读取引擎，默认由 pandas 按扩展名选择")
+    merge_parser.add_argument("--writer-engine", choices=["openpyxl", "xlsxwriter"], default="openpyxl",
+                              help="xlsx 写入引擎（默认 openpyxl）")
+    merge_parser.add_argument("--format", choices=["xlsx", "csv"], help="输出格式，默认按输出文件扩展名判断")
+    merge_parser.add_argument("--chunk-rows", type=int, help="每个输出文件最多的数据行数，超过时分成多个文件")
+    merge_parser.add_argument("--column-profile", metavar="FILE",
+                              help="profile_excel.py 生成的画像报告，用于统一列类型和列宽")
+    merge_parser.add_argument("--pipeline", action="store_true",
+                              help="流水线合并：预读、解析、写出同时进行，并报告各阶段占用率")
+    merge_parser.add_argument("--prefetch", type=int, default=2,
+                              help="流水线合并时最多提前读入内存的文件数（默认2）")
+    merge_parser.add_argument("--duplicates", choices=DUPLICATE_MODES, default=DUPLICATES_REUSE,
+                              help="内容完全相同的输入文件：reuse 只解析一次（默认）；skip 跳过并警告；keep 不检测")
+    merge_parser.add_argument("--staging", metavar="FILE",
+                              help="通过 SQLite 暂存文件合并并保留该文件，以后可用 export 直接导出；"
+                                   "再次合并时未变化的文件不再读取")
+    merge_parser.add_argument("--key", metavar="NAMES",
+                              help="按这些键列（逗号分隔，如订单号）去重，同一个键只保留一行；不能与 --staging、"
+                                   "--sort-by、--dedup-rows 一起使用")
+    merge_parser.add_argument("--keep", choices=["first", "last", "latest"],
+                              help="同一个键保留哪一行：first 第一次出现的行；last 文件顺序中最后出现的行；"
+                                   "latest --timestamp 列最新的行（指定 --timestamp 时默认 latest，否则默认 last）")
+    merge_parser.add_argument("--timestamp", metavar="NAME", help="--keep latest 时比较的时间列")
+    add_order_options(merge_parser)
+    add_group_options(merge_parser)
+    add_filter_options(merge_parser)
+    add_cache_options(merge_parser)
+    add_memory_options(merge_parser)
+
+    export_parser = subparsers.add_parser("export", parents=[common],
+                                          help="从合并时保留的暂存文件导出，不读取 Excel")
+    export_parser.add_argument("staging", help="merge --staging 保留的暂存文件")
+    export_parser.add_argument("-o", "--output", required=True, help="输出文件（.xlsx 或 .csv）")
+    export_parser.add_argument("--format", choices=["xlsx", "csv"], help="输出格式，默认按输出文件扩展名判断")
+    export_parser.add_argument("--chunk-rows", type=int, help="每个输出文件最多的数据行数，超过时分成多个文件")
+    add_order_options(export_parser)
+    add_group_options(export_parser)
+
+    watch_parser = subparsers.add_parser("watch", parents=[common],
+                                         help="监视文件夹，新文件写完后增量合并（一直运行，按 Ctrl+C 停止）")
+    watch_parser.add_argument("directory", help="监视的文件夹（不包括子文件夹）")
+    watch_parser.add_argument("-o", "--output", required=True, help="合并结果（.xlsx 或 .csv）")
+    watch_parser.add_argument("--format", choices=["xlsx", "csv"], help="输出格式，默认按输出文件扩展名判断")
+    watch_parser.add_argument("--chunk-rows", type=int, help="每个输出文件最多的数据行数，超过时分成多个文件")
+    watch_parser.add_argument("--staging", metavar="FILE",
+                              help="暂存文件，默认为合并结果旁边的“名称.watch.sqlite”；重新启动后未变化的文件不再读取")
+    watch_parser.add_argument("--settle", type=float, default=2.0,
+                              help="文件大小和修改时间连续不变多少秒后认为已写完（默认2）")
+    watch_parser.add_argument("--debounce", type=float, default=5.0,
+                              help="最后一个文件暂存后多少秒更新合并结果（默认5）")
+    watch_parser.add_argument("--max-delay", type=float, default=60.0,
+                              help="持续有文件到达时，最多等待多少秒更新合并结果（默认60）")
+    watch_parser.add_argument("--polling", action="store_true", help="不使用 inotify，定时扫描文件夹（如网络共享文件夹）")
+    watch_parser.add_argument("--interval", type=float, default=2.0, help="扫描文件夹的间隔秒数（默认2）")
+    watch_parser.add_argument("--status", metavar="FILE",
+                              help="每次更新合并结果后写入状态（JSON）：文件数、行数、到达到输出的延迟、内存")
+    add_order_options(watch_parser)
+    add_group_options(watch_parser)
+    add_filter_options(watch_parser)
+
+    inspect_parser = subparsers.add_parser("inspect", parents=[common], help="检查 Excel 文件结构")
+    inspect_parser.add_argument("paths", nargs="+", help="Excel 文件或包含 Excel 文件的文件夹")
+    inspect_parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数（默认CPU核数）")
+    inspect_parser.add_argument("-o", "--output", help="报告文件（.json 或 .csv）")
+    return parser
+
+
+def write_summary(summary, target):
+    text = json.dumps(summary, ensure_ascii=False, indent=2, default=str)
+    if target == "-":
+        print(text)
+    else:
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "jobs", None) is not None and args.jobs < 1:
+        parser.error("--jobs 必须大于0")
+    if getattr(args, "rows_per_file", 1) < 1:
+        parser.error("--rows-per-file 必须大于0")
+    if getattr(args, "prefetch", 1) < 1:
+        parser.error("--prefetch 必须大于0")
+    if getattr(args, "zip_jobs", None) is not None and args.zip_jobs < 1:
+        parser.error("--zip-jobs 必须大于0")
+    if getattr(args, "chunk_rows", None) is not None and args.chunk_rows < 1:
+        parser.error("--chunk-rows 必须大于0")
+    if args.command == "watch" and (args.interval <= 0 or min(args.settle, args.debounce, args.max_delay) < 0):
+        parser.error("--interval 必须大于0，--settle、--debounce、--max-delay 不能小于0")
+    if args.command == "merge":
+        if args.keep is None:
+            args.keep = "latest" if args.timestamp else "last"
+        if (args.keep != "last" or args.timestamp) and not args.key:
+            parser.error("--keep、--timestamp 需要与 --key 一起使用")
+        if args.key and (args.staging or args.sort_by or args.dedup_rows):
+            parser.error("--key 不能与 --staging、--sort-by、--dedup-rows 一起使用")
+        if args.keep == "latest" and not args.timestamp:
+            parser.error("--keep latest 需要指定 --timestamp")
+    if hasattr(args, "group_by"):
+        try:
+            args.summaries = summaries_option(args)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+    if hasattr(args, "memory_budget") and args.memory_budget is None:
+        args.memory_budget = default_memory_budget()
+
+    # 摘要打印到标准输出时，日志改到标准错误，方便管道处理
+    stream = sys.stderr if args.summary == "-" else sys.stdout
+    if args.quiet:
+        log = lambda message: None
+    else:
+        log = lambda message: print(message, file=stream, flush=True)
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    # 只有需要输出时才计时
+    tracer = Tracer() if args.trace or args.summary else NULL_TRACER
+
+    summary = {"command": args.command, "status": "ok", "error": None}
+    exit_code = EXIT_OK
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            summary.update(COMMANDS[args.command](args, log, tracer))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        if summary.get("failed"):
+            summary["status"] = "partial"
+            exit_code = EXIT_PARTIAL
+    except NoInputError as e:
+        summary.update(status="no_input", error=str(e))
+        exit_code = EXIT_NO_INPUT
+    except KeyboardInterrupt:
+        summary.update(status="interrupted", error="已中断")
+        exit_code = EXIT_INTERRUPTED
+    except Exception as e:
+        summary.update(status="error", error=str(e))
+        exit_code = EXIT_ERROR
+
+    seconds = time.perf_counter() - start
+    summary["seconds"] = round(seconds, 4)
+    rows = summary.get("rows")
+    summary["rows_per_second"] = round(rows / seconds, 1) if rows and seconds > 0 else None
+    summary["peak_rss_bytes"] = peak_rss_bytes()
+    summary["peak_child_rss_bytes"] = peak_child_rss_bytes()
+    summary["exit_code"] = exit_code
+    if tracer.enabled:
+        summary["stages"] = tracer.summary()
+        summary["counters"] = dict(tracer.counters)
+
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+        log("\n各阶段耗时:\n" + tracer.format_summary())
+        log(f"Trace: {args.trace}（可用 chrome://tracing 或 https://ui.perfetto.dev 打开）")
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        log(f"性能分析结果: {args.profile}（可用 python -m pstats 查看）")
+    if summary["error"] and (exit_code != EXIT_ERROR or args.quiet):
+        print(f"错误: {summary['error']}", file=sys.stderr)
+    if args.summary:
+        write_summary(summary, args.summary)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
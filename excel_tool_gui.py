@@ -1,19 +1,38 @@
+import time
+
+# 启动计时起点，用于统计导入耗时和首次显示窗口的耗时
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-import pandas as pd
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill
-import shutil
+import sys
+import glob
+import json
+import queue
 import threading
-from PIL import Image, ImageTk
+
+# pandas / openpyxl / PIL 在需要时才导入，让窗口尽快显示
+from app_paths import user_cache_dir
+from job_queue import Job, JobQueue, STATUS_LABELS, DONE, CANCELLED, FAILED, QUEUED
+
+
+# 日志队列轮询间隔（毫秒）和每次最多处理的记录数
+LOG_POLL_INTERVAL_MS = 50
+LOG_BATCH_SIZE = 2000
+# 状态区域最多保留的日志行数
+MAX_LOG_LINES = 5000
+# 任务列表刷新间隔（毫秒）
+JOB_REFRESH_INTERVAL_MS = 500
+# 最多同时运行的任务数
+MAX_CONCURRENT_JOBS = 4
 
 
 class ExcelToolGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Excel文件拆分与合并工具")
-        self.root.geometry("850x750")
+        self.root.geometry("850x950")
         
         # iOS风格颜色主题
         self.colors = {
@@ -68,7 +87,18 @@ class ExcelToolGUI:
         self.output_path = tk.StringVar()
         self.execute_btn = None
         
+        # 后台线程只向队列写入日志和进度记录，由主线程批量刷新界面
+        self.log_queue = queue.Queue()
+        
+        # 任务队列，任务依次（或按并发数同时）在后台线程中运行
+        self.concurrency = tk.IntVar(value=1)
+        self.job_queue = JobQueue(workers=1, on_change=self.on_job_change)
+        self.finished_since_summary = []
+        
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(LOG_POLL_INTERVAL_MS, self.poll_log_queue)
+        self.root.after(JOB_REFRESH_INTERVAL_MS, self.refresh_job_list)
         
     def create_widgets(self):
         # 主容器 - iOS风格的大间距
@@ -242,7 +272,7 @@ class ExcelToolGUI:
         button_frame = tk.Frame(main_container, bg=self.colors['bg'])
         button_frame.pack(pady=(10, 20), fill="x")
         
-        self.execute_btn = self.create_ios_button(button_frame, "开始执行", 
+        self.execute_btn = self.create_ios_button(button_frame, "加入任务队列", 
                                                   self.execute_task,
                                                   bg=self.colors['success'],
                                                   hover_bg=self.colors['success_hover'],
@@ -250,6 +280,56 @@ class ExcelToolGUI:
                                                   padx=0, pady=16,
                                                   full_width=True)
         
+        # 任务队列区域
+        jobs_frame = self.create_ios_card(main_container)
+        jobs_frame.pack(pady=(0, 15), fill="x")
+        
+        jobs_title = tk.Label(jobs_frame, text="任务队列", 
+                             font=self.fonts['body_small'],
+                             bg=self.colors['card_bg'], 
+                             fg=self.colors['text_secondary'],
+                             anchor="w")
+        jobs_title.pack(fill="x", padx=20, pady=(20, 10))
+        
+        separator_jobs = tk.Frame(jobs_frame, bg=self.colors['separator'], height=1)
+        separator_jobs.pack(fill="x", padx=20)
+        
+        columns = ("name", "status", "progress", "elapsed", "rows", "rate")
+        self.job_tree = ttk.Treeview(jobs_frame, columns=columns, show="headings",
+                                     height=5, selectmode="browse")
+        for column, heading, width in (("name", "任务", 260), ("status", "状态", 70),
+                                       ("progress", "进度", 90), ("elapsed", "用时", 70),
+                                       ("rows", "行数", 80), ("rate", "行/秒", 80)):
+            self.job_tree.heading(column, text=heading)
+            self.job_tree.column(column, width=width, anchor="w" if column == "name" else "center")
+        self.job_tree.pack(fill="x", padx=20, pady=(15, 10))
+        
+        jobs_control = tk.Frame(jobs_frame, bg=self.colors['card_bg'])
+        jobs_control.pack(fill="x", padx=20, pady=(0, 15))
+        
+        for text, command in (("暂停", self.pause_selected_job),
+                              ("继续", self.resume_selected_job),
+                              ("取消", self.cancel_selected_job),
+                              ("清除已结束", self.clear_finished_jobs)):
+            btn = self.create_ios_button(jobs_control, text, command,
+                                         bg=self.colors['primary'],
+                                         hover_bg=self.colors['primary_hover'],
+                                         font=self.fonts['body_small'],
+                                         padx=14, pady=6)
+            btn.pack(side="left", padx=(0, 8))
+        
+        concurrency_spin = tk.Spinbox(jobs_control, from_=1, to=MAX_CONCURRENT_JOBS, width=3,
+                                      textvariable=self.concurrency,
+                                      command=self.on_concurrency_change,
+                                      font=self.fonts['body_small'],
+                                      state="readonly")
+        concurrency_spin.pack(side="right")
+        concurrency_label = tk.Label(jobs_control, text="同时运行", 
+                                     font=self.fonts['body_small'],
+                                     bg=self.colors['card_bg'], 
+                                     fg=self.colors['text_secondary'])
+        concurrency_label.pack(side="right", padx=(0, 6))
+        
         # iOS风格状态显示区域
         status_frame = self.create_ios_card(main_container)
         status_frame.pack(pady=(0, 15), fill="both", expand=True)
@@ -292,6 +372,22 @@ class ExcelToolGUI:
         self.status_text.pack(side="left", fill="both", expand=True)
         scrollbar.config(command=self.status_text.yview)
         
+        # 进度条和处理速度
+        progress_frame = tk.Frame(status_frame, bg=self.colors['card_bg'])
+        progress_frame.pack(fill="x", padx=20, pady=(0, 15))
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, orient="horizontal",
+                                            mode="determinate", maximum=100)
+        self.progress_bar.pack(fill="x")
+        
+        self.progress_text = tk.StringVar(value="")
+        progress_label = tk.Label(progress_frame, textvariable=self.progress_text,
+                                  font=self.fonts['body_small'],
+                                  bg=self.colors['card_bg'],
+                                  fg=self.colors['text_secondary'],
+                                  anchor="w")
+        progress_label.pack(fill="x", pady=(6, 0))
+        
         # 配置文本标签颜色（在第一次使用前）
         self.status_text.tag_config("error", foreground="#FF3B30")
         self.status_text.tag_config("success", foreground="#34C759")
@@ -324,7 +420,18 @@ class ExcelToolGUI:
                 break
         
         if image_path:
+            # 缩放后的图片缓存在本地，以源文件修改时间和目标尺寸为键
+            cache_path = self.header_cache_path(image_path, target_width, target_height)
+            if cache_path and os.path.exists(cache_path):
+                try:
+                    self.header_bg_image = tk.PhotoImage(file=cache_path)
+                    return True
+                except tk.TclError:
+                    pass
+            
             try:
+                from PIL import Image, ImageTk
+                
                 # 打开原始图片
                 original_img = Image.open(image_path)
                 orig_width, orig_height = original_img.size
@@ -365,6 +472,12 @@ class ExcelToolGUI:
                 # 将缩放后的图片粘贴到画布右侧
                 canvas_img.paste(img, (paste_x, paste_y))
                 
+                if cache_path:
+                    try:
+                        canvas_img.save(cache_path, "PNG")
+                    except OSError:
+                        pass
+                
                 self.header_bg_image = ImageTk.PhotoImage(canvas_img)
                 return True
             except Exception as e:
@@ -372,14 +485,45 @@ class ExcelToolGUI:
                 self.header_bg_image = None
                 return False
         else:
-            # 如果没有找到图片，创建一个默认背景
-            try:
-                img = Image.new('RGB', (target_width, target_height), color='#ffffff')
-                self.header_bg_image = ImageTk.PhotoImage(img)
-                return False  # 返回False表示使用默认背景
-            except:
-                self.header_bg_image = None
-                return False
+            # 没有找到图片时使用卡片的白色背景
+            self.header_bg_image = None
+            return False
+        
+    def header_cache_path(self, image_path, target_width, target_height):
+        """缩放后背景图片的缓存路径，并删除同一图片的旧缓存；无法创建缓存目录时返回 None"""
+        try:
+            cache_dir = user_cache_dir("header")
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        prefix = f"{stem}_"
+        cache_path = os.path.join(cache_dir, f"{prefix}{stat.st_mtime_ns}_{target_width}x{target_height}.png")
+        for old_path in glob.glob(os.path.join(cache_dir, f"{prefix}*.png")):
+            if old_path != cache_path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return cache_path
+        
+    def record_startup_time(self, import_seconds, report_path=None, exit_after=False):
+        """窗口首次显示后记录启动耗时，可写入 JSON 报告"""
+        self.root.update_idletasks()
+        first_window_seconds = time.perf_counter() - STARTUP_T0
+        self.log_message(f"启动耗时: {first_window_seconds:.2f} 秒（导入 {import_seconds:.2f} 秒）")
+        if report_path:
+            report = {
+                "import_seconds": round(import_seconds, 4),
+                "first_window_seconds": round(first_window_seconds, 4),
+                "frozen": bool(getattr(sys, "frozen", False)),
+                "python": sys.version.split()[0],
+                "pandas_loaded": "pandas" in sys.modules,
+            }
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if exit_after:
+            self.root.destroy()
         
     def create_ios_card(self, parent):
         """创建iOS风格的卡片"""
@@ -442,7 +586,7 @@ class ExcelToolGUI:
         if mode == "split":
             filename = filedialog.askopenfilename(
                 title="选择要拆分的Excel文件",
-                filetypes=[("Excel files", "*.xlsx *.xls"), ("All files", "*.*")]
+                filetypes=[("Excel files", "*.xlsx *.xls"), ("CSV files", "*.csv *.tsv"), ("All files", "*.*")]
             )
             if filename:
                 self.source_path.set(filename)
@@ -472,24 +616,174 @@ class ExcelToolGUI:
                 self.log_message(f"已选择输出文件: {filename}")
                 
     def log_message(self, message):
-        """在状态区域显示消息"""
-        self.status_text.config(state="normal")
-        # 根据消息类型设置不同的颜色
-        tag = "normal"
+        """记录一条状态消息（可在任意线程调用）"""
+        self.log_queue.put(("log", message))
+        
+    def report_progress(self, job):
+        """记录任务进度（可在任意线程调用）"""
+        self.log_queue.put(("progress", job))
+        
+    def on_job_change(self, job):
+        """任务状态变化（在工作线程中调用）"""
+        self.log_queue.put(("job", job))
+        
+    def poll_log_queue(self):
+        """在主线程中批量处理队列中的日志和进度记录"""
+        insert_args = []
+        last_progress = None
+        changed_jobs = []
+        plans = []
+        try:
+            for _ in range(LOG_BATCH_SIZE):
+                record = self.log_queue.get_nowait()
+                kind = record[0]
+                if kind == "log":
+                    insert_args.extend((record[1] + "\n", self.message_tag(record[1])))
+                elif kind == "progress":
+                    last_progress = record[1]
+                elif kind == "job":
+                    changed_jobs.append(record[1])
+                elif kind == "plan":
+                    plans.append(record[1:])
+        except queue.Empty:
+            pass
+        
+        for job in changed_jobs:
+            message = self.job_finish_message(job)
+            if message:
+                insert_args.extend((message + "\n", self.message_tag(message)))
+        
+        if insert_args:
+            # 多条日志合并为一次插入
+            self.status_text.config(state="normal")
+            self.status_text.insert(tk.END, *insert_args)
+            line_count = int(self.status_text.index("end-1c").split(".")[0])
+            if line_count > MAX_LOG_LINES:
+                self.status_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+            self.status_text.see(tk.END)
+            self.status_text.config(state="disabled")
+        
+        if last_progress is not None:
+            self.update_progress(last_progress)
+        
+        if changed_jobs:
+            self.refresh_job_list(reschedule=False)
+            self.show_batch_summary()
+        
+        for task, plan in plans:
+            self.confirm_task(task, plan)
+        
+        self.root.after(LOG_POLL_INTERVAL_MS, self.poll_log_queue)
+        
+    def message_tag(self, message):
+        """根据消息类型选择显示颜色"""
         if "错误" in message or "失败" in message:
-            tag = "error"
+            return "error"
         elif "完成" in message or "成功" in message:
-            tag = "success"
-        elif "警告" in message:
-            tag = "warning"
+            return "success"
+        elif "警告" in message or "取消" in message:
+            return "warning"
+        return "normal"
+        
+    def job_finish_message(self, job):
+        """任务结束时的日志消息，未结束返回 None"""
+        if not job.finished or job in self.finished_since_summary:
+            return None
+        self.finished_since_summary.append(job)
+        if job.status == DONE:
+            return f"[#{job.id}] {job.name} 完成，用时 {job.elapsed:.1f} 秒"
+        elif job.status == CANCELLED:
+            return f"[#{job.id}] {job.name} 已取消"
+        return f"[#{job.id}] {job.name} 执行过程中出错: {str(job.error)}"
+        
+    def show_batch_summary(self):
+        """队列中的任务全部结束后弹出一次汇总"""
+        if not self.finished_since_summary or not self.job_queue.is_idle():
+            return
+        jobs = self.finished_since_summary
+        self.finished_since_summary = []
+        done = sum(1 for job in jobs if job.status == DONE)
+        failed = sum(1 for job in jobs if job.status == FAILED)
+        cancelled = sum(1 for job in jobs if job.status == CANCELLED)
+        message = f"共 {len(jobs)} 个任务：完成 {done} 个，失败 {failed} 个，取消 {cancelled} 个"
+        if failed:
+            messagebox.showerror("错误", message)
+        else:
+            messagebox.showinfo("完成", message)
         
-        self.status_text.insert(tk.END, message + "\n", tag)
-        self.status_text.see(tk.END)
-        self.status_text.config(state="disabled")
-        self.root.update()
+    def update_progress(self, job):
+        """刷新进度条和处理速度"""
+        self.progress_bar["value"] = job.done * 100 / job.total if job.total else 0
+        if not job.total:
+            self.progress_text.set("")
+            return
+        self.progress_text.set(f"[#{job.id}] {job.done}/{job.total} · 已处理 {job.rows} 行 · "
+                               f"{job.rows_per_second:.0f} 行/秒")
+        
+    def refresh_job_list(self, reschedule=True):
+        """刷新任务列表中的状态、用时和速度"""
+        existing = set(self.job_tree.get_children())
+        for job in self.job_queue.list_jobs():
+            progress = f"{job.done * 100 / job.total:.0f}%" if job.total else ""
+            values = (job.name, STATUS_LABELS[job.status], progress,
+                      f"{job.elapsed:.0f} 秒" if job.start_time else "",
+                      job.rows, f"{job.rows_per_second:.0f}" if job.start_time else "")
+            iid = str(job.id)
+            if iid in existing:
+                self.job_tree.item(iid, values=values)
+            else:
+                self.job_tree.insert("", tk.END, iid=iid, values=values)
+        if reschedule:
+            self.root.after(JOB_REFRESH_INTERVAL_MS, self.refresh_job_list)
+        
+    def selected_job(self):
+        """任务列表中选中的任务"""
+        selection = self.job_tree.selection()
+        if not selection:
+            messagebox.showwarning("警告", "请先在任务列表中选择一个任务")
+            return None
+        for job in self.job_queue.list_jobs():
+            if str(job.id) == selection[0]:
+                return job
+        return None
+        
+    def pause_selected_job(self):
+        job = self.selected_job()
+        if job is not None and not job.finished:
+            job.pause()
+            self.log_message(f"[#{job.id}] 暂停请求已发送")
+        
+    def resume_selected_job(self):
+        job = self.selected_job()
+        if job is not None and not job.finished:
+            job.resume()
+            self.log_message(f"[#{job.id}] 已继续")
+        
+    def cancel_selected_job(self):
+        job = self.selected_job()
+        if job is not None and not job.finished:
+            self.job_queue.cancel(job)
+            self.log_message(f"[#{job.id}] 取消请求已发送")
+        
+    def clear_finished_jobs(self):
+        """从列表中移除已结束的任务"""
+        for job in self.job_queue.list_jobs():
+            if self.job_queue.remove(job) and self.job_tree.exists(str(job.id)):
+                self.job_tree.delete(str(job.id))
+        
+    def on_concurrency_change(self):
+        self.job_queue.set_workers(self.concurrency.get())
+        
+    def on_close(self):
+        """关闭窗口前确认是否取消未完成的任务"""
+        if not self.job_queue.is_idle():
+            if not messagebox.askyesno("确认", "还有未完成的任务，确定要取消并退出吗？"):
+                return
+            self.job_queue.cancel_all()
+        self.root.destroy()
         
     def execute_task(self):
-        """执行拆分或合并任务"""
+        """把拆分或合并任务加入任务队列"""
         source = self.source_path.get()
         output = self.output_path.get()
         mode = self.mode.get()
@@ -498,212 +792,105 @@ class ExcelToolGUI:
         if not source:
             messagebox.showerror("错误", "请选择源文件/文件夹！")
             return
-            
+        
         if not output:
             messagebox.showerror("错误", "请选择输出路径！")
             return
-            
+        
         if mode == "split" and not os.path.isfile(source):
             messagebox.showerror("错误", "源文件不存在！")
             return
-            
+        
         if mode == "merge" and not os.path.isdir(source):
             messagebox.showerror("错误", "源文件夹不存在！")
             return
         
-        # 在新线程中执行任务，避免界面卡顿
-        thread = threading.Thread(target=self.run_task, args=(mode, source, output))
-        thread.daemon = True
-        thread.start()
+        # 开始前先估算输出和用时，确认后再加入队列；估算要抽样读取文件并导入 pandas，在后台线程中进行
+        self.log_message(f"正在估算任务: {os.path.basename(source)}")
+        threading.Thread(target=self.plan_task_async, args=((mode, source, output),), daemon=True).start()
         
-    def run_task(self, mode, source, output):
-        """在后台线程中运行任务"""
-        try:
-            if mode == "split":
-                self.log_message("=" * 50)
-                self.log_message("开始拆分Excel文件...")
-                self.split_excel_by_rows(source, output)
-                self.log_message("拆分完成！")
-                messagebox.showinfo("成功", "文件拆分完成！")
-            else:
-                self.log_message("=" * 50)
-                self.log_message("开始合并Excel文件...")
-                self.merge_excel_files(source, output)
-                self.log_message("合并完成！")
-                messagebox.showinfo("成功", "文件合并完成！")
-        except Exception as e:
-            error_msg = f"执行过程中出错: {str(e)}"
-            self.log_message(error_msg)
-            messagebox.showerror("错误", error_msg)
-            
-    def split_excel_by_rows(self, input_file, output_dir):
-        """按照表头分割Excel文件，每一行对应一个文件"""
-        try:
-            # 使用openpyxl读取原始文件
-            self.log_message(f"正在读取文件: {input_file}")
-            source_wb = load_workbook(input_file)
-            source_ws = source_wb.active
-            
-            self.log_message(f"Excel文件结构: 最大行数={source_ws.max_row}, 最大列数={source_ws.max_column}")
-            
-            # 创建输出目录
-            if os.path.exists(output_dir):
-                try:
-                    shutil.rmtree(output_dir)
-                    self.log_message("已清理旧的输出文件夹")
-                except PermissionError:
-                    self.log_message("警告: 无法删除旧文件，将覆盖现有文件")
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # 定义颜色填充
-            blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
-            red_fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")
-            
-            # 遍历每一行数据（从第2行开始，因为第1行是表头）
-            file_count = 0
-            for row_num in range(2, source_ws.max_row + 1):
-                # 检查该行是否有数据（检查A列是否有内容）
-                if source_ws.cell(row=row_num, column=1).value is None:
-                    continue
-                
-                # 创建新的工作簿
-                wb = Workbook()
-                ws = wb.active
-                
-                # 复制表头第1行
-                for col in range(1, source_ws.max_column + 1):
-                    source_cell = source_ws.cell(row=1, column=col)
-                    target_cell = ws.cell(row=1, column=col)
-                    target_cell.value = source_cell.value
-                    
-                    # 应用颜色填充
-                    if 6 <= col <= 11:  # F1~K1 (列6-11)
-                        target_cell.fill = blue_fill
-                    elif 12 <= col <= 13:  # L1~M1 (列12-13)
-                        target_cell.fill = red_fill
-                
-                # 复制数据行（第2行）
-                for col in range(1, source_ws.max_column + 1):
-                    source_cell = source_ws.cell(row=row_num, column=col)
-                    target_cell = ws.cell(row=2, column=col)
-                    target_cell.value = source_cell.value
-                
-                # 自动调整列宽
-                for col in range(1, source_ws.max_column + 1):
-                    column_letter = ws.cell(row=1, column=col).column_letter
-                    max_length = 0
-                    
-                    # 检查表头和数据行的内容长度
-                    for row in range(1, 3):
-                        cell_value = ws.cell(row=row, column=col).value
-                        if cell_value:
-                            # 计算字符长度，中文字符按2个字符计算
-                            length = 0
-                            for char in str(cell_value):
-                                if ord(char) > 127:
-                                    length += 2
-                                else:
-                                    length += 1
-                            max_length = max(max_length, length)
-                    
-                    # 设置列宽，最小宽度为8，最大宽度为50
-                    adjusted_width = min(max(max_length + 2, 8), 50)
-                    ws.column_dimensions[column_letter].width = adjusted_width
-                
-                # 获取该文件A2单元格的内容作为文件名
-                filename_base = str(ws.cell(row=2, column=1).value) if ws.cell(row=2, column=1).value else f"file_{file_count + 1}"
-                
-                # 清理文件名中的非法字符
-                filename_base = "".join(c for c in filename_base if c.isalnum() or c in (' ', '-', '_', '(', ')', '（', '）', '，', '。')).strip()
-                if not filename_base:
-                    filename_base = f"file_{file_count + 1}"
-                
-                # 生成文件名
-                filename = f"{filename_base}.xlsx"
-                output_path = os.path.join(output_dir, filename)
-                
-                # 如果文件名已存在，添加序号
-                counter = 1
-                original_filename = filename
-                while os.path.exists(output_path):
-                    name, ext = os.path.splitext(original_filename)
-                    filename = f"{name}_{counter}{ext}"
-                    output_path = os.path.join(output_dir, filename)
-                    counter += 1
-                
-                # 保存文件
-                wb.save(output_path)
-                file_count += 1
-                if file_count % 10 == 0:  # 每10个文件输出一次进度
-                    self.log_message(f"已创建 {file_count} 个文件...")
-            
-            self.log_message(f"\n分割完成！共创建了 {file_count} 个文件")
-            self.log_message(f"文件保存在: {output_dir}")
-            
-        except Exception as e:
-            self.log_message(f"处理文件时出错: {str(e)}")
-            raise
-            
-    def merge_excel_files(self, data_dir, output_file):
-        """合并指定文件夹下的所有 Excel 文件"""
+    def plan_task_async(self, task):
+        """在后台线程中估算任务，结果通过日志队列交给主线程确认；估算失败不影响运行"""
+        plan = None
         try:
-            # 获取所有 Excel 文件
-            excel_files = []
-            for file in os.listdir(data_dir):
-                if file.endswith('.xlsx') or file.endswith('.xls'):
-                    excel_files.append(os.path.join(data_dir, file))
-            
-            if not excel_files:
-                raise Exception("文件夹下没有找到 Excel 文件")
-            
-            self.log_message(f"找到 {len(excel_files)} 个 Excel 文件")
-            
-            # 存储所有数据框
-            dataframes = []
-            
-            # 读取每个 Excel 文件
-            for idx, file_path in enumerate(excel_files, 1):
-                try:
-                    # 读取 Excel 文件，使用第一行作为列名
-                    df = pd.read_excel(file_path, header=0)
-                    
-                    # 添加源文件名列，用于追踪数据来源
-                    if '源文件' not in df.columns:
-                        df.insert(0, '源文件', os.path.basename(file_path))
-                    
-                    dataframes.append(df)
-                    self.log_message(f"已读取 [{idx}/{len(excel_files)}]: {os.path.basename(file_path)} - {df.shape[0]} 行, {df.shape[1]} 列")
-                    
-                except Exception as e:
-                    self.log_message(f"读取文件失败 {os.path.basename(file_path)}: {str(e)}")
-                    continue
-            
-            if not dataframes:
-                raise Exception("没有成功读取任何文件")
-            
-            # 合并所有数据框
-            self.log_message("\n正在合并数据...")
-            merged_df = pd.concat(dataframes, ignore_index=True, sort=False)
-            
-            # 统计信息
-            self.log_message(f"\n合并统计:")
-            self.log_message(f"总行数: {len(merged_df)}")
-            self.log_message(f"总列数: {len(merged_df.columns)}")
-            self.log_message(f"列名: {list(merged_df.columns)}")
-            
-            # 保存合并后的文件
-            self.log_message(f"\n正在保存到: {output_file}")
-            merged_df.to_excel(output_file, index=False, engine='openpyxl')
-            self.log_message("保存完成！")
-            
+            plan = self.plan_task(*task)
         except Exception as e:
-            self.log_message(f"处理过程中出错: {str(e)}")
-            raise
+            self.log_message(f"无法估算任务: {e}")
+        self.log_queue.put(("plan", task, plan))
+        
+    def confirm_task(self, task, plan):
+        """在主线程中显示估算结果，确认后加入任务队列"""
+        if plan is not None and not messagebox.askyesno("确认", plan.describe() + "\n\n确定开始吗？"):
+            return
+        mode, source, output = task
+        # 任务在后台线程中执行，避免界面卡顿；输出路径相同的任务不会同时运行
+        name = f"{'拆分' if mode == 'split' else '合并'} {os.path.basename(source)}"
+        job = Job(name, lambda job: self.run_task(job, mode, source, output), output_path=output)
+        self.job_queue.submit(job)
+        if job.status == QUEUED:
+            self.log_message(f"[#{job.id}] {name} 已加入队列")
+        
+    def plan_task(self, mode, source, output):
+        """估算任务的输出文件数、大小、峰值内存和用时（见 job_planner.py）"""
+        from job_planner import plan_split, plan_merge
+        if mode == "split":
+            return plan_split(source)
+        from merge_excel import collect_excel_files
+        excel_files = [f for f in collect_excel_files([source]) if os.path.isfile(f)]
+        if not excel_files:
+            return None
+        return plan_merge(excel_files, output)
+        
+    def run_task(self, job, mode, source, output):
+        """在后台线程中运行任务"""
+        # 第一次运行任务时才导入 pandas / openpyxl
+        from split_excel import split_excel_by_rows
+        from merge_excel import merge_excel_files
+        from perf_trace import Tracer
+        
+        def log(message):
+            # 保留消息开头的空行，任务编号加在文字前
+            stripped = message.lstrip("\n")
+            self.log_message(message[:len(message) - len(stripped)] + f"[#{job.id}] {stripped}")
+        
+        def progress(done, total, rows):
+            job.update_progress(done, total, rows)
+            self.report_progress(job)
+        
+        tracer = Tracer()
+        log("=" * 50)
+        if mode == "split":
+            log("开始拆分Excel文件...")
+            log(f"正在读取文件: {source}")
+            split_excel_by_rows(source, output, log=log, progress=progress, checkpoint=job.checkpoint,
+                                tracer=tracer)
+            log("拆分完成！")
+        else:
+            log("开始合并Excel文件...")
+            merge_excel_files(source, output, log=log, progress=progress, checkpoint=job.checkpoint,
+                              tracer=tracer)
+            log("合并完成！")
+        log("各阶段耗时:")
+        for line in tracer.format_summary().splitlines():
+            log("  " + line)
 
 
 def main():
+    import argparse
+    
+    import_seconds = time.perf_counter() - STARTUP_T0
+    
+    parser = argparse.ArgumentParser(description="Excel文件拆分与合并工具")
+    parser.add_argument("--startup-report", metavar="PATH",
+                        help="窗口首次显示后把启动耗时写入 JSON 文件")
+    parser.add_argument("--exit-after-startup", action="store_true",
+                        help="记录启动耗时后立即退出（用于测量启动速度）")
+    args, _ = parser.parse_known_args()
+    report_path = args.startup_report or os.environ.get("EXCEL_TOOL_STARTUP_REPORT")
+    
     root = tk.Tk()
     app = ExcelToolGUI(root)
+    root.after_idle(app.record_startup_time, import_seconds, report_path, args.exit_after_startup)
     root.mainloop()
 
 
@@ -0,0 +1,863 @@
+"""
+Excel工具 HTTP 服务 - 供其他系统通过 HTTP 调用拆分和合并，不需要界面
+
+用法:
+    python excel_tool_server.py --port 8765 --workers 2
+    curl -F file=@工作簿1.xlsx -F rows_per_file=500 http://127.0.0.1:8765/jobs/split
+    curl -F file=@a.xlsx -F file=@b.xlsx -F output=合并.csv http://127.0.0.1:8765/jobs/merge
+    curl http://127.0.0.1:8765/jobs/1
+    curl -OJ http://127.0.0.1:8765/jobs/1/result
+
+接口:
+    POST   /jobs/split          上传一个文件（multipart/form-data），返回 202 和任务状态
+    POST   /jobs/merge          上传多个文件
+    GET    /jobs                所有任务的状态
+    GET    /jobs/<id>           任务状态、进度、用时、每秒行数和最近的日志
+    GET    /jobs/<id>/result    下载结果（分块传输）；拆分结果和带汇总的合并结果打包成 zip
+    DELETE /jobs/<id>           取消运行中的任务；已结束的任务删除其文件
+    GET    /metrics             各接口的请求数、错误数、每秒请求数、延迟分位数和吞吐量
+    GET    /health
+
+选项放在表单字段或查询参数中（表单字段优先）:
+    拆分: rows_per_file、filename_template、columns、where、engine
+    合并: output、format、chunk_rows、columns、where、engine、duplicates、group_by、agg（可以有多个）
+
+上传的文件边接收边写入磁盘，不整个读入内存；任务由 JobQueue 按提交顺序运行，
+最多同时运行 --workers 个，排队的任务达到 --max-queue 时返回 503；
+处理 HTTP 连接的线程数由 --threads 限制，线程都忙时新连接在监听队列中等待。
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote, quote
+
+from job_queue import Job, JobQueue, STATUS_LABELS, DONE, FAILED, QUEUED
+from memory_budget import ENGINES, ENGINE_AUTO, parse_size, default_memory_budget
+from memory_monitor import format_bytes
+from csv_reader import CSV_EXTENSIONS
+from file_dedup import DUPLICATE_MODES, DUPLICATES_REUSE
+
+DEFAULT_PORT = 8765
+
+# 上传和下载时每次读写的字节数
+BLOCK_SIZE = 256 << 10
+
+# 表单字段和 multipart 头的大小上限
+MAX_FIELD_BYTES = 64 << 10
+MAX_HEADER_BYTES = 16 << 10
+
+# 每个接口保留最近多少次请求的耗时用于计算分位数
+LATENCY_SAMPLES = 2000
+
+# 任务状态中保留的日志条数
+JOB_MESSAGES = 50
+
+INPUT_EXTENSIONS = (".xlsx", ".xls") + CSV_EXTENSIONS
+
+CONTENT_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".csv": "text/csv; charset=utf-8",
+    ".zip": "application/zip",
+}
+
+
+class HTTPError(Exception):
+    """返回给客户端的错误，status 为 HTTP 状态码"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def percentile(values, fraction):
+    """最近秩法的分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(int(-(-fraction * len(ordered) // 1)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class BodyReader:
+    """按 Content-Length 读取请求体，不会读到下一个请求"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+        self.bytes_read = 0
+
+    def read(self, size=BLOCK_SIZE):
+        size = min(size, self.remaining)
+        if size <= 0:
+            return b""
+        data = self.stream.read(size)
+        if not data:
+            raise HTTPError(400, "请求体不完整")
+        self.remaining -= len(data)
+        self.bytes_read += len(data)
+        return data
+
+
+def _boundary(content_type):
+    """从 Content-Type 取出 multipart 的 boundary"""
+    kind, _, params = (content_type or "").partition(";")
+    if kind.strip().lower() != "multipart/form-data":
+        raise HTTPError(415, "请用 multipart/form-data 上传文件")
+    for param in params.split(";"):
+        name, _, value = param.strip().partition("=")
+        if name.strip().lower() == "boundary" and value.strip():
+            return value.strip().strip('"').encode("latin-1")
+    raise HTTPError(400, "multipart 缺少 boundary")
+
+
+def _header_params(value):
+    """form-data; name="file"; filename="工作簿1.xlsx" 转换成 {'name': ..., 'filename': ...}"""
+    params = {}
+    for item in value.split(";")[1:]:
+        name, _, text = item.strip().partition("=")
+        text = text.strip()
+        if len(text) >= 2 and text[0] == text[-1] == '"':
+            text = text[1:-1].replace('\\"', '"')
+        params[name.strip().lower()] = text
+    if "filename*" in params:
+        # RFC 5987: UTF-8''%E5%B7%A5...
+        charset, _, encoded = params["filename*"].partition("''")
+        params["filename"] = unquote(encoded, encoding=charset or "utf-8", errors="replace")
+    return params
+
+
+def _copy_until(stream, buffer, delimiter, write):
+    """
+    读取到 delimiter 为止，之前的数据交给 write；返回 delimiter 之后已读入的数据
+
+    缓冲区只保留可能是 delimiter 开头的末尾几个字节，其余数据读到就写出
+    """
+    keep = len(delimiter) - 1
+    while True:
+        index = buffer.find(delimiter)
+        if index >= 0:
+            write(buffer[:index])
+            return buffer[index + len(delimiter):]
+        if len(buffer) > keep:
+            write(buffer[:len(buffer) - keep])
+            buffer = buffer[len(buffer) - keep:]
+        data = stream.read(BLOCK_SIZE)
+        if not data:
+            raise HTTPError(400, "multipart 数据不完整")
+        buffer += data
+
+
+def _fill(stream, buffer, size):
+    while len(buffer) < size:
+        data = stream.read(BLOCK_SIZE)
+        if not data:
+            raise HTTPError(400, "multipart 数据不完整")
+        buffer += data
+    return buffer
+
+
+def _upload_path(directory, filename):
+    """上传文件的保存路径：去掉目录部分，同名文件加序号"""
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise HTTPError(400, "上传的文件没有文件名")
+    if not name.lower().endswith(INPUT_EXTENSIONS):
+        raise HTTPError(415, f"不支持的文件类型: {name}（可用 {', '.join(INPUT_EXTENSIONS)}）")
+    stem, ext = os.path.splitext(name)
+    path = os.path.join(directory, name)
+    count = 1
+    while os.path.exists(path):
+        count += 1
+        path = os.path.join(directory, f"{stem} ({count}){ext}")
+    return path
+
+
+def read_multipart(stream, content_type, directory):
+    """
+    边接收边解析 multipart/form-data，文件直接写入 directory
+
+    返回:
+        (fields, files)：fields 为 {字段名: [值, ...]}，files 为 [(字段名, 保存路径, 字节数), ...]
+    """
+    delimiter = b"\r\n--" + _boundary(content_type)
+    fields = {}
+    files = []
+
+    def discard(data):
+        pass
+
+    # 第一个分隔符前没有换行，补上后统一按 \r\n--boundary 查找；分隔符前的内容忽略
+    buffer = _copy_until(stream, b"\r\n", delimiter, discard)
+    while True:
+        buffer = _fill(stream, buffer, 2)
+        if buffer.startswith(b"--"):
+            return fields, files
+        if not buffer.startswith(b"\r\n"):
+            raise HTTPError(400, "multipart 格式错误")
+        header_bytes = bytearray()
+
+        def add_header(data):
+            header_bytes.extend(data)
+            if len(header_bytes) > MAX_HEADER_BYTES:
+                raise HTTPError(400, "multipart 头过长")
+        buffer = _copy_until(stream, buffer[2:], b"\r\n\r\n", add_header)
+        headers = {}
+        for line in header_bytes.decode("utf-8", errors="replace").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        params = _header_params(headers.get("content-disposition", ""))
+        name = params.get("name", "")
+        if "filename" in params:
+            path = _upload_path(directory, params["filename"])
+            size = 0
+            with open(path, "wb") as f:
+                def write(data):
+                    nonlocal size
+                    f.write(data)
+                    size += len(data)
+                buffer = _copy_until(stream, buffer, delimiter, write)
+            files.append((name, path, size))
+        else:
+            value = bytearray()
+
+            def add_value(data):
+                value.extend(data)
+                if len(value) > MAX_FIELD_BYTES:
+                    raise HTTPError(413, f"表单字段过长: {name}")
+            buffer = _copy_until(stream, buffer, delimiter, add_value)
+            fields.setdefault(name, []).append(value.decode("utf-8", errors="replace"))
+
+
+class RequestMetrics:
+    """按接口统计请求数、错误数、上传/下载字节数和耗时"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self.started = time.perf_counter()
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, status, seconds, bytes_in, bytes_out):
+        with self._lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {"requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0,
+                                              "seconds": 0.0, "latencies": collections.deque(maxlen=self.samples)}
+            stats["requests"] += 1
+            stats["errors"] += status >= 400
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["seconds"] += seconds
+            stats["latencies"].append(seconds)
+
+    def snapshot(self):
+        """各接口的统计；延迟分位数按最近 samples 次请求计算，单位毫秒"""
+        uptime = time.perf_counter() - self.started
+        with self._lock:
+            routes = {route: dict(stats, latencies=list(stats["latencies"])) for route, stats in self.routes.items()}
+        result = {}
+        for route, stats in sorted(routes.items()):
+            latencies = stats.pop("latencies")
+            seconds = stats.pop("seconds")
+            transferred = stats["bytes_in"] + stats["bytes_out"]
+            result[route] = dict(
+                stats,
+                requests_per_second=round(stats["requests"] / uptime, 3) if uptime > 0 else None,
+                mean_ms=round(seconds / stats["requests"] * 1000, 3),
+                p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+                p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+                p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+                max_ms=round(max(latencies) * 1000, 3),
+                bytes_per_second=round(transferred / seconds) if seconds > 0 else None,
+            )
+        return {"uptime_seconds": round(uptime, 3), "routes": result}
+
+
+def _first(options, name, default=None):
+    values = options.get(name)
+    return values[-1] if values else default
+
+
+def _int_option(options, name, default=None, minimum=1):
+    text = _first(options, name)
+    if text is None or not text.strip():
+        return default
+    try:
+        value = int(text)
+    except ValueError:
+        raise HTTPError(400, f"{name} 必须是整数: {text}")
+    if value < minimum:
+        raise HTTPError(400, f"{name} 不能小于 {minimum}")
+    return value
+
+
+def _choice_option(options, name, choices, default):
+    value = _first(options, name) or default
+    if value not in choices:
+        raise HTTPError(400, f"{name} 只能是 {', '.join(choices)}: {value}")
+    return value
+
+
+def _filter_options(options):
+    """columns / where 检查后返回 (列名列表, 筛选条件)"""
+    from row_filter import parse_column_list, make_row_filter
+    where = _first(options, "where")
+    try:
+        make_row_filter(where)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    return parse_column_list(_first(options, "columns")), (where.strip() or None) if where else None
+
+
+def split_options(options):
+    """拆分任务的选项，有问题时抛出 HTTPError(400)"""
+    columns, where = _filter_options(options)
+    return {
+        "rows_per_file": _int_option(options, "rows_per_file", 1),
+        "filename_template": _first(options, "filename_template") or None,
+        "columns": columns,
+        "where": where,
+        "engine": _choice_option(options, "engine", ENGINES, ENGINE_AUTO),
+    }
+
+
+def merge_options(options):
+    """合并任务的选项，有问题时抛出 HTTPError(400)"""
+    from merge_summary import parse_summary_spec
+    columns, where = _filter_options(options)
+    output = os.path.basename((_first(options, "output") or "合并后的Excel.xlsx").replace("\\", "/")).strip()
+    output_format = _first(options, "format") or None
+    if output_format is not None and output_format not in ("xlsx", "csv"):
+        raise HTTPError(400, f"format 只能是 xlsx 或 csv: {output_format}")
+    stem, ext = os.path.splitext(output)
+    if not stem:
+        raise HTTPError(400, "output 不能为空")
+    if ext.lower() not in (".xlsx", ".csv"):
+        output = stem + "." + (output_format or "xlsx")
+    summaries = None
+    if _first(options, "group_by"):
+        try:
+            summaries = parse_summary_spec(_first(options, "group_by"), options.get("agg"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+    return {
+        "output": output,
+        "output_format": output_format,
+        "chunk_rows": _int_option(options, "chunk_rows"),
+        "columns": columns,
+        "where": where,
+        "engine": _choice_option(options, "engine", ENGINES, ENGINE_AUTO),
+        "duplicates": _choice_option(options, "duplicates", DUPLICATE_MODES, DUPLICATES_REUSE),
+        "summaries": summaries,
+    }
+
+
+class ExcelToolService:
+    """任务的提交、运行、查询和清理；任务文件保存在 work_dir/<任务编号>/ 下"""
+
+    def __init__(self, work_dir, workers=1, max_queue=32, keep_jobs=100, memory_budget=None, log=print):
+        """
+        参数:
+            work_dir: 保存上传文件和结果的目录
+            workers: 同时运行的任务数
+            max_queue: 排队任务数上限，达到后拒绝新任务
+            keep_jobs: 保留的已结束任务数，超出时删除最早结束的任务及其文件
+            memory_budget: 总内存预算（字节），平均分给同时运行的任务
+            log: 日志输出函数
+        """
+        self.work_dir = work_dir
+        self.max_queue = max_queue
+        self.keep_jobs = keep_jobs
+        self.memory_budget = memory_budget
+        self.log = log
+        self.queue = JobQueue(workers, on_change=self._on_change)
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def check_capacity(self):
+        if len(self.queue.pending_jobs()) >= self.max_queue:
+            raise HTTPError(503, f"排队的任务已达到上限 {self.max_queue}，请稍后再试", {"Retry-After": "5"})
+
+    def new_job_dir(self):
+        return tempfile.mkdtemp(prefix="job_", dir=self.work_dir)
+
+    def submit(self, operation, options, input_files, job_dir):
+        """加入队列，返回 Job；input_files 为上传文件的路径"""
+        with self._lock:
+            self.check_capacity()
+            if operation == "split":
+                name = f"拆分 {os.path.basename(input_files[0])}"
+                target = lambda job: self._run_split(job, input_files[0], job_dir, options)
+            else:
+                name = f"合并 {len(input_files)} 个文件"
+                target = lambda job: self._run_merge(job, input_files, job_dir, options)
+            job = Job(name, target, output_path=job_dir)
+            job.operation = operation
+            job.directory = job_dir
+            job.result_path = None
+            job.messages = collections.deque(maxlen=JOB_MESSAGES)
+            self.jobs[job.id] = job
+            self._prune()
+        self.queue.submit(job)
+        return job
+
+    def list_jobs(self):
+        """所有任务（按编号排列）；在锁内复制，处理请求的线程可能同时提交或删除任务"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return sorted(jobs, key=lambda job: job.id)
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"任务不存在: {job_id}")
+        return job
+
+    def delete(self, job):
+        """取消未结束的任务；已结束的任务删除记录和文件。返回是否已删除"""
+        if not job.finished:
+            self.queue.cancel(job)
+            return False
+        with self._lock:
+            self._remove(job)
+        return True
+
+    def close(self):
+        self.queue.cancel_all()
+
+    def _prune(self):
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.end_time)
+        for job in finished[:max(len(finished) - self.keep_jobs, 0)]:
+            self._remove(job)
+
+    def _remove(self, job):
+        self.jobs.pop(job.id, None)
+        self.queue.remove(job)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def _job_budget(self):
+        if not self.memory_budget:
+            return None
+        return self.memory_budget // self.queue.workers
+
+    def _job_log(self, job):
+        def log(message):
+            message = message.strip()
+            if message:
+                job.messages.append(message)
+        return log
+
+    def _run_split(self, job, input_file, job_dir, options):
+        from split_excel import split_excel_by_rows
+        from perf_trace import Tracer
+        from zip_package import package_directory
+        tracer = Tracer()
+        output_dir = os.path.join(job_dir, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        file_count = split_excel_by_rows(input_file, output_dir, log=self._job_log(job), progress=job.update_progress,
+                                         checkpoint=job.checkpoint, tracer=tracer, engine=options["engine"],
+                                         memory_budget=self._job_budget(), rows_per_file=options["rows_per_file"],
+                                         filename_template=options["filename_template"],
+                                         columns=options["columns"], where=options["where"])
+        name = os.path.splitext(os.path.basename(input_file))[0] + "_拆分.zip"
+        job.result_path = os.path.join(job_dir, name)
+        package_directory(output_dir, job.result_path, log=self._job_log(job), checkpoint=job.checkpoint)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return {"files": file_count, "rows": tracer.counters.get("rows", 0), "result_file": name,
+                "result_bytes": os.path.getsize(job.result_path)}
+
+    def _run_merge(self, job, input_files, job_dir, options):
+        from merge_excel import merge_excel_files
+        from perf_trace import Tracer
+        from zip_package import package_directory
+        tracer = Tracer()
+        output_dir = os.path.join(job_dir, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, options["output"])
+        merge_excel_files(input_files, output_path, log=self._job_log(job), progress=job.update_progress,
+                          checkpoint=job.checkpoint, tracer=tracer, engine=options["engine"],
+                          memory_budget=self._job_budget(), output_format=options["output_format"],
+                          chunk_rows=options["chunk_rows"], columns=options["columns"], where=options["where"],
+                          duplicates=options["duplicates"], summaries=options["summaries"])
+        outputs = sorted(os.listdir(output_dir))
+        if not outputs:
+            raise RuntimeError(job.messages[-1] if job.messages else "没有合并出任何数据")
+        if len(outputs) == 1:
+            # 只有一个结果文件时直接下载，不打包
+            job.result_path = os.path.join(job_dir, outputs[0])
+            os.replace(os.path.join(output_dir, outputs[0]), job.result_path)
+        else:
+            job.result_path = os.path.join(job_dir, os.path.splitext(options["output"])[0] + ".zip")
+            package_directory(output_dir, job.result_path, log=self._job_log(job), checkpoint=job.checkpoint)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return {"files": len(outputs), "rows": tracer.counters.get("rows", 0),
+                "result_file": os.path.basename(job.result_path), "result_bytes": os.path.getsize(job.result_path)}
+
+    def _on_change(self, job):
+        if job.finished:
+            detail = f"，{job.error}" if job.status == FAILED else ""
+            self.log(f"[#{job.id}] {job.name} {STATUS_LABELS[job.status]}，用时 {job.elapsed:.2f} 秒{detail}")
+
+
+def job_info(job):
+    """任务状态（JSON）"""
+    info = {
+        "id": job.id,
+        "name": job.name,
+        "operation": job.operation,
+        "status": job.status,
+        "status_label": STATUS_LABELS[job.status],
+        "done": job.done,
+        "total": job.total,
+        "rows": job.rows,
+        "elapsed_seconds": round(job.elapsed, 3),
+        "rows_per_second": round(job.rows_per_second, 1),
+        "messages": list(job.messages)[-10:],
+    }
+    if job.status == DONE:
+        info["result"] = job.result
+        info["result_url"] = f"/jobs/{job.id}/result"
+    if job.error is not None:
+        info["error"] = str(job.error)
+    return info
+
+
+def content_disposition(filename):
+    """中文文件名用 filename*（RFC 5987），旧客户端看到的 filename 只保留 ASCII"""
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace("?", "_").replace('"', "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """路由请求到 ExcelToolService；每个请求的耗时和字节数记入 server.metrics"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "ExcelTool/1.0"
+    # 空闲的长连接超过该秒数后关闭，释放处理线程
+    timeout = 30
+    # 响应头和响应体分两次发送，不关闭 Nagle 算法时与客户端的延迟确认叠加，每个请求多等约 40 毫秒
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        start = time.perf_counter()
+        self.bytes_in = self.bytes_out = 0
+        self.body = None
+        self.response_started = False
+        route, status = "其他", 500
+        url = urlsplit(self.path)
+        path = unquote(url.path).rstrip("/") or "/"
+        try:
+            route, handler, args = self.route(method, path)
+            status = handler(parse_qs(url.query), *args)
+        except HTTPError as e:
+            status = e.status
+            self.send_error_json(e.status, e.message, e.headers)
+        except (BrokenPipeError, ConnectionResetError):
+            status = 499  # 客户端在响应完成前断开
+            self.close_connection = True
+        except Exception as e:
+            status = 500
+            self.server.log(f"处理请求出错: {method} {self.path}: {e!r}")
+            self.send_error_json(500, f"服务内部错误: {e}")
+        finally:
+            if self.body is not None:
+                self.bytes_in = self.body.bytes_read
+                if self.body.remaining:
+                    # 请求体没有读完时不能继续用这个连接
+                    self.close_connection = True
+            seconds = time.perf_counter() - start
+            self.server.metrics.record(f"{method} {route}", status, seconds, self.bytes_in, self.bytes_out)
+            if not self.server.quiet:
+                transferred = self.bytes_in + self.bytes_out
+                rate = f"，{format_bytes(transferred / seconds)}/s" if transferred and seconds > 0 else ""
+                self.server.log(f"{self.client_address[0]} {method} {self.path} {status} "
+                                f"{seconds * 1000:.1f} ms，上传 {format_bytes(self.bytes_in)}，"
+                                f"下载 {format_bytes(self.bytes_out)}{rate}")
+
+    def route(self, method, path):
+        """返回 (统计用的接口名, 处理函数, 参数)"""
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            return "/health", self.get_health, ()
+        if method == "GET" and path == "/metrics":
+            return "/metrics", self.get_metrics, ()
+        if parts[0] == "jobs":
+            if len(parts) == 1 and method == "GET":
+                return "/jobs", self.get_jobs, ()
+            if len(parts) == 2 and parts[1] in ("split", "merge") and method == "POST":
+                return path, self.post_job, (parts[1],)
+            if len(parts) >= 2 and parts[1].isdigit():
+                job_id = int(parts[1])
+                if len(parts) == 2 and method == "GET":
+                    return "/jobs/<id>", self.get_job, (job_id,)
+                if len(parts) == 2 and method == "DELETE":
+                    return "/jobs/<id>", self.delete_job, (job_id,)
+                if len(parts) == 3 and parts[2] == "result" and method == "GET":
+                    return "/jobs/<id>/result", self.get_result, (job_id,)
+        raise HTTPError(404, f"没有这个接口: {method} {path}")
+
+    # ---- 接口 ----
+
+    def get_health(self, query):
+        service = self.server.service
+        return self.send_json(200, {"status": "ok", "running": len(service.queue.running_jobs()),
+                                    "queued": len(service.queue.pending_jobs()), "workers": service.queue.workers})
+
+    def get_metrics(self, query):
+        return self.send_json(200, self.server.metrics.snapshot())
+
+    def get_jobs(self, query):
+        return self.send_json(200, {"jobs": [job_info(job) for job in self.server.service.list_jobs()]})
+
+    def get_job(self, query, job_id):
+        return self.send_json(200, job_info(self.server.service.get(job_id)))
+
+    def delete_job(self, query, job_id):
+        service = self.server.service
+        job = service.get(job_id)
+        if service.delete(job):
+            return self.send_json(200, {"id": job_id, "deleted": True})
+        return self.send_json(202, dict(job_info(job), cancelling=True))
+
+    def post_job(self, query, operation):
+        service = self.server.service
+        service.check_capacity()
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            raise HTTPError(411, "上传时需要 Content-Length")
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise HTTPError(411, "上传时需要 Content-Length")
+        if self.server.max_upload and length > self.server.max_upload:
+            raise HTTPError(413, f"上传内容超过上限 {format_bytes(self.server.max_upload)}")
+        self.body = BodyReader(self.rfile, length)
+        job_dir = service.new_job_dir()
+        input_dir = os.path.join(job_dir, "input")
+        os.makedirs(input_dir)
+        try:
+            fields, files = read_multipart(self.body, self.headers.get("Content-Type"), input_dir)
+            # 结束分隔符后可能还有内容，读完才能继续使用这个连接
+            while self.body.read():
+                pass
+            options = dict(query, **fields)
+            if not files:
+                raise HTTPError(400, "没有上传文件")
+            if operation == "split" and len(files) != 1:
+                raise HTTPError(400, "拆分时只能上传一个文件")
+            options = split_options(options) if operation == "split" else merge_options(options)
+            job = service.submit(operation, options, [path for _, path, _ in files], job_dir)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        info = job_info(job)
+        info["uploaded"] = [{"field": field, "name": os.path.basename(path), "bytes": size}
+                            for field, path, size in files]
+        return self.send_json(202, info, {"Location": f"/jobs/{job.id}"})
+
+    def get_result(self, query, job_id):
+        job = self.server.service.get(job_id)
+        if job.status != DONE:
+            message = f"任务{STATUS_LABELS[job.status]}，还没有结果" if job.status == QUEUED or not job.finished \
+                else f"任务{STATUS_LABELS[job.status]}，没有结果"
+            raise HTTPError(409, message)
+        path = job.result_path
+        name = os.path.basename(path)
+        content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+        return self.send_file(path, name, content_type)
+
+    # ---- 响应 ----
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.response_started = True
+        self.wfile.write(body)
+        self.bytes_out += len(body)
+        return status
+
+    def send_error_json(self, status, message, headers=None):
+        if self.response_started:
+            # 已经开始发送响应（如下载中途出错），只能断开连接
+            self.close_connection = True
+            return
+        self.close_connection = self.close_connection or self.body is None or self.body.remaining > 0
+        try:
+            self.send_json(status, {"error": message}, headers)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def send_file(self, path, filename, content_type):
+        """HTTP/1.1 客户端用分块传输边读边发；HTTP/1.0 客户端按 Content-Length 发送"""
+        chunked = self.request_version != "HTTP/1.0"
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Disposition", content_disposition(filename))
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            self.response_started = True
+            while True:
+                data = f.read(BLOCK_SIZE)
+                if not data:
+                    break
+                if chunked:
+                    self.wfile.write(b"%x\r\n" % len(data))
+                    self.wfile.write(data)
+                    self.wfile.write(b"\r\n")
+                else:
+                    self.wfile.write(data)
+                self.bytes_out += len(data)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        return 200
+
+    def log_request(self, code="-", size="-"):
+        pass  # 每个请求在 handle_request 中记录一行（含耗时和吞吐量）
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            self.server.log(f"{self.client_address[0]} {format % args}")
+
+
+class ExcelToolHTTPServer(HTTPServer):
+    """用固定数量的线程处理连接，线程都忙时新连接在监听队列中等待"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, service, threads=16, max_upload=None, quiet=False, log=print):
+        super().__init__(address, RequestHandler)
+        self.service = service
+        self.metrics = RequestMetrics()
+        self.max_upload = max_upload
+        self.quiet = quiet
+        self.log = log
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_server(host="127.0.0.1", port=DEFAULT_PORT, work_dir=None, workers=1, threads=16, max_queue=32,
+                  keep_jobs=100, max_upload=None, memory_budget=None, quiet=False, log=print):
+    """
+    创建服务（未启动），调用 serve_forever() 开始处理请求；port 为 0 时使用随机端口
+
+    参数:
+        work_dir: 保存上传文件和结果的目录，默认创建临时目录（server.owns_work_dir 为 True）
+        workers: 同时运行的任务数
+        threads: 处理 HTTP 连接的线程数
+        max_queue: 排队任务数上限
+        keep_jobs: 保留的已结束任务数
+        max_upload: 单个请求的上传字节数上限，None 表示不限制
+        memory_budget: 所有任务共用的内存预算（字节），默认按 default_memory_budget()
+        quiet: 不输出每个请求的日志
+    """
+    owns_work_dir = work_dir is None
+    if owns_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="excel_tool_server_")
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+    if memory_budget is None:
+        memory_budget = default_memory_budget()
+    service = ExcelToolService(work_dir, workers=workers, max_queue=max_queue, keep_jobs=keep_jobs,
+                               memory_budget=memory_budget, log=log)
+    server = ExcelToolHTTPServer((host, port), service, threads=threads, max_upload=max_upload, quiet=quiet,
+                                 log=log)
+    server.owns_work_dir = owns_work_dir
+    return server
+
+
+def close_server(server):
+    """停止接收请求，取消未结束的任务；工作目录是临时创建的则删除"""
+    server.server_close()
+    server.service.close()
+    if server.owns_work_dir:
+        shutil.rmtree(server.service.work_dir, ignore_errors=True)
+
+
+def _size(text):
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Excel工具 HTTP 服务（拆分、合并）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认 127.0.0.1，只允许本机访问）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"端口（默认 {DEFAULT_PORT}）")
+    parser.add_argument("--workers", type=int, default=1, help="同时运行的任务数（默认1）")
+    parser.add_argument("--threads", type=int, default=16, help="处理 HTTP 连接的线程数（默认16）")
+    parser.add_argument("--max-queue", type=int, default=32, help="排队任务数上限，达到后返回 503（默认32）")
+    parser.add_argument("--keep-jobs", type=int, default=100, help="保留的已结束任务数（默认100）")
+    parser.add_argument("--max-upload", type=_size, metavar="SIZE", help="单个请求的上传大小上限，如 2GB")
+    parser.add_argument("--memory-budget", type=_size, metavar="SIZE",
+                        help="所有任务共用的内存预算，平均分给同时运行的任务；默认同命令行工具")
+    parser.add_argument("--work-dir", help="保存上传文件和结果的目录，默认使用临时目录并在退出时删除")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出每个请求的日志")
+    args = parser.parse_args(argv)
+    for name in ("workers", "threads", "max_queue", "keep_jobs"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} 必须大于0")
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    server = create_server(args.host, args.port, work_dir=args.work_dir, workers=args.workers,
+                           threads=args.threads, max_queue=args.max_queue, keep_jobs=args.keep_jobs,
+                           max_upload=args.max_upload, memory_budget=args.memory_budget, quiet=args.quiet,
+                           log=log)
+    host, port = server.server_address[:2]
+    log(f"服务已启动: http://{host}:{port}（同时运行 {args.workers} 个任务，按 Ctrl+C 停止）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("正在停止...")
+    finally:
+        close_server(server)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+内容重复的输入文件检测 - 合并前找出内容完全相同的文件（如 report.xlsx 和 report (1).xlsx）
+
+先按文件大小分组，大小相同的文件才计算 CRC32（逐块读取），CRC32 也相同时再逐字节比较确认。
+大多数文件大小都不同，只需要读取文件大小，与解析文件相比耗时可以忽略。
+
+处理方式:
+    reuse  每种内容只解析一次，重复的文件使用已解析的数据，源文件列为各自的文件名（默认）
+    skip   跳过重复的文件并输出警告
+    keep   不检测，每个文件都解析（以前的行为）
+"""
+
+import os
+import zlib
+import filecmp
+
+DUPLICATES_REUSE = "reuse"
+DUPLICATES_SKIP = "skip"
+DUPLICATES_KEEP = "keep"
+DUPLICATE_MODES = (DUPLICATES_REUSE, DUPLICATES_SKIP, DUPLICATES_KEEP)
+
+# 计算 CRC32 时每次读取的字节数
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def content_crc32(file_path, block_size=HASH_BLOCK_SIZE):
+    """逐块读取文件，计算 CRC32"""
+    crc = 0
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+
+def find_duplicates(files):
+    """
+    找出内容与前面某个文件相同的文件
+
+    返回:
+        {重复的文件路径: 第一个内容相同的文件路径}；无法读取的文件不算重复
+    """
+    by_size = {}
+    for file_path in files:
+        try:
+            by_size.setdefault(os.path.getsize(file_path), []).append(file_path)
+        except OSError:
+            pass
+
+    duplicates = {}
+    for group in by_size.values():
+        if len(group) < 2:
+            continue
+        by_crc = {}
+        for file_path in group:
+            try:
+                by_crc.setdefault(content_crc32(file_path), []).append(file_path)
+            except OSError:
+                pass
+        for candidates in by_crc.values():
+            # CRC32 相同时逐字节确认，originals 为已确认内容互不相同的文件
+            originals = []
+            for file_path in candidates:
+                for original in originals:
+                    try:
+                        same = filecmp.cmp(original, file_path, shallow=False)
+                    except OSError:
+                        same = False
+                    if same:
+                        duplicates[file_path] = original
+                        break
+                else:
+                    originals.append(file_path)
+    return duplicates
+
+
+def reuse_frame(df, file_path):
+    """
+    重复文件使用已解析的 DataFrame：源文件列改为该文件的名称
+
+    只有源文件列是读取时添加的（df.attrs['source_column_added']）才修改，文件本身带有的源文件列保持不变。
+    """
+    if not df.attrs.get("source_column_added"):
+        return df
+    return df.assign(**{"源文件": os.path.basename(file_path)})
+
+
+class FrameCache:
+    """
+    保存后面还有重复文件要使用的 DataFrame，最后一个重复文件取走后释放
+
+        cache = FrameCache(duplicates)
+        cache.store(file_path, df)           # 读取了一个文件
+        df = cache.take(duplicate_path)      # 重复文件：返回改好源文件列的数据或原文件读取时的异常
+    """
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        self.remaining = {}
+        for original in duplicates.values():
+            self.remaining[original] = self.remaining.get(original, 0) + 1
+        self.frames = {}
+
+    def store(self, file_path, df):
+        if self.remaining.get(file_path):
+            self.frames[file_path] = df
+
+    def take(self, file_path):
+        original = self.duplicates[file_path]
+        df = self.frames.get(original)
+        self.remaining[original] -= 1
+        if not self.remaining[original]:
+            self.frames.pop(original, None)
+        if df is None:
+            return Exception(f"与 {os.path.basename(original)} 内容相同，但该文件没有读取")
+        if isinstance(df, Exception):
+            return df
+        return reuse_frame(df, file_path)
@@ -0,0 +1,238 @@
+"""
+表头样式 - 用配置描述拆分文件的表头填充、字体、边框、数字格式和冻结窗格
+
+配置格式（JSON）:
+    {
+        "rules": [
+            {"columns": "F:K", "fill": "ADD8E6"},
+            {"columns": "L:M", "fill": "FFB6C1"},
+            {"header": "金额|单价", "font": {"bold": true, "color": "C00000"},
+             "border": "thin", "number_format": "#,##0.00"},
+            {"columns": "A", "width": 20}
+        ],
+        "freeze_panes": "A2"
+    }
+
+columns 为列范围（"F:K"、"F"、[6, 11]），header 为匹配表头文字的正则表达式，两者都写时同时满足才生效。
+fill / font / border 作用于表头单元格，number_format 作用于该列的数据单元格，width 固定列宽（不再自动计算）。
+多条规则匹配同一列时，后面的规则覆盖前面规则的同名属性。
+
+每个任务只编译一次（compile_header_style），得到每列最终的样式；每个输出工作簿只注册一次
+（StyleTable.register），之后每个单元格只复制一个样式索引。规则再多，每个文件的开销也不变。
+"""
+
+import re
+import json
+from copy import copy
+
+from openpyxl.cell import Cell
+from openpyxl.styles import PatternFill, Font, Border, Side
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.exceptions import CellCoordinatesException
+
+# 默认样式：F1~K1 蓝色填充，L1~M1 红色填充
+DEFAULT_HEADER_STYLE = {
+    "rules": [
+        {"columns": "F:K", "fill": "ADD8E6"},  # 浅蓝色
+        {"columns": "L:M", "fill": "FFB6C1"},  # 浅红色
+    ],
+}
+
+RULE_KEYS = {"columns", "header", "fill", "font", "border", "number_format", "width"}
+FONT_KEYS = {"name", "size", "bold", "italic", "underline", "color"}
+
+# Excel 允许的最大列宽
+MAX_COLUMN_WIDTH = 255
+
+
+def load_header_style(path):
+    """从 JSON 文件读取表头样式配置"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    validate_header_style(config)
+    return config
+
+
+def parse_columns(spec):
+    """列范围 "F:K" / "F" / 6 / [6, 11] 转换成 (起始列, 结束列)"""
+    if isinstance(spec, int):
+        return spec, spec
+    if isinstance(spec, (list, tuple)) and len(spec) == 2:
+        first, last = (parse_columns(part)[0] for part in spec)
+    elif isinstance(spec, str) and spec.strip():
+        parts = spec.replace(" ", "").upper().split(":")
+        if len(parts) > 2:
+            raise ValueError(f"无法识别的列范围: {spec}")
+        try:
+            first = int(parts[0]) if parts[0].isdigit() else column_index_from_string(parts[0])
+            last = int(parts[-1]) if parts[-1].isdigit() else column_index_from_string(parts[-1])
+        except ValueError:
+            raise ValueError(f"无法识别的列范围: {spec}")
+    else:
+        raise ValueError(f"无法识别的列范围: {spec}")
+    if first < 1 or last < first:
+        raise ValueError(f"无法识别的列范围: {spec}")
+    return first, last
+
+
+def validate_header_style(config):
+    """检查配置格式，有问题时抛出 ValueError"""
+    if not isinstance(config, dict):
+        raise ValueError("表头样式配置必须是 JSON 对象")
+    unknown = set(config) - {"rules", "freeze_panes"}
+    if unknown:
+        raise ValueError(f"表头样式配置中有未知的字段: {', '.join(sorted(unknown))}")
+    freeze_panes = config.get("freeze_panes")
+    if freeze_panes is not None:
+        try:
+            coordinate_to_tuple(freeze_panes)
+        except (CellCoordinatesException, TypeError, ValueError):
+            raise ValueError(f"冻结窗格必须是单元格地址（如 \"A2\"）: {freeze_panes}")
+    if not isinstance(config.get("rules", []), list):
+        raise ValueError("表头样式配置的 rules 必须是列表")
+    for rule in config.get("rules", []):
+        if not isinstance(rule, dict):
+            raise ValueError(f"表头样式规则必须是 JSON 对象: {rule}")
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"表头样式规则中有未知的字段: {', '.join(sorted(unknown))}")
+        if "columns" in rule:
+            parse_columns(rule["columns"])
+        if "header" in rule:
+            try:
+                re.compile(rule["header"])
+            except re.error as e:
+                raise ValueError(f"表头匹配规则无效: {rule['header']} ({e})")
+        if "number_format" in rule and not (isinstance(rule["number_format"], str) and rule["number_format"]):
+            raise ValueError(f"数字格式必须是非空的文字（如 \"#,##0.00\"）: {rule['number_format']}")
+        if "width" in rule:
+            width = rule["width"]
+            if isinstance(width, bool) or not isinstance(width, (int, float)) or not 0 < width <= MAX_COLUMN_WIDTH:
+                raise ValueError(f"列宽必须是 0 到 {MAX_COLUMN_WIDTH} 之间的数字: {width}")
+        _build_attributes(rule)
+
+
+def _make_fill(value):
+    if isinstance(value, dict):
+        return PatternFill(**value)
+    return PatternFill(start_color=value, end_color=value, fill_type="solid")
+
+
+def _make_font(value):
+    if not isinstance(value, dict) or set(value) - FONT_KEYS:
+        raise ValueError(f"无法识别的字体设置: {value}")
+    return Font(**value)
+
+
+def _make_border(value):
+    if isinstance(value, str):
+        value = {"style": value}
+    side = Side(style=value.get("style", "thin"), color=value.get("color"))
+    return Border(left=side, right=side, top=side, bottom=side)
+
+
+def _build_attributes(rule):
+    """规则中的样式转换成 openpyxl 对象: {'fill': PatternFill, 'font': Font, ...}"""
+    attributes = {}
+    try:
+        if "fill" in rule:
+            attributes["fill"] = _make_fill(rule["fill"])
+        if "font" in rule:
+            attributes["font"] = _make_font(rule["font"])
+        if "border" in rule:
+            attributes["border"] = _make_border(rule["border"])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"表头样式规则无效: {rule} ({e})")
+    return attributes
+
+
+def _rule_matches(rule, col, value, pattern):
+    if "columns" in rule:
+        first, last = parse_columns(rule["columns"])
+        if not first <= col <= last:
+            return False
+    if pattern is not None:
+        return value is not None and pattern.search(str(value)) is not None
+    return True
+
+
+class StyleTable:
+    """
+    编译好的表头样式：每列的表头样式、数据数字格式和固定列宽
+
+    header_styles: {列号: {'fill': ..., 'font': ..., 'border': ...}}
+    number_formats: {列号: 数字格式}
+    widths: {列号: 列宽}
+    """
+
+    def __init__(self, header_styles, number_formats, widths, freeze_panes):
+        self.header_styles = header_styles
+        self.number_formats = number_formats
+        self.widths = widths
+        self.freeze_panes = freeze_panes
+
+    def register(self, ws):
+        """
+        在工作簿中注册所有样式，返回 (表头样式, 数据样式)，均为 {列号: StyleArray}
+
+        单元格通过 cell._style = copy(style) 使用，不再逐个单元格查找、去重样式对象。
+        """
+        header = {}
+        for col, attributes in self.header_styles.items():
+            template = Cell(ws)
+            for name, value in attributes.items():
+                setattr(template, name, value)
+            header[col] = template._style
+        data = {}
+        for col, number_format in self.number_formats.items():
+            template = Cell(ws)
+            template.number_format = number_format
+            data[col] = template._style
+        return header, data
+
+    def apply_widths(self, widths):
+        """用固定列宽替换自动计算的列宽（widths 为从第1列开始的列表）"""
+        for col, width in self.widths.items():
+            if col <= len(widths):
+                widths[col - 1] = width
+        return widths
+
+    def apply_sheet(self, ws):
+        """冻结窗格等工作表设置；write_only 模式下须在写入第一行之前调用"""
+        if self.freeze_panes:
+            ws.freeze_panes = self.freeze_panes
+
+
+def compile_header_style(config, header):
+    """按表头把配置编译成 StyleTable；每个任务调用一次"""
+    if config is None:
+        config = DEFAULT_HEADER_STYLE
+    validate_header_style(config)
+    rules = []
+    for rule in config.get("rules", []):
+        pattern = re.compile(rule["header"]) if "header" in rule else None
+        rules.append((rule, pattern, _build_attributes(rule)))
+
+    header_styles = {}
+    number_formats = {}
+    widths = {}
+    for col, value in enumerate(header, 1):
+        attributes = {}
+        for rule, pattern, rule_attributes in rules:
+            if not _rule_matches(rule, col, value, pattern):
+                continue
+            attributes.update(rule_attributes)
+            if "number_format" in rule:
+                number_formats[col] = rule["number_format"]
+            if "width" in rule:
+                widths[col] = rule["width"]
+        if attributes:
+            header_styles[col] = attributes
+    return StyleTable(header_styles, number_formats, widths, config.get("freeze_panes"))
+
+
+def styled_cell(cell, style):
+    """给单元格设置注册好的样式"""
+    cell._style = copy(style)
+    return cell
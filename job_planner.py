@@ -0,0 +1,390 @@
+"""
+任务预估（dry-run） - 拆分/合并开始前估算输出文件数、输出大小、峰值内存和用时，不写出任何文件
+
+只读取每个文件的表头、dimension 和开头 SAMPLE_ROWS 行：
+    行数      xlsx 取 dimension（没有时按字节扫描 XML 中的行），CSV 按换行符个数
+    保留比例  样本中满足筛选条件（拆分时还要求A列有内容）的行的比例
+    输出大小  xlsx 按输入文件每个单元格的压缩后字节数，CSV 按样本中单元格的平均文字长度
+    峰值内存  memory_budget 的估算模型（含校准系数）
+    用时      每个单元格的读取、写出耗时 + 每个文件的固定耗时（COST_MODEL），再乘以校准系数
+
+每种处理方式（合并时还有不同的进程数）都给出一行估算，并按内存预算推荐一种。
+每次实际运行结束后用 record_run 记录实际用时，校准系数逐渐接近本机的速度；
+与同一进程中其他任务重叠的运行和设置了 EXCEL_TOOL_NO_CALIBRATION 时不记录（见 memory_budget.calibration_enabled）。
+"""
+
+import os
+import json
+import math
+import threading
+
+from app_paths import user_cache_dir
+from memory_monitor import format_bytes
+from memory_budget import (ENGINE_MEMORY, ENGINE_STREAMING, MEMORY_MODEL, calibration_enabled, calibration_factor,
+                           estimate_peak, probe_file)
+from row_filter import make_row_filter, pick, project
+
+ENGINE_PIPELINE = "pipeline"
+ENGINE_STAGED = "staged"
+
+# 每个文件读取的样本行数
+SAMPLE_ROWS = 200
+
+# 合并时最多抽样的文件数（其他文件只读表头和 dimension）
+SAMPLE_FILES = 8
+
+# 每个单元格的耗时（秒）和每个文件的固定耗时（秒）
+# 在 14 列测试数据（benchmark.py）上测得：拆分每个输出文件约 5.5 毫秒（新建工作簿、保存），
+# 合并时 pandas 读取约 15 微秒/单元格，openpyxl 写出约 20 微秒/单元格，CSV 写出约为其十分之一
+COST_MODEL = {
+    ("split", ENGINE_MEMORY): {"read_cell": 8e-6, "write_cell": 25e-6, "output_file": 5.5e-3},
+    ("split", ENGINE_STREAMING): {"read_cell": 5e-6, "write_cell": 25e-6, "output_file": 5.5e-3},
+    ("merge", ENGINE_MEMORY): {"read_cell": 15e-6, "write_cell": 21e-6, "write_cell_csv": 1.5e-6,
+                               "input_file": 0.02},
+    ("merge", ENGINE_STREAMING): {"read_cell": 6.5e-6, "write_cell": 16e-6, "write_cell_csv": 0.8e-6,
+                                  "input_file": 0.01},
+    ("merge", ENGINE_PIPELINE): {"read_cell": 15e-6, "write_cell": 17e-6, "write_cell_csv": 6e-6,
+                                 "input_file": 0.02},
+    ("merge", ENGINE_STAGED): {"read_cell": 11e-6, "write_cell": 17e-6, "write_cell_csv": 1.5e-6,
+                               "input_file": 0.02},
+}
+
+# 多进程读取时每个进程的启动耗时（秒）和传回 DataFrame 的耗时（秒/单元格）
+PROCESS_START_SECONDS = 0.3
+PROCESS_TRANSFER_CELL = 4e-6
+
+# 流水线合并和暂存合并的内存：固定开销 + 同时在内存中的文件数 × 最大文件的单元格数 × 每单元格字节数
+PIPELINE_FILES_IN_MEMORY = 2
+STAGED_BASE_BYTES = 96 << 20
+
+# 每个 xlsx 输出文件的固定大小（压缩后的样式、工作表等），以及没有样本时每个单元格的字节数
+XLSX_FILE_BYTES = 5000
+XLSX_BYTES_PER_CELL = 7
+
+# 输出文件数超过该值时提醒
+MANY_FILES_WARNING = 10000
+
+# 用时校准：每次按 CALIBRATION_WEIGHT 向实际比值靠拢，并限制在范围内；太短的运行不参与校准
+CALIBRATION_FILE = "timing.json"
+CALIBRATION_WEIGHT = 0.3
+CALIBRATION_RANGE = (0.1, 10.0)
+CALIBRATION_MIN_SECONDS = 1.0
+
+_calibration_lock = threading.Lock()
+
+
+def available_cpus():
+    """本进程可以使用的 CPU 数（容器限制了 CPU 亲和性时按限制计算）"""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def _calibration_path():
+    return os.path.join(user_cache_dir("planner"), CALIBRATION_FILE)
+
+
+def load_timing_calibration():
+    """{'split/streaming': {'factor': 1.0, 'runs': 0}, ...}"""
+    try:
+        with open(_calibration_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def timing_factor(operation, engine):
+    entry = load_timing_calibration().get(f"{operation}/{engine}")
+    return entry["factor"] if entry else 1.0
+
+
+def estimate_seconds(operation, engine, input_cells, output_cells, input_files, output_files, jobs=1,
+                     output_format="xlsx"):
+    """按 COST_MODEL 估算的用时（未乘校准系数）"""
+    costs = COST_MODEL[(operation, engine)]
+    read = input_cells * costs["read_cell"] + input_files * costs.get("input_file", 0)
+    if operation == "merge" and output_format == "csv":
+        write = output_cells * costs["write_cell_csv"]
+    else:
+        write = output_cells * costs["write_cell"]
+    write += output_files * costs.get("output_file", 0)
+    if jobs > 1:
+        # 多进程读取：读取时间按实际可并行的进程数分摊，另加进程启动和传回数据的时间
+        parallel = max(min(jobs, input_files, available_cpus()), 1)
+        read = read / parallel + jobs * PROCESS_START_SECONDS + input_cells * PROCESS_TRANSFER_CELL
+    return read + write
+
+
+def record_run(operation, engine, seconds, input_cells, output_cells, input_files, output_files, jobs=1,
+               output_format="xlsx"):
+    """用一次实际运行的用时更新校准系数，返回新的系数（运行太短或不校准时返回 None）"""
+    if (operation, engine) not in COST_MODEL or not seconds or seconds < CALIBRATION_MIN_SECONDS:
+        return None
+    if not calibration_enabled():
+        return None
+    raw = estimate_seconds(operation, engine, input_cells, output_cells, input_files, output_files, jobs,
+                           output_format)
+    if raw <= 0:
+        return None
+    ratio = min(max(seconds / raw, CALIBRATION_RANGE[0]), CALIBRATION_RANGE[1])
+    key = f"{operation}/{engine}"
+    with _calibration_lock:
+        data = load_timing_calibration()
+        entry = data.get(key, {"factor": ratio, "runs": 0})
+        if entry["runs"]:
+            entry["factor"] = entry["factor"] * (1 - CALIBRATION_WEIGHT) + ratio * CALIBRATION_WEIGHT
+        entry["runs"] += 1
+        entry["factor"] = round(entry["factor"], 4)
+        data[key] = entry
+        try:
+            with open(_calibration_path(), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except OSError:
+            pass
+    return entry["factor"]
+
+
+def _text_bytes(value):
+    # 写成 UTF-8 文字后的字节数（CSV 输出大小）
+    return len(str(value).encode("utf-8")) if value is not None else 0
+
+
+def sample_file(file_path, columns=None, row_filter=None, sample_rows=SAMPLE_ROWS, require_first=False):
+    """
+    读取一个文件的表头、dimension 和开头几行，返回估算用的统计
+
+    require_first: 拆分时只有（选择后的）第一列有内容的行才写出文件
+
+    返回:
+        {'file', 'rows', 'columns', 'selected_columns', 'file_bytes', 'cells', 'streamable',
+         'sampled_rows', 'keep_ratio', 'text_bytes_per_cell'}
+    """
+    probe = probe_file(file_path)
+    result = {"file": file_path, "rows": None, "columns": None, "selected_columns": None,
+              "file_bytes": os.path.getsize(file_path), "cells": probe["cells"],
+              "streamable": probe["streamable"], "sampled_rows": 0, "keep_ratio": 1.0,
+              "text_bytes_per_cell": None}
+    if not probe["streamable"]:
+        # .xls 等只能整个读入的格式：按文件大小估算的单元格数，不抽样
+        return result
+    from profile_excel import column_names
+    from sheet_reader import open_sheet_source
+    with open_sheet_source(file_path) as source:
+        info = source.probe_sheet()
+        if not info.get("max_row") and hasattr(source, "scan_sheet"):
+            # 没有 dimension（如 write_only 生成的文件）：按字节扫描 XML 得到行数，不转换单元格
+            info = source.scan_sheet()
+        rows = source.iter_rows()
+        first = next(rows, None)
+        if first is None:
+            result.update(rows=0, columns=0, selected_columns=0)
+            return result
+        header_row, header = first
+        sample = [values for _, (_, values) in zip(range(sample_rows), rows)]
+        exhausted = len(sample) < sample_rows or next(rows, None) is None
+        rows.close()
+    max_column = info.get("max_column") or len(header)
+    names = column_names((list(header) + [None] * max_column)[:max_column])
+    selected, indices, predicate_indices = project(names, columns, row_filter)
+    if exhausted:
+        # 文件不超过样本行数：行数是准确的
+        data_rows = len(sample)
+    elif info.get("max_row"):
+        data_rows = max(info["max_row"] - header_row, 0)
+    else:
+        data_rows = max(probe["cells"] // max(max_column, 1), len(sample))
+    kept = 0
+    widths = cells = 0
+    for values in sample:
+        if row_filter is not None and not row_filter.predicate(pick(values, predicate_indices)):
+            continue
+        picked = pick(values, indices)
+        if require_first and (not picked or picked[0] is None):
+            continue
+        kept += 1
+        widths += sum(_text_bytes(value) for value in picked)
+        cells += len(picked)
+    result.update(rows=data_rows, columns=max_column, selected_columns=len(selected),
+                  cells=data_rows * max_column, sampled_rows=len(sample),
+                  keep_ratio=kept / len(sample) if sample else 1.0,
+                  text_bytes_per_cell=widths / cells if cells else None)
+    return result
+
+
+class JobPlan:
+    """一次拆分/合并的预估结果"""
+
+    def __init__(self, operation, inputs, rows, output_files, output_bytes, options, recommended, budget,
+                 warnings):
+        self.operation = operation
+        self.inputs = inputs                # 各文件的 sample_file 结果
+        self.rows = rows                    # 预计写出的数据行数
+        self.output_files = output_files    # 预计输出文件数
+        self.output_bytes = output_bytes    # 预计输出总大小
+        self.options = options              # [{'engine', 'jobs', 'seconds', 'peak_bytes', 'within_budget'}]
+        self.recommended = recommended      # options 中推荐的一项
+        self.budget = budget
+        self.warnings = warnings
+
+    def describe(self):
+        """多行文字说明，用于命令行输出和确认对话框"""
+        name = "拆分" if self.operation == "split" else "合并"
+        lines = [f"{name}预估（根据表头、dimension 和开头 {SAMPLE_ROWS} 行的样本）:",
+                 f"  输入: {len(self.inputs)} 个文件，约 {sum(i['rows'] or 0 for i in self.inputs)} 行",
+                 f"  输出: 约 {self.rows} 行，{self.output_files} 个文件，共约 {format_bytes(self.output_bytes)}"]
+        if self.budget:
+            lines.append(f"  内存预算: {format_bytes(self.budget)}")
+        lines.append("  处理方式            进程数  预计用时    峰值内存")
+        for option in self.options:
+            mark = "★" if option is self.recommended else " "
+            over = "（超出预算）" if option["within_budget"] is False else ""
+            lines.append(f"  {mark} {option['engine']:<17} {option['jobs']:>4}  {format_seconds(option['seconds']):>10}"
+                         f"  {format_bytes(option['peak_bytes']):>10}{over}")
+        for warning in self.warnings:
+            lines.append(f"  注意: {warning}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "operation": self.operation,
+            "input_files": len(self.inputs),
+            "input_rows": sum(i["rows"] or 0 for i in self.inputs),
+            "rows": self.rows,
+            "output_files": self.output_files,
+            "output_bytes": self.output_bytes,
+            "budget_bytes": self.budget,
+            "options": self.options,
+            "recommended": {"engine": self.recommended["engine"], "jobs": self.recommended["jobs"]},
+            "warnings": self.warnings,
+        }
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} 分钟"
+    return f"{seconds / 3600:.1f} 小时"
+
+
+def _peak(operation, engine, probes):
+    if engine in (ENGINE_MEMORY, ENGINE_STREAMING):
+        return int(estimate_peak(operation, engine, probes) * calibration_factor(operation, engine))
+    base, per_cell_total, _ = MEMORY_MODEL[(operation, ENGINE_MEMORY)]
+    largest = max((probe["cells"] for probe in probes), default=0)
+    if engine == ENGINE_PIPELINE:
+        return base + PIPELINE_FILES_IN_MEMORY * largest * per_cell_total
+    return STAGED_BASE_BYTES
+
+
+def _recommend(options, budget):
+    """预算内最快的一项；都超出预算时选内存最少的一项"""
+    within = [option for option in options if option["within_budget"] is not False]
+    if within:
+        return min(within, key=lambda option: option["seconds"])
+    return min(options, key=lambda option: option["peak_bytes"])
+
+
+def _option(operation, engine, jobs, seconds, peak, budget):
+    seconds *= timing_factor(operation, engine)
+    return {"engine": engine, "jobs": jobs, "seconds": round(seconds, 3), "peak_bytes": int(peak),
+            "within_budget": (peak <= budget) if budget else None}
+
+
+def plan_split(input_file, rows_per_file=1, columns=None, where=None, memory_budget=None):
+    """
+    估算拆分：输出文件数、总大小，以及两种处理方式的用时和峰值内存
+
+    参数与 split_excel.split_excel_by_rows 相同；返回 JobPlan
+    """
+    if rows_per_file < 1:
+        raise ValueError("每个文件的行数必须大于0")
+    row_filter = make_row_filter(where)
+    sample = sample_file(input_file, columns, row_filter, require_first=True)
+    data_rows = sample["rows"] or 0
+    rows = int(round(data_rows * sample["keep_ratio"]))
+    output_files = rows if rows_per_file == 1 else math.ceil(rows / rows_per_file)
+    width = sample["selected_columns"] or sample["columns"] or 0
+    bytes_per_cell = sample["file_bytes"] / sample["cells"] if sample["cells"] else XLSX_BYTES_PER_CELL
+    output_cells = (rows + output_files) * width
+    output_bytes = int(output_files * XLSX_FILE_BYTES + rows * width * bytes_per_cell)
+
+    probes = [probe_file(input_file)]
+    engines = [ENGINE_MEMORY] + ([ENGINE_STREAMING] if sample["streamable"] else [])
+    options = []
+    for engine in engines:
+        seconds = estimate_seconds("split", engine, sample["cells"], output_cells, 1, output_files)
+        options.append(_option("split", engine, 1, seconds, _peak("split", engine, probes), memory_budget))
+    warnings = []
+    if output_files > MANY_FILES_WARNING:
+        warnings.append(f"将生成 {output_files} 个文件，可以增大每个文件的行数")
+    return JobPlan("split", [sample], rows, output_files, output_bytes, options,
+                   _recommend(options, memory_budget), memory_budget, warnings)
+
+
+def plan_merge(excel_files, output_file=None, output_format=None, chunk_rows=None, columns=None, where=None,
+               memory_budget=None, jobs=None):
+    """
+    估算合并：输出行数、文件数、总大小，以及各处理方式和进程数的用时和峰值内存
+
+    jobs: 要比较的进程数列表，默认 1 和可用的 CPU 数（不超过文件数）；返回 JobPlan
+    """
+    from merge_excel import EXCEL_MAX_DATA_ROWS, output_format_of
+    if output_format is None:
+        output_format = output_format_of(output_file) if output_file else "xlsx"
+    row_filter = make_row_filter(where)
+    inputs = []
+    for idx, file_path in enumerate(excel_files):
+        # 只抽样前几个文件，其他文件沿用样本的保留比例和文字长度
+        inputs.append(sample_file(file_path, columns, row_filter, sample_rows=SAMPLE_ROWS if idx < SAMPLE_FILES else 0))
+    sampled = [i for i in inputs if i["sampled_rows"]]
+    keep_ratio = (sum(i["keep_ratio"] * i["sampled_rows"] for i in sampled) / sum(i["sampled_rows"] for i in sampled)
+                  if sampled else 1.0)
+    widths = [i["text_bytes_per_cell"] for i in sampled if i["text_bytes_per_cell"] is not None]
+    text_bytes = sum(widths) / len(widths) if widths else XLSX_BYTES_PER_CELL
+
+    rows = 0
+    input_cells = 0
+    for sample in inputs:
+        if sample["rows"] is not None:
+            ratio = sample["keep_ratio"] if sample["sampled_rows"] else keep_ratio
+            rows += int(round(sample["rows"] * ratio))
+        else:
+            rows += int(sample["cells"] * keep_ratio / max(sample["columns"] or 10, 1))
+        input_cells += sample["cells"]
+    # 合并后的列：所有文件选择后的列的并集（按列数估算）加源文件列
+    width = max((i["selected_columns"] or i["columns"] or 0 for i in inputs), default=0) + 1
+    output_cells = rows * width
+    limit = chunk_rows or (EXCEL_MAX_DATA_ROWS if output_format == "xlsx" else None)
+    output_files = max(math.ceil(rows / limit), 1) if limit else 1
+    if output_format == "csv":
+        # 每行: 各列文字和分隔符、源文件列（文件名）、换行
+        name_bytes = sum(len(os.path.basename(path).encode("utf-8")) for path in excel_files) / len(excel_files)
+        output_bytes = int(rows * ((width - 1) * (text_bytes + 1) + name_bytes + 2))
+    else:
+        input_bytes = sum(i["file_bytes"] for i in inputs)
+        bytes_per_cell = input_bytes / input_cells if input_cells else XLSX_BYTES_PER_CELL
+        output_bytes = int(output_files * XLSX_FILE_BYTES + output_cells * bytes_per_cell)
+
+    probes = [probe_file(file_path) for file_path in excel_files]
+    if jobs is None:
+        jobs = sorted({1, min(available_cpus(), len(excel_files))})
+    options = []
+    for engine in (ENGINE_MEMORY, ENGINE_STREAMING, ENGINE_PIPELINE, ENGINE_STAGED):
+        for worker_count in (jobs if engine == ENGINE_MEMORY else [1]):
+            seconds = estimate_seconds("merge", engine, input_cells, output_cells, len(excel_files), output_files,
+                                       worker_count, output_format)
+            peak = _peak("merge", engine, probes)
+            if worker_count > 1:
+                # 每个读取进程同时持有一个文件
+                _, per_cell_total, _ = MEMORY_MODEL[("merge", ENGINE_MEMORY)]
+                peak += (worker_count - 1) * max(p["cells"] for p in probes) * per_cell_total
+            options.append(_option("merge", engine, worker_count, seconds, peak, memory_budget))
+    warnings = []
+    if output_files > 1:
+        warnings.append(f"输出将分成 {output_files} 个文件")
+    if any(not i["streamable"] for i in inputs):
+        warnings.append("有文件不能流式读取（如 .xls），行数按文件大小估算")
+    return JobPlan("merge", inputs, rows, output_files, output_bytes, options,
+                   _recommend(options, memory_budget), memory_budget, warnings)
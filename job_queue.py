@@ -0,0 +1,230 @@
+"""
+后台任务队列 - 支持排队、暂停、取消和并发数限制
+
+任务函数通过 job.checkpoint() 协作式地响应暂停和取消；
+输出路径相同的任务不会同时运行。
+"""
+
+import itertools
+import os
+import threading
+import time
+
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+STATUS_LABELS = {
+    QUEUED: "排队中",
+    RUNNING: "运行中",
+    PAUSED: "已暂停",
+    DONE: "已完成",
+    CANCELLED: "已取消",
+    FAILED: "失败",
+}
+
+FINISHED_STATUSES = (DONE, CANCELLED, FAILED)
+
+
+class JobCancelled(BaseException):
+    """任务被取消；继承 BaseException，避免被引擎中逐文件的 except Exception 吞掉"""
+
+
+class Job:
+    """一个后台任务"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, target, output_path=None):
+        """
+        参数:
+            name: 显示名称
+            target: 任务函数 target(job)，返回值保存在 job.result
+            output_path: 输出文件或文件夹，相同路径的任务会依次运行
+        """
+        self.id = next(self._ids)
+        self.name = name
+        self.target = target
+        self.output_path = os.path.normcase(os.path.abspath(output_path)) if output_path else None
+
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+        # 进度
+        self.done = 0
+        self.total = 0
+        self.rows = 0
+
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
+    @property
+    def elapsed(self):
+        """运行时长（秒）"""
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def update_progress(self, done, total, rows):
+        """进度回调，签名与 split/merge 引擎的 progress 参数一致"""
+        self.done = done
+        self.total = total
+        self.rows = rows
+
+    def checkpoint(self):
+        """在任务函数的循环中调用：已取消时抛出 JobCancelled，已暂停时等待继续"""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+        if not self._resume_event.is_set():
+            self.status = PAUSED
+            while not self._resume_event.wait(0.2):
+                if self._cancel_event.is_set():
+                    raise JobCancelled()
+            self.status = RUNNING
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def pause(self):
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        self._resume_event.set()
+
+
+class JobQueue:
+    """按提交顺序运行任务，最多同时运行 workers 个"""
+
+    def __init__(self, workers=1, on_change=None):
+        """
+        参数:
+            workers: 同时运行的任务数
+            on_change: 任务状态变化时调用 on_change(job)，在工作线程中调用
+        """
+        self.workers = max(1, workers)
+        self.on_change = on_change
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """加入队列，返回 job"""
+        with self._lock:
+            self.jobs.append(job)
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def set_workers(self, workers):
+        """修改同时运行的任务数"""
+        self.workers = max(1, workers)
+        self._dispatch()
+
+    def cancel(self, job):
+        """取消任务：排队中的任务直接取消，运行中的任务在下一个检查点停止"""
+        with self._lock:
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.end_time = job.start_time = time.perf_counter()
+            job.cancel()
+        self._notify(job)
+
+    def cancel_all(self):
+        for job in self.list_jobs():
+            if not job.finished:
+                self.cancel(job)
+
+    def remove(self, job):
+        """从列表中移除已结束的任务，返回是否移除"""
+        with self._lock:
+            if job.finished and job in self.jobs:
+                self.jobs.remove(job)
+                return True
+        return False
+
+    def list_jobs(self):
+        """任务列表的副本；其他线程可能同时提交或移除任务，不要直接遍历 self.jobs"""
+        with self._lock:
+            return list(self.jobs)
+
+    def running_jobs(self):
+        with self._lock:
+            return self._running_jobs()
+
+    def pending_jobs(self):
+        with self._lock:
+            return self._pending_jobs()
+
+    def is_idle(self):
+        return all(job.finished for job in self.list_jobs())
+
+    # 以下两个在已持有 _lock 时调用
+    def _running_jobs(self):
+        return [job for job in self.jobs if job.status in (RUNNING, PAUSED)]
+
+    def _pending_jobs(self):
+        return [job for job in self.jobs if job.status == QUEUED]
+
+    def _dispatch(self):
+        """启动可运行的排队任务"""
+        started = []
+        with self._lock:
+            running = self._running_jobs()
+            busy_paths = {job.output_path for job in running if job.output_path}
+            for job in self._pending_jobs():
+                if len(running) + len(started) >= self.workers:
+                    break
+                # 输出路径被运行中的任务占用时继续排队
+                if job.output_path and job.output_path in busy_paths:
+                    continue
+                job.status = RUNNING
+                job.start_time = time.perf_counter()
+                if job.output_path:
+                    busy_paths.add(job.output_path)
+                started.append(job)
+
+        for job in started:
+            thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+            thread.start()
+            self._notify(job)
+
+    def _run(self, job):
+        """在工作线程中运行任务"""
+        try:
+            job.checkpoint()
+            job.result = job.target(job)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.end_time = time.perf_counter()
+        self._notify(job)
+        self._dispatch()
+
+    def _notify(self, job):
+        if self.on_change is not None:
+            self.on_change(job)
@@ -0,0 +1,288 @@
+"""
+HTTP 服务压力测试 - 测量每秒请求数和延迟分位数
+
+用法:
+    python loadtest_server.py                                        # 在本进程启动服务，用生成的数据测试
+    python loadtest_server.py --url http://127.0.0.1:8765 --file 工作簿1.xlsx -c 8 -n 200
+    python loadtest_server.py --scenario merge --file a.xlsx --file b.xlsx -c 4 -n 40
+    python loadtest_server.py --scenario status -c 32 -n 20000       # 只测不涉及处理的状态接口
+    python loadtest_server.py -o loadtest.json                       # 结果另存为 JSON
+
+场景:
+    split   上传一个文件 → 轮询任务状态 → 下载结果（默认）
+    merge   上传多个文件 → 轮询任务状态 → 下载结果
+    status  先提交一个拆分任务，之后反复查询它的状态
+
+-n 为完成的任务数（status 场景为请求数），-c 为并发的客户端数，每个客户端使用一个长连接。
+结果按步骤（上传、查询、下载、整个任务）分别给出每秒次数和 p50 / p95 / p99 / 最大延迟。
+
+在本进程启动的服务不更新拆分/合并的校准数据；用 --url 测试其他服务时，请在该服务的环境中
+设置 EXCEL_TOOL_NO_CALIBRATION=1（见 memory_budget.py）。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from excel_tool_server import create_server, close_server, percentile
+from memory_budget import NO_CALIBRATION_ENV
+
+# 生成测试数据的随机种子
+SEED = 20240601
+
+# 轮询任务状态的间隔（秒）
+POLL_INTERVAL = 0.02
+
+STEPS = ("upload", "status", "download", "job")
+
+STEP_LABELS = {
+    "upload": "上传",
+    "status": "查询状态",
+    "download": "下载结果",
+    "job": "整个任务",
+}
+
+
+def generate_workbook(path, rows, seed=SEED):
+    """生成测试用的工作簿：第一行表头，A 列为编号"""
+    from openpyxl import Workbook
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(["编号", "姓名", "部门", "金额", "日期"])
+    for idx in range(1, rows + 1):
+        ws.append([f"N{idx:06d}", f"姓名{rng.randrange(1000)}", rng.choice(["销售", "财务", "研发"]),
+                   round(rng.uniform(0, 10000), 2), f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"])
+    wb.save(path)
+    return path
+
+
+def multipart_body(files, fields):
+    """构造 multipart/form-data 请求体，返回 (Content-Type, 请求体)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+                     .encode("utf-8"))
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+        header = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+                  f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: application/octet-stream\r\n\r\n")
+        parts.append(header.encode("utf-8") + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("ascii"))
+    return f"multipart/form-data; boundary={boundary}", b"".join(parts)
+
+
+class Client:
+    """一个客户端：一个长连接，记录每个请求的耗时"""
+
+    def __init__(self, url, timeout=300):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+        self.samples = {step: [] for step in STEPS}
+        self.errors = []
+
+    def request(self, step, method, path, body=None, headers=None):
+        """发送请求，返回 (状态码, 响应体)；连接断开时重连一次"""
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            start = time.perf_counter()
+            try:
+                self.connection.request(method, path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+                continue
+            self.samples[step].append(time.perf_counter() - start)
+            if response.will_close:
+                self.connection.close()
+                self.connection = None
+            return response.status, data
+
+    def run_job(self, operation, content_type, body):
+        """提交一个任务，等待完成并下载结果；返回是否成功"""
+        start = time.perf_counter()
+        status, data = self.request("upload", "POST", f"/jobs/{operation}", body,
+                                    {"Content-Type": content_type})
+        if status != 202:
+            self.errors.append(f"上传 {status}: {data[:200].decode('utf-8', 'replace')}")
+            return False
+        job_id = json.loads(data)["id"]
+        while True:
+            status, data = self.request("status", "GET", f"/jobs/{job_id}")
+            info = json.loads(data)
+            if info["status"] == "done":
+                break
+            if info["status"] in ("failed", "cancelled"):
+                self.errors.append(f"任务 {job_id} {info['status']}: {info.get('error')}")
+                return False
+            time.sleep(POLL_INTERVAL)
+        status, data = self.request("download", "GET", f"/jobs/{job_id}/result")
+        if status != 200:
+            self.errors.append(f"下载 {status}")
+            return False
+        self.samples["job"].append(time.perf_counter() - start)
+        # 下载后删除任务，避免服务端保留大量结果文件
+        self.request("status", "DELETE", f"/jobs/{job_id}")
+        return True
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_load(url, scenario, files, fields, concurrency, count):
+    """并发运行 count 个任务（status 场景为 count 次查询），返回结果统计"""
+    operation = "merge" if scenario == "merge" else "split"
+    content_type, body = multipart_body(files, fields)
+    job_path = None
+    if scenario == "status":
+        client = Client(url)
+        status, data = client.request("upload", "POST", f"/jobs/{operation}", body, {"Content-Type": content_type})
+        if status != 202:
+            raise RuntimeError(f"提交任务失败 {status}: {data[:200].decode('utf-8', 'replace')}")
+        job_path = f"/jobs/{json.loads(data)['id']}"
+        client.close()
+
+    remaining = [count]
+    lock = threading.Lock()
+    clients = [Client(url) for _ in range(concurrency)]
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(client):
+        try:
+            while take():
+                if job_path:
+                    status, _ = client.request("status", "GET", job_path)
+                    if status != 200:
+                        client.errors.append(f"查询状态 {status}")
+                else:
+                    client.run_job(operation, content_type, body)
+        except Exception as e:
+            client.errors.append(repr(e))
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(client,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    steps = {}
+    for step in STEPS:
+        samples = [value for client in clients for value in client.samples[step]]
+        if not samples:
+            continue
+        steps[step] = {
+            "count": len(samples),
+            "per_second": round(len(samples) / seconds, 2),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "max_ms": round(max(samples) * 1000, 2),
+        }
+    requests = sum(len(client.samples[step]) for client in clients for step in STEPS if step != "job")
+    errors = [error for client in clients for error in client.errors]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "count": count,
+        "seconds": round(seconds, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / seconds, 2) if seconds > 0 else None,
+        "upload_bytes": len(body),
+        "steps": steps,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+def print_results(results):
+    print(f"场景 {results['scenario']}：{results['concurrency']} 个客户端，用时 {results['seconds']:.2f} 秒，"
+          f"共 {results['requests']} 个请求，{results['requests_per_second']} 请求/秒")
+    print(f"{'步骤':<8}{'次数':>8}{'每秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'最大 ms':>10}")
+    for step, stats in results["steps"].items():
+        print(f"{STEP_LABELS[step]:<8}{stats['count']:>8}{stats['per_second']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    if results["errors"]:
+        print(f"失败 {results['errors']} 次，例如:")
+        for error in results["error_samples"]:
+            print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 服务压力测试：每秒请求数和延迟分位数")
+    parser.add_argument("--url", help="服务地址，如 http://127.0.0.1:8765；不指定时在本进程启动服务")
+    parser.add_argument("--scenario", choices=["split", "merge", "status"], default="split",
+                        help="测试场景（默认 split）")
+    parser.add_argument("--file", action="append", help="上传的文件，可以指定多个；默认生成测试数据")
+    parser.add_argument("--rows", type=int, default=200, help="生成的测试数据行数（默认200）")
+    parser.add_argument("--rows-per-file", type=int, default=50, help="拆分时每个文件的行数（默认50）")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="并发的客户端数（默认4）")
+    parser.add_argument("-n", "--count", type=int, default=40, help="任务数，status 场景为请求数（默认40）")
+    parser.add_argument("--workers", type=int, default=2, help="本进程启动服务时同时运行的任务数（默认2）")
+    parser.add_argument("-o", "--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+    if args.concurrency < 1 or args.count < 1:
+        parser.error("--concurrency 和 --count 必须大于0")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args.file
+        if not files:
+            count = 3 if args.scenario == "merge" else 1
+            files = [generate_workbook(os.path.join(tmp_dir, f"测试{idx}.xlsx"), args.rows, SEED + idx)
+                     for idx in range(1, count + 1)]
+        fields = {"rows_per_file": args.rows_per_file} if args.scenario != "merge" else {"output": "合并.xlsx"}
+
+        server = None
+        url = args.url
+        if url is None:
+            # 压力测试的任务同时运行、数据是生成的，不用于校准估算
+            os.environ.setdefault(NO_CALIBRATION_ENV, "1")
+            server = create_server(port=0, workers=args.workers, threads=max(16, args.concurrency),
+                                   max_queue=max(32, args.concurrency), quiet=True, log=lambda message: None)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            print(f"已在本进程启动服务: {url}（同时运行 {args.workers} 个任务）")
+        try:
+            results = run_load(url, args.scenario, files, fields, args.concurrency, args.count)
+        finally:
+            if server is not None:
+                server.shutdown()
+                close_server(server)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
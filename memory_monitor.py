@@ -0,0 +1,165 @@
+"""
+进程内存占用（RSS）
+"""
+
+import os
+import sys
+import threading
+import tracemalloc
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.05
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（字节）；无法获取时返回 None"""
+    if sys.platform == "win32":
+        counters = _windows_memory_counters()
+        return counters.PeakWorkingSetSize if counters else None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的单位是 KB，macOS 是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def peak_child_rss_bytes():
+    """已结束的子进程中最大的峰值常驻内存（字节），用于统计进程池；无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes():
+    """当前进程的常驻内存（字节）；无法获取时返回 None"""
+    if sys.platform == "win32":
+        counters = _windows_memory_counters()
+        return counters.WorkingSetSize if counters else None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _windows_memory_counters():
+    """通过 GetProcessMemoryInfo 读取内存计数"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.WinDLL("kernel32")
+        psapi = ctypes.WinDLL("psapi")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        ok = psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters if ok else None
+    except (OSError, AttributeError):
+        return None
+
+
+def format_bytes(size):
+    """把字节数显示成 KB / MB / GB"""
+    if size is None:
+        return "未知"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+class MemorySampler:
+    """
+    在后台线程中定期读取常驻内存，记录一段处理过程中的峰值
+
+    peak_rss_bytes() 是整个进程的峰值，长期运行的服务（如 Streamlit）里无法反映单次任务，
+    所以按时间采样。use_tracemalloc 为 True 时同时记录 Python 对象分配的峰值（开销较大）。
+
+        with MemorySampler() as sampler:
+            ...
+        sampler.peak_delta  # 处理过程中比开始时多占用的字节数
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, use_tracemalloc=False):
+        self.interval = interval
+        self.use_tracemalloc = use_tracemalloc
+        self.start_rss = None
+        self.peak_rss = None
+        self.tracemalloc_peak = None
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        self.start_rss = self.peak_rss = current_rss_bytes()
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.start_rss is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.samples += 1
+            if self.peak_rss is None or rss > self.peak_rss:
+                self.peak_rss = rss
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            self.tracemalloc_peak = tracemalloc.get_traced_memory()[1]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def peak_delta(self):
+        """峰值比开始时多占用的字节数；无法采样时返回 None"""
+        if self.start_rss is None or self.peak_rss is None:
+            return self.tracemalloc_peak
+        return max(self.peak_rss - self.start_rss, 0)
+
+    def to_dict(self):
+        return {
+            "start_rss_bytes": self.start_rss,
+            "peak_rss_bytes": self.peak_rss,
+            "peak_delta_bytes": self.peak_delta,
+            "tracemalloc_peak_bytes": self.tracemalloc_peak,
+            "samples": self.samples,
+        }
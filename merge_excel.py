@@ -1,72 +1,727 @@
 import pandas as pd
+import io
 import os
+import csv
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-def merge_excel_files(data_dir, output_file):
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from perf_trace import NULL_TRACER
+from memory_budget import ENGINE_AUTO, ENGINE_MEMORY, ENGINE_STREAMING, calibration_job, plan_memory
+from memory_monitor import MemorySampler
+from profile_excel import column_names
+from sheet_reader import open_sheet_source
+from csv_reader import CSV_EXTENSIONS, is_csv_file, read_csv_frame
+from file_dedup import DUPLICATES_REUSE, DUPLICATES_SKIP, DUPLICATES_KEEP, FrameCache, find_duplicates
+from row_filter import make_row_filter, project, pick, filter_frame
+from merge_summary import MergeSummary
+from job_planner import ENGINE_PIPELINE, ENGINE_STAGED, record_run
+
+
+# 一个工作表最多 1048576 行，去掉表头后的数据行数上限
+EXCEL_MAX_DATA_ROWS = 1048575
+
+def list_excel_files(data_dir):
+    """获取目录下的所有 Excel 文件路径（包括 CSV / TSV 文件）"""
+    excel_files = []
+    for file in os.listdir(data_dir):
+        if file.endswith('.xlsx') or file.endswith('.xls') or file.lower().endswith(CSV_EXTENSIONS):
+            excel_files.append(os.path.join(data_dir, file))
+    return excel_files
+
+
+def collect_excel_files(paths):
+    """展开路径列表：文件原样保留，文件夹取其中的 Excel 文件（按文件名排序）"""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    excel_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            excel_files.extend(sorted(list_excel_files(path)))
+        else:
+            excel_files.append(os.fspath(path))
+    return excel_files
+
+
+def apply_dtypes(df, dtypes):
+    """按 {列名: 类型} 转换列类型，转换失败的列保持原样"""
+    for column, dtype in dtypes.items():
+        if column in df.columns:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
+
+
+def read_excel_file(file_path, dtypes=None, reader_engine=None, tracer=NULL_TRACER, data=None,
+                    columns=None, row_filter=None, parse_cache=None):
+    """
+    读取单个 Excel 或 CSV / TSV 文件（第一行为列名），并添加源文件列
+    
+    data: 已读入内存的文件内容（bytes），提供时不再从磁盘读取，file_path 只用于源文件列
+    columns: 只保留这些列（按此顺序）；只有这些列和筛选条件用到的列交给 pandas 转换
+    row_filter: row_filter.RowFilter，只保留满足条件的行
+    parse_cache: parse_cache.ParseCache，内容相同的文件第二次读取时直接使用缓存的解析结果
+    """
+    usecols = needed = None
+    if columns is not None:
+        needed = set(columns) | set(row_filter.columns if row_filter is not None else ())
+        usecols = lambda name: str(name) in needed
+    
+    def parse():
+        if is_csv_file(file_path):
+            return read_csv_frame(file_path, data=data, usecols=usecols)
+        return pd.read_excel(io.BytesIO(data) if data is not None else file_path, header=0, engine=reader_engine,
+                             usecols=usecols)
+    
+    with tracer.span("merge.read", file=os.path.basename(file_path)):
+        if parse_cache is not None:
+            # 缓存中保存读取的所有列（只读取部分列时按读取的列区分）
+            df = parse_cache.load_frame(file_path, parse, data=data, reader="pandas", pandas=pd.__version__,
+                                        engine=reader_engine, usecols=sorted(needed) if needed else None)
+        else:
+            df = parse()
+    
+    with tracer.span("merge.transform"):
+        if row_filter is not None:
+            df = filter_frame(df, row_filter)
+        if columns is not None:
+            names = {str(column): column for column in df.columns}
+            df = df[[names[name] for name in columns if name in names]]
+        if dtypes:
+            df = apply_dtypes(df, dtypes)
+        
+        # 添加源文件名列，用于追踪数据来源
+        if '源文件' not in df.columns:
+            df.insert(0, '源文件', os.path.basename(file_path))
+            df.attrs['source_column_added'] = True
+    return df
+
+
+def frame_cells(df):
+    """读取的单元格数：行数 × 文件中的列数，不含读取时添加的源文件列（与流式读取的 cells 计数相同）"""
+    return df.size - (len(df) if df.attrs.get('source_column_added') else 0)
+
+
+def iter_excel_frames(excel_files, dtypes=None, reader_engine=None, jobs=1, tracer=NULL_TRACER,
+                      duplicates=None, columns=None, row_filter=None, parse_cache=None):
+    """
+    按输入顺序生成 (文件路径, DataFrame 或读取时的异常)
+    
+    jobs 大于1时用多个进程同时读取，结果仍按输入顺序生成；
+    此时子进程中的读取不单独计时，tracer 只记录等待每个文件的时间（merge.read_wait）。
+    duplicates: {重复的文件路径: 内容相同的前一个文件}（见 file_dedup.find_duplicates），
+                重复的文件不再读取，使用前一个文件的数据并改写源文件列
+    columns / row_filter / parse_cache: 见 read_excel_file
+    """
+    duplicates = duplicates or {}
+    cache = FrameCache(duplicates)
+    if not jobs or jobs <= 1 or len(excel_files) <= 1:
+        for file_path in excel_files:
+            if file_path in duplicates:
+                yield file_path, cache.take(file_path)
+                continue
+            try:
+                df = read_excel_file(file_path, dtypes, reader_engine, tracer, columns=columns,
+                                     row_filter=row_filter, parse_cache=parse_cache)
+            except Exception as e:
+                df = e
+            cache.store(file_path, df)
+            yield file_path, df
+        return
+    
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = {file_path: executor.submit(read_excel_file, file_path, dtypes, reader_engine,
+                                              columns=columns, row_filter=row_filter, parse_cache=parse_cache)
+                   for file_path in excel_files if file_path not in duplicates}
+        for file_path in excel_files:
+            if file_path in duplicates:
+                yield file_path, cache.take(file_path)
+                continue
+            try:
+                with tracer.span("merge.read_wait", file=os.path.basename(file_path)):
+                    df = futures.pop(file_path).result()
+            except Exception as e:
+                df = e
+            cache.store(file_path, df)
+            yield file_path, df
+    finally:
+        # 任务取消时不再等待还没开始的文件
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def merge_dataframes(excel_files, log=print, progress=None, checkpoint=None, dtypes=None,
+                     reader_engine=None, jobs=1, tracer=None, duplicates=None, columns=None, row_filter=None,
+                     parse_cache=None, summary=None):
+    """
+    读取并合并多个 Excel 文件，返回合并后的 DataFrame
+    
+    参数:
+        excel_files: Excel 文件路径列表
+        log: 输出日志消息的函数
+        progress: 进度回调 progress(已读取文件数, 文件总数, 已读取行数)
+        checkpoint: 每个文件读取前调用一次，用于暂停或取消任务
+        dtypes: {列名: 类型}，每个文件读取后按此转换，使合并后的列类型一致
+                （可由 profile_excel.merge_dtypes 得到）
+        reader_engine: pandas.read_excel 使用的引擎，默认由 pandas 按扩展名选择
+        jobs: 同时读取文件的进程数
+        tracer: perf_trace.Tracer，记录读取、转换、合并各阶段耗时和 rows/cells/bytes 计数
+        duplicates: 内容重复的文件，见 iter_excel_frames
+        columns / row_filter: 只合并这些列和满足条件的行，见 read_excel_file
+        parse_cache: 解析结果缓存，见 read_excel_file
+        summary: merge_summary.MergeSummary，每个文件读取后累加分组汇总
+    """
+    if tracer is None:
+        tracer = NULL_TRACER
+    # 存储所有数据框
+    dataframes = []
+    rows_read = 0
+    
+    # 读取每个 Excel 文件
+    frames = iter_excel_frames(excel_files, dtypes=dtypes, reader_engine=reader_engine, jobs=jobs,
+                               tracer=tracer, duplicates=duplicates, columns=columns, row_filter=row_filter,
+                               parse_cache=parse_cache)
+    try:
+        for idx, file_path in enumerate(excel_files, 1):
+            if checkpoint is not None:
+                checkpoint()
+            _, df = next(frames)
+            if isinstance(df, Exception):
+                log(f"读取文件失败 {os.path.basename(file_path)}: {str(df)}")
+            else:
+                dataframes.append(df)
+                if summary is not None:
+                    with tracer.span("merge.summary"):
+                        summary.update_frame(df)
+                rows_read += len(df)
+                tracer.count("rows", len(df))
+                tracer.count("cells", frame_cells(df))
+                tracer.count_file_bytes("input_bytes", file_path)
+                log(f"已读取 [{idx}/{len(excel_files)}]: {os.path.basename(file_path)} - {df.shape[0]} 行, {df.shape[1]} 列")
+            if progress is not None:
+                progress(idx, len(excel_files), rows_read)
+    finally:
+        frames.close()
+    
+    if not dataframes:
+        raise Exception("没有成功读取任何文件")
+    
+    if checkpoint is not None:
+        checkpoint()
+    
+    # 合并所有数据框
+    # 使用 concat 时会自动对齐列名，相同的列会合并，不同的列会保留
+    log("\n正在合并数据...")
+    with tracer.span("merge.concat"):
+        merged_df = pd.concat(dataframes, ignore_index=True, sort=False)
+    if columns is not None:
+        # 按选择的顺序排列（源文件列在最前），与流式合并一致
+        names = {str(column): column for column in merged_df.columns}
+        order = ['源文件'] + [name for name in columns if name in names and name != '源文件']
+        merged_df = merged_df[[names[name] for name in order if name in names]]
+    return merged_df
+
+
+def write_excel(df, output_file, column_widths=None, writer_engine='openpyxl'):
+    """把 DataFrame 写入 Excel 文件，可按 {列名: 宽度} 设置列宽"""
+    if not column_widths:
+        df.to_excel(output_file, index=False, engine=writer_engine)
+        return
+    with pd.ExcelWriter(output_file, engine=writer_engine) as writer:
+        df.to_excel(writer, index=False)
+        ws = writer.sheets[next(iter(writer.sheets))]
+        for idx, column in enumerate(df.columns, 1):
+            if column not in column_widths:
+                continue
+            if writer_engine == 'xlsxwriter':
+                ws.set_column(idx - 1, idx - 1, column_widths[column])
+            else:
+                ws.column_dimensions[get_column_letter(idx)].width = column_widths[column]
+
+
+def output_format_of(output_file):
+    """按扩展名判断输出格式：.csv 为 csv，其他为 xlsx"""
+    return 'csv' if str(output_file).lower().endswith('.csv') else 'xlsx'
+
+
+def write_output(df, output_file, output_format=None, chunk_rows=None, column_widths=None,
+                 writer_engine='openpyxl', tracer=NULL_TRACER):
+    """
+    写出合并结果，返回写出的文件路径列表
+    
+    参数:
+        output_format: 'xlsx' 或 'csv'（UTF-8 带 BOM，Excel 可直接打开），默认按扩展名判断
+        chunk_rows: 每个文件最多的数据行数，超过时写成 名称_1、名称_2 ... 多个文件；
+                    xlsx 格式超过工作表行数上限时也会自动分成多个文件
+    """
+    if output_format is None:
+        output_format = output_format_of(output_file)
+    if output_format == 'xlsx':
+        chunk_rows = min(chunk_rows or EXCEL_MAX_DATA_ROWS, EXCEL_MAX_DATA_ROWS)
+    
+    if not chunk_rows or len(df) <= chunk_rows:
+        parts = [(output_file, df)]
+    else:
+        name, ext = os.path.splitext(output_file)
+        parts = [(f"{name}_{idx}{ext}", df.iloc[start:start + chunk_rows])
+                 for idx, start in enumerate(range(0, len(df), chunk_rows), 1)]
+    
+    for path, part in parts:
+        with tracer.span("merge.write", file=os.path.basename(path)):
+            if output_format == 'csv':
+                part.to_csv(path, index=False, encoding='utf-8-sig')
+            else:
+                write_excel(part, path, column_widths=column_widths, writer_engine=writer_engine)
+        tracer.count_file_bytes("output_bytes", path)
+    return [path for path, _ in parts]
+
+
+class StreamingOutput:
+    """逐行写出合并结果（xlsx 使用 openpyxl write_only），超过行数上限时换到下一个文件"""
+    
+    def __init__(self, output_file, columns, output_format='xlsx', chunk_rows=None, column_widths=None):
+        self.output_file = output_file
+        self.columns = columns
+        self.output_format = output_format
+        self.column_widths = column_widths or {}
+        if output_format == 'xlsx':
+            chunk_rows = min(chunk_rows or EXCEL_MAX_DATA_ROWS, EXCEL_MAX_DATA_ROWS)
+        self.chunk_rows = chunk_rows
+        self.files = []
+        self.part = 0
+        self.rows_in_part = 0
+        self._open_part()
+    
+    def _part_path(self, index):
+        name, ext = os.path.splitext(self.output_file)
+        return f"{name}_{index}{ext}"
+    
+    def _open_part(self):
+        self.part += 1
+        self.rows_in_part = 0
+        if self.output_format == 'csv':
+            path = self.output_file if self.part == 1 else self._part_path(self.part)
+            self._csv_file = open(path, 'w', newline='', encoding='utf-8-sig')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(self.columns)
+        else:
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet('Sheet1')
+            # write_only 模式下列宽必须在写入第一行之前设置
+            for idx, column in enumerate(self.columns, 1):
+                if column in self.column_widths:
+                    self._sheet.column_dimensions[get_column_letter(idx)].width = self.column_widths[column]
+            self._sheet.append(self.columns)
+    
+    def _close_part(self, last):
+        # 只有一个文件时使用原文件名，分成多个文件时依次为 名称_1、名称_2 ...
+        single = last and self.part == 1
+        path = self.output_file if single else self._part_path(self.part)
+        if self.output_format == 'csv':
+            self._csv_file.close()
+            if self.part == 1 and not single:
+                os.replace(self.output_file, path)
+        else:
+            self._workbook.save(path)
+            self._workbook = self._sheet = None
+        self.files.append(path)
+    
+    def write_row(self, values):
+        if self.chunk_rows and self.rows_in_part >= self.chunk_rows:
+            self._close_part(last=False)
+            self._open_part()
+        if self.output_format == 'csv':
+            self._csv_writer.writerow(values)
+        else:
+            self._sheet.append(values)
+        self.rows_in_part += 1
+    
+    def close(self):
+        """写完最后一个文件，返回写出的文件路径列表"""
+        self._close_part(last=True)
+        return self.files
+
+
+def read_file_header(file_path):
+    """只读取文件的第一行作为列名（与 pandas 读取时的列名一致）"""
+    if str(file_path).lower().endswith(('.xlsx', '.xlsm')) or is_csv_file(file_path):
+        with open_sheet_source(file_path) as source:
+            first = next(source.iter_rows(), None)
+        return column_names(first[1]) if first else []
+    return [str(c) for c in pd.read_excel(file_path, header=0, nrows=0).columns]
+
+
+def iter_file_rows(file_path, columns=None, row_filter=None, predicate_columns=None):
+    """
+    逐行读取第一行之后的数据；xlsx 和 CSV / TSV 流式解析，其他格式（如 .xls）整个读入后逐行生成
+    
+    columns / row_filter / predicate_columns: 只读取这些列（列号从1开始）、只生成满足条件的行，
+    见 row_filter.project；xlsx 在解析时筛选，不需要的单元格不转换
+    """
+    predicate = row_filter.predicate if row_filter is not None else None
+    if str(file_path).lower().endswith(('.xlsx', '.xlsm')) or is_csv_file(file_path):
+        with open_sheet_source(file_path) as source:
+            # 第一个有内容的行是表头（与 read_file_header 一致）
+            first_rows = source.iter_rows()
+            header = next(first_rows, None)
+            first_rows.close()
+            if header is None:
+                return
+            rows = source.iter_rows(min_row=header[0] + 1, columns=columns, predicate=predicate,
+                                    predicate_columns=predicate_columns)
+            for _, values in rows:
+                yield values
+        return
+    df = pd.read_excel(file_path, header=0)
+    df = df.astype(object).where(df.notna(), None)
+    for values in df.itertuples(index=False, name=None):
+        if predicate is not None and not predicate(pick(values, predicate_columns)):
+            continue
+        yield pick(values, columns) if columns is not None else list(values)
+
+
+def read_merged_columns(excel_files, log=print, tracer=NULL_TRACER, columns=None):
+    """
+    读取所有文件的表头，确定合并后的列（顺序与 pandas concat 相同）
+    
+    columns: 只合并这些列时，合并后的列为源文件列加上这些列（按此顺序，所有文件中都没有的列除外）
+    
+    返回:
+        ({文件路径: 列名列表}（不含读取失败的文件）, 合并后的列名列表, {列名: 列序号})
+    """
+    headers = {}
+    with tracer.span("merge.headers"):
+        for file_path in excel_files:
+            try:
+                headers[file_path] = read_file_header(file_path)
+            except Exception as e:
+                log(f"读取文件失败 {os.path.basename(file_path)}: {str(e)}")
+    if not headers:
+        raise Exception("没有成功读取任何文件")
+    
+    merged = []
+    positions = {}
+    for file_path, header in headers.items():
+        if columns is not None:
+            header = project(header, columns)[0]
+        names = header if '源文件' in header else ['源文件'] + header
+        for name in names:
+            if name not in positions:
+                positions[name] = len(merged)
+                merged.append(name)
+    if columns is not None:
+        missing = [name for name in columns if name not in positions]
+        if missing:
+            log(f"警告: 所有文件中都没有这些列: {', '.join(map(str, missing))}")
+        # 按选择的顺序排列（源文件列在最前）
+        merged = ['源文件'] + [name for name in columns if name in positions and name != '源文件']
+        positions = {name: idx for idx, name in enumerate(merged)}
+    return headers, merged, positions
+
+
+def merge_excel_streaming(excel_files, output_file, log=print, progress=None, checkpoint=None,
+                          column_widths=None, output_format=None, chunk_rows=None, tracer=NULL_TRACER,
+                          columns=None, row_filter=None, summary=None):
+    """
+    流式合并：逐行读取、逐行写出，内存占用与数据量基本无关
+    
+    先读取所有文件的表头确定合并后的列（顺序与 pandas concat 相同），再逐个文件写出；
+    单元格保持读取到的类型，不做 dtypes 转换，没有内容的行不写出。
+    columns / row_filter: 只合并这些列和满足条件的行，在解析时筛选（见 iter_file_rows）
+    summary: merge_summary.MergeSummary，每写出一行累加分组汇总
+    
+    返回:
+        (写出的数据行数, 列名列表, 写出的文件路径列表)
+    """
+    if output_format is None:
+        output_format = output_format_of(output_file)
+    
+    # 先读取各文件表头
+    selection = columns
+    headers, columns, positions = read_merged_columns(excel_files, log=log, tracer=tracer, columns=selection)
+    
+    output = StreamingOutput(output_file, columns, output_format, chunk_rows, column_widths)
+    update_summary = summary.bind(columns) if summary is not None else None
+    rows_written = 0
+    try:
+        for idx, file_path in enumerate(excel_files, 1):
+            if checkpoint is not None:
+                checkpoint()
+            header = headers.get(file_path)
+            if header is not None:
+                source_name = os.path.basename(file_path)
+                indices = predicate_indices = None
+                if selection is not None or row_filter is not None:
+                    header, indices, predicate_indices = project(header, selection, row_filter)
+                targets = [positions[name] for name in header]
+                add_source = '源文件' not in header
+                file_rows = 0
+                try:
+                    with tracer.span("merge.stream_file", file=source_name):
+                        for values in iter_file_rows(file_path, indices, row_filter, predicate_indices):
+                            if indices is not None and all(value is None for value in values):
+                                continue  # 选择的列都没有内容
+                            row = [None] * len(columns)
+                            for target, value in zip(targets, values):
+                                row[target] = value
+                            if add_source:
+                                row[0] = source_name
+                            output.write_row(row)
+                            if update_summary is not None:
+                                update_summary(row)
+                            file_rows += 1
+                            if checkpoint is not None and file_rows % 1000 == 0:
+                                checkpoint()
+                    log(f"已读取 [{idx}/{len(excel_files)}]: {source_name} - {file_rows} 行, {len(header)} 列")
+                except Exception as e:
+                    # 已写出的行无法撤回
+                    log(f"读取文件失败 {source_name}（已写出 {file_rows} 行）: {str(e)}")
+                rows_written += file_rows
+                tracer.count("rows", file_rows)
+                tracer.count("cells", file_rows * len(header))
+                tracer.count_file_bytes("input_bytes", file_path)
+            if progress is not None:
+                progress(idx, len(excel_files), rows_written)
+    finally:
+        with tracer.span("merge.write"):
+            output_files = output.close()
+    for path in output_files:
+        tracer.count_file_bytes("output_bytes", path)
+    return rows_written, columns, output_files
+
+
+def write_summary(summary, output_file, output_format=None, log=print, tracer=NULL_TRACER):
+    """写出合并时累加的分组汇总（summary 为 None 时不做任何事），返回写出的文件路径列表"""
+    if summary is None:
+        return []
+    with tracer.span("merge.summary_write"):
+        files = summary.write(output_file, output_format)
+    log(f"分组汇总 {summary.group_count} 组，已保存到: {', '.join(os.path.basename(f) for f in files)}")
+    return files
+
+
+@calibration_job()
+def merge_excel_files(data_dir, output_file, log=print, progress=None, checkpoint=None,
+                      dtypes=None, column_widths=None, reader_engine=None, writer_engine='openpyxl',
+                      output_format=None, chunk_rows=None, jobs=1, tracer=None,
+                      engine=ENGINE_AUTO, memory_budget=None, memory_report=None,
+                      pipeline=False, prefetch=2, pipeline_report=None, duplicates=DUPLICATES_REUSE,
+                      columns=None, where=None, staging=None, sort_by=None, descending=False, dedup_rows=None,
+                      parse_cache=None, summaries=None, key_columns=None, keep="last", timestamp_column=None,
+                      upsert_report=None):
     """
     合并 data 文件夹下的所有 Excel 文件
     
     参数:
-        data_dir: 包含 Excel 文件的目录路径
+        data_dir: 包含 Excel 文件的目录路径，也可以是文件和目录组成的列表
         output_file: 输出合并后的 Excel 文件路径
+        log / progress / checkpoint / dtypes / reader_engine / jobs / tracer: 见 merge_dataframes
+        column_widths: {列名: 宽度}，输出文件的列宽（可由 profile_excel.column_widths 得到）
+        writer_engine / output_format / chunk_rows: 见 write_output
+        engine: 'memory' 用 pandas 在内存中合并，'streaming' 见 merge_excel_streaming，
+                'auto' 按内存预算选择
+        memory_budget: 内存预算（字节），见 memory_budget.plan_memory
+        memory_report: 指定处理方式或预算时，结束后以 MemoryPlan.to_dict() 调用
+        pipeline: 在内存中处理时改用流水线合并（见 merge_pipeline.py），预读、解析、写出同时进行，
+                  不把所有文件合并成一个 DataFrame；jobs 此时不起作用
+        prefetch: 流水线合并时最多提前读入内存的文件数
+        pipeline_report: 流水线合并结束后以各阶段统计调用
+        duplicates: 内容完全相同的输入文件的处理方式（见 file_dedup.py）：'reuse' 只解析一次，
+                    重复的文件使用已解析的数据（默认）；'skip' 跳过并输出警告；'keep' 不检测
+        columns: 只合并这些列（列名列表），源文件列总在最前；默认全部列
+        where: 筛选条件（见 row_filter.py），如 '状态 == "已完成"'，只合并满足条件的行
+        staging: 通过 SQLite 暂存合并（见 sqlite_staging.py）：暂存文件路径，保留供以后导出；
+                 True 使用临时暂存文件。指定 sort_by 或 dedup_rows 时也使用暂存合并
+        sort_by / descending: 按这些列排序（列名列表），descending 为 True 时从大到小
+        dedup_rows: True 按除源文件外的所有列去重，列名列表按这些列去重，只保留第一行
+        parse_cache: parse_cache.ParseCache，在内存中合并和流水线合并时缓存各文件的解析结果，
+                     内容相同的文件再次合并时不再解析；流式合并和暂存合并逐行读取，不使用缓存
+        summaries: 分组汇总定义（见 merge_summary.py），合并时逐个文件或逐行累加，
+                   结束后写到“输出名_汇总.xlsx”（csv 输出时为“输出名_汇总.csv”），不需要再读一遍结果
+        key_columns: 按这些键列去重合并（见 merge_upsert.py），同一个键只保留一行；逐行读取，一遍完成，
+                     不能与 staging / sort_by / dedup_rows 同时使用
+        keep / timestamp_column: 键重复时保留的行：'first' 第一次出现的、'last' 最后出现的（默认）、
+                                 'latest' timestamp_column 最新的
+        upsert_report: 按键去重结束后以 UpsertReport.to_dict() 调用（每个文件覆盖和被覆盖的行数）
+    
+    返回:
+        合并后的 DataFrame；流式合并、流水线合并或暂存合并时为 None
     """
+    if tracer is None:
+        tracer = NULL_TRACER
+    plan = sampler = None
+    row_filter = make_row_filter(where)
+    summary = MergeSummary(summaries) if summaries else None
+    if key_columns and (staging or sort_by or dedup_rows):
+        raise ValueError("按键去重不能与暂存合并、排序或按行去重同时使用")
+    start = time.perf_counter()
+    
+    def record(engine_name, rows, column_count, output_files, workers=1, input_rows=None):
+        # 校准 job_planner 的用时估算；input_rows 为读取的行数（与写出的行数不同时）
+        cells = rows * column_count
+        input_cells = cells if input_rows is None else input_rows * column_count
+        record_run("merge", engine_name, time.perf_counter() - start, input_cells, cells, len(excel_files),
+                   len(output_files), workers, output_format or output_format_of(output_file))
+    
     try:
         # 获取所有 Excel 文件
-        excel_files = []
-        for file in os.listdir(data_dir):
-            if file.endswith('.xlsx') or file.endswith('.xls'):
-                excel_files.append(os.path.join(data_dir, file))
+        excel_files = collect_excel_files(data_dir)
         
         if not excel_files:
-            print("data 文件夹下没有找到 Excel 文件")
-            return
+            raise Exception("文件夹下没有找到 Excel 文件")
         
-        print(f"找到 {len(excel_files)} 个 Excel 文件")
+        log(f"找到 {len(excel_files)} 个 Excel 文件")
+        if columns is not None:
+            log(f"只合并 {len(columns)} 列: {', '.join(map(str, columns))}")
+        if row_filter is not None:
+            log(f"筛选条件: {row_filter.expression}")
         
-        # 存储所有数据框
-        dataframes = []
+        duplicate_files = {}
+        if duplicates != DUPLICATES_KEEP:
+            with tracer.span("merge.dedup"):
+                duplicate_files = find_duplicates(excel_files)
+            tracer.count("duplicate_files", len(duplicate_files))
+            for file_path, original in duplicate_files.items():
+                if duplicates == DUPLICATES_SKIP:
+                    log(f"警告: {os.path.basename(file_path)} 与 {os.path.basename(original)} 内容相同，已跳过")
+                else:
+                    log(f"{os.path.basename(file_path)} 与 {os.path.basename(original)} 内容相同，使用已读取的数据")
+            if duplicates == DUPLICATES_SKIP:
+                excel_files = [f for f in excel_files if f not in duplicate_files]
+                duplicate_files = {}
         
-        # 读取每个 Excel 文件
-        for idx, file_path in enumerate(excel_files, 1):
-            try:
-                # 读取 Excel 文件，使用第一行作为列名
-                df = pd.read_excel(file_path, header=0)
-                
-                # 添加源文件名列，用于追踪数据来源
-                if '源文件' not in df.columns:
-                    df.insert(0, '源文件', os.path.basename(file_path))
-                
-                dataframes.append(df)
-                print(f"已读取 [{idx}/{len(excel_files)}]: {os.path.basename(file_path)} - {df.shape[0]} 行, {df.shape[1]} 列")
-                
-            except Exception as e:
-                print(f"读取文件失败 {os.path.basename(file_path)}: {str(e)}")
-                continue
+        if key_columns:
+            from merge_upsert import merge_excel_upsert, KEEP_FIRST
+            if engine != ENGINE_AUTO or memory_budget:
+                # 逐行读取和写出；keep='first' 只记住键，其他方式最多保留所有行，按读入内存估算
+                plan = plan_memory("merge_upsert", excel_files, memory_budget,
+                                   ENGINE_STREAMING if keep == KEEP_FIRST else ENGINE_MEMORY)
+                log(plan.describe())
+                sampler = MemorySampler().start()
+            log(f"正在按键去重合并到: {output_file}")
+            rows, columns, output_files, report = merge_excel_upsert(
+                excel_files, output_file, key_columns, keep=keep, timestamp_column=timestamp_column, log=log,
+                progress=progress, checkpoint=checkpoint, column_widths=column_widths, output_format=output_format,
+                chunk_rows=chunk_rows, tracer=tracer, columns=columns, row_filter=row_filter, summary=summary)
+            log(f"\n合并完成!")
+            log(report.describe())
+            log(f"总行数: {rows}")
+            log(f"总列数: {len(columns)}")
+            if len(output_files) > 1:
+                log(f"已分成 {len(output_files)} 个文件: {[os.path.basename(f) for f in output_files]}")
+            write_summary(summary, output_file, output_format, log=log, tracer=tracer)
+            log("保存完成!")
+            if upsert_report is not None:
+                upsert_report(report.to_dict())
+            # 读取和写出的方式与流式合并相同
+            record(ENGINE_STREAMING, rows, len(columns), output_files, input_rows=report.rows_read)
+            return None
         
-        if not dataframes:
-            print("没有成功读取任何文件")
-            return
+        if staging or sort_by or dedup_rows:
+            from sqlite_staging import merge_excel_staged
+            staging_file = staging if isinstance(staging, (str, os.PathLike)) else None
+            log(f"正在通过暂存库合并到: {output_file}")
+            rows, columns, output_files = merge_excel_staged(
+                excel_files, output_file, staging_file=staging_file, log=log, progress=progress,
+                checkpoint=checkpoint, column_widths=column_widths, output_format=output_format,
+                chunk_rows=chunk_rows, tracer=tracer, columns=columns, row_filter=row_filter,
+                sort_by=sort_by, descending=descending, dedup_rows=dedup_rows, summary=summary)
+            log(f"\n合并完成!")
+            log(f"总行数: {rows}")
+            log(f"总列数: {len(columns)}")
+            if len(output_files) > 1:
+                log(f"已分成 {len(output_files)} 个文件: {[os.path.basename(f) for f in output_files]}")
+            write_summary(summary, output_file, output_format, log=log, tracer=tracer)
+            log("保存完成!")
+            if not isinstance(staging, (str, os.PathLike)):
+                # 保留的暂存文件中未变化的文件不再读取，不参与校准
+                record(ENGINE_STAGED, rows, len(columns), output_files)
+            return None
         
-        # 合并所有数据框
-        # 使用 concat 时会自动对齐列名，相同的列会合并，不同的列会保留
-        print("\n正在合并数据...")
-        merged_df = pd.concat(dataframes, ignore_index=True, sort=False)
+        if engine != ENGINE_AUTO or memory_budget:
+            plan = plan_memory("merge", excel_files, memory_budget, engine)
+            log(plan.describe())
+            sampler = MemorySampler().start()
+        
+        if plan is not None and plan.engine == ENGINE_STREAMING:
+            log(f"正在流式合并到: {output_file}")
+            rows, columns, output_files = merge_excel_streaming(
+                excel_files, output_file, log=log, progress=progress, checkpoint=checkpoint,
+                column_widths=column_widths, output_format=output_format, chunk_rows=chunk_rows,
+                tracer=tracer, columns=columns, row_filter=row_filter, summary=summary)
+            log(f"\n合并完成!")
+            log(f"总行数: {rows}")
+            log(f"总列数: {len(columns)}")
+            if len(output_files) > 1:
+                log(f"已分成 {len(output_files)} 个文件: {[os.path.basename(f) for f in output_files]}")
+            write_summary(summary, output_file, output_format, log=log, tracer=tracer)
+            log("保存完成!")
+            record(ENGINE_STREAMING, rows, len(columns), output_files)
+            return None
+        
+        if pipeline:
+            from merge_pipeline import merge_excel_pipeline
+            log(f"正在流水线合并到: {output_file}")
+            rows, columns, output_files, report = merge_excel_pipeline(
+                excel_files, output_file, log=log, progress=progress, checkpoint=checkpoint,
+                dtypes=dtypes, column_widths=column_widths, reader_engine=reader_engine,
+                output_format=output_format, chunk_rows=chunk_rows, prefetch=prefetch, tracer=tracer,
+                duplicates=duplicate_files, columns=columns, row_filter=row_filter,
+                parse_cache=parse_cache, summary=summary)
+            if pipeline_report is not None:
+                pipeline_report(report)
+            log(f"\n合并完成!")
+            log(f"总行数: {rows}")
+            log(f"总列数: {len(columns)}")
+            if len(output_files) > 1:
+                log(f"已分成 {len(output_files)} 个文件: {[os.path.basename(f) for f in output_files]}")
+            write_summary(summary, output_file, output_format, log=log, tracer=tracer)
+            log("保存完成!")
+            if parse_cache is None:
+                record(ENGINE_PIPELINE, rows, len(columns), output_files)
+            return None
+        
+        merged_df = merge_dataframes(excel_files, log=log, progress=progress, checkpoint=checkpoint,
+                                     dtypes=dtypes, reader_engine=reader_engine, jobs=jobs,
+                                     tracer=tracer, duplicates=duplicate_files, columns=columns,
+                                     row_filter=row_filter, parse_cache=parse_cache, summary=summary)
         
         # 统计信息
-        print(f"\n合并完成!")
-        print(f"总行数: {len(merged_df)}")
-        print(f"总列数: {len(merged_df.columns)}")
-        print(f"列名: {list(merged_df.columns)}")
+        log(f"\n合并完成!")
+        log(f"总行数: {len(merged_df)}")
+        log(f"总列数: {len(merged_df.columns)}")
+        log(f"列名: {list(merged_df.columns)}")
+        
+        if checkpoint is not None:
+            checkpoint()
         
         # 保存合并后的文件
-        print(f"\n正在保存到: {output_file}")
-        merged_df.to_excel(output_file, index=False, engine='openpyxl')
-        print("保存完成!")
+        log(f"\n正在保存到: {output_file}")
+        output_files = write_output(merged_df, output_file, output_format=output_format,
+                                    chunk_rows=chunk_rows, column_widths=column_widths,
+                                    writer_engine=writer_engine, tracer=tracer)
+        if len(output_files) > 1:
+            log(f"已分成 {len(output_files)} 个文件: {[os.path.basename(f) for f in output_files]}")
+        write_summary(summary, output_file, output_format, log=log, tracer=tracer)
+        log("保存完成!")
+        if parse_cache is None:
+            record(ENGINE_MEMORY, len(merged_df), len(merged_df.columns), output_files, jobs)
+        return merged_df
         
     except Exception as e:
-        print(f"处理过程中出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log(f"处理过程中出错: {str(e)}")
+        raise
+    finally:
+        if plan is not None:
+            sampler.stop()
+            plan.finish(sampler)
+            if memory_report is not None:
+                memory_report(plan.to_dict())
 
 if __name__ == "__main__":
     # 获取当前脚本所在目录
@@ -0,0 +1,293 @@
+"""
+流水线合并 - 预读、解析、写出三个阶段同时进行
+
+    预读  prefetch 线程按顺序把后面的文件内容读入内存（最多提前 prefetch 个文件），
+          从网络共享盘读取时解析不用等磁盘
+    解析  parse 线程用 pandas 解析内存中的文件内容（列类型和 dtypes 转换与内存合并相同）
+    写出  调用线程把解析好的数据逐个文件追加到输出，后面的文件同时在预读和解析
+
+阶段之间用有界队列连接，内存中最多同时有 prefetch 个文件内容和 queue_size 个 DataFrame。
+每个阶段记录忙碌时间和等待时间，结束后报告各阶段占用率（忙碌时间 / 总时间），
+占用率最高的阶段就是瓶颈：预读高说明磁盘慢，解析高说明 CPU 慢，写出高说明输出慢。
+"""
+
+import os
+import time
+import queue
+import threading
+
+from perf_trace import NULL_TRACER
+from merge_excel import read_excel_file, read_merged_columns, output_format_of, frame_cells, StreamingOutput
+from file_dedup import FrameCache
+
+DEFAULT_PREFETCH = 2
+DEFAULT_QUEUE_SIZE = 2
+
+# 队列阻塞时检查停止信号的间隔（秒）
+POLL_INTERVAL = 0.1
+
+STAGES = ("prefetch", "parse", "write")
+STAGE_LABELS = {"prefetch": "预读", "parse": "解析", "write": "写出"}
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """流水线已停止"""
+
+
+class StageStats:
+    """一个阶段处理的文件数、忙碌时间和等待时间"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait_input = 0.0   # 等待上一阶段
+        self.wait_output = 0.0  # 等待下一阶段取走（队列已满）
+
+    def to_dict(self, elapsed):
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy, 4),
+            "wait_input_seconds": round(self.wait_input, 4),
+            "wait_output_seconds": round(self.wait_output, 4),
+            "occupancy": round(self.busy / elapsed, 3) if elapsed > 0 else 0.0,
+        }
+
+
+class MergePipeline:
+    """
+    预读和解析在后台线程中运行，按输入顺序生成 (文件路径, DataFrame 或读取时的异常)
+
+        pipeline = MergePipeline(excel_files).start()
+        try:
+            for file_path, df in pipeline:
+                ...  # 写出阶段，忙碌时间加到 pipeline.stats["write"].busy
+        finally:
+            pipeline.close()
+    """
+
+    def __init__(self, excel_files, dtypes=None, reader_engine=None, prefetch=DEFAULT_PREFETCH,
+                 queue_size=DEFAULT_QUEUE_SIZE, tracer=NULL_TRACER, duplicates=None, columns=None,
+                 row_filter=None, parse_cache=None):
+        if prefetch < 1 or queue_size < 1:
+            raise ValueError("预读文件数和队列长度必须大于0")
+        self.excel_files = list(excel_files)
+        self.dtypes = dtypes
+        self.reader_engine = reader_engine
+        self.columns = columns
+        self.row_filter = row_filter
+        self.parse_cache = parse_cache
+        self.tracer = tracer
+        # 内容重复的文件不预读也不解析，使用前一个文件的数据（见 file_dedup.py）
+        self.duplicates = duplicates or {}
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.start_time = None
+        self.elapsed = 0.0
+        self._raw = queue.Queue(maxsize=prefetch)
+        self._parsed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = []
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        for name, target in (("prefetch", self._prefetch), ("parse", self._parse)):
+            thread = threading.Thread(target=self._run_stage, args=(target,), name=f"merge-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run_stage(self, target):
+        try:
+            target()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            # 意外的错误（如内存不足）交给调用线程抛出
+            self._error = e
+            self._stop.set()
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        try:
+            while True:
+                if self._stop.is_set():
+                    raise _Stopped()
+                try:
+                    q.put(item, timeout=POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+        finally:
+            stats.wait_output += time.perf_counter() - start
+
+    def _get(self, q, stats):
+        start = time.perf_counter()
+        try:
+            while True:
+                if self._stop.is_set():
+                    raise _Stopped()
+                try:
+                    return q.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+        finally:
+            stats.wait_input += time.perf_counter() - start
+
+    def _prefetch(self):
+        stats = self.stats["prefetch"]
+        for file_path in self.excel_files:
+            if file_path in self.duplicates:
+                self._put(self._raw, (file_path, None), stats)
+                continue
+            start = time.perf_counter()
+            with self.tracer.span("merge.prefetch", file=os.path.basename(file_path)):
+                try:
+                    with open(file_path, "rb") as f:
+                        data = f.read()
+                except OSError as e:
+                    data = e
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+            self._put(self._raw, (file_path, data), stats)
+        self._put(self._raw, _DONE, stats)
+
+    def _parse(self):
+        stats = self.stats["parse"]
+        cache = FrameCache(self.duplicates)
+        while True:
+            item = self._get(self._raw, stats)
+            if item is _DONE:
+                self._put(self._parsed, _DONE, stats)
+                return
+            file_path, data = item
+            start = time.perf_counter()
+            if file_path in self.duplicates:
+                result = cache.take(file_path)
+            elif isinstance(data, Exception):
+                result = data
+            else:
+                try:
+                    result = read_excel_file(file_path, self.dtypes, self.reader_engine, self.tracer, data=data,
+                                             columns=self.columns, row_filter=self.row_filter,
+                                             parse_cache=self.parse_cache)
+                except Exception as e:
+                    result = e
+                cache.store(file_path, result)
+            # 解析完就释放文件内容
+            item = data = None
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+            self._put(self._parsed, (file_path, result), stats)
+
+    def __iter__(self):
+        stats = self.stats["write"]
+        while True:
+            try:
+                item = self._get(self._parsed, stats)
+            except _Stopped:
+                if self._error is not None:
+                    raise self._error
+                return
+            if item is _DONE:
+                return
+            stats.items += 1
+            yield item
+
+    def close(self):
+        """停止后台线程（取消时不再等待还没处理的文件）"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.start_time is not None:
+            self.elapsed = time.perf_counter() - self.start_time
+
+    def report(self):
+        """各阶段统计和瓶颈阶段"""
+        elapsed = self.elapsed or (time.perf_counter() - self.start_time if self.start_time else 0.0)
+        stages = {name: stats.to_dict(elapsed) for name, stats in self.stats.items()}
+        bottleneck = max(STAGES, key=lambda name: self.stats[name].busy)
+        return {"elapsed_seconds": round(elapsed, 4), "stages": stages, "bottleneck": bottleneck}
+
+    def format_report(self):
+        """各阶段占用率，用于日志"""
+        report = self.report()
+        parts = [f"{STAGE_LABELS[name]} {stage['occupancy']:.0%}" for name, stage in report["stages"].items()]
+        return f"流水线各阶段占用: {', '.join(parts)}（瓶颈: {STAGE_LABELS[report['bottleneck']]}）"
+
+
+def merge_excel_pipeline(excel_files, output_file, log=print, progress=None, checkpoint=None, dtypes=None,
+                         column_widths=None, reader_engine=None, output_format=None, chunk_rows=None,
+                         prefetch=DEFAULT_PREFETCH, queue_size=DEFAULT_QUEUE_SIZE, tracer=NULL_TRACER,
+                         duplicates=None, columns=None, row_filter=None, parse_cache=None, summary=None):
+    """
+    流水线合并：预读、解析与写出同时进行，每个文件解析完就追加到输出
+
+    先读取所有文件的表头确定合并后的列（与 merge_excel_streaming 相同），
+    数据用 pandas 解析（与内存合并相同），写出时不需要把所有文件放在内存中合并。
+    duplicates: 内容重复的文件，见 merge_excel.iter_excel_frames
+    columns / row_filter: 只合并这些列和满足条件的行，见 merge_excel.read_excel_file
+    parse_cache: 解析结果缓存，见 merge_excel.read_excel_file（命中时仍预读文件内容，用于计算内容哈希）
+    summary: merge_summary.MergeSummary，每个文件写出后累加分组汇总
+
+    返回:
+        (写出的数据行数, 列名列表, 写出的文件路径列表, 各阶段统计)
+    """
+    if output_format is None:
+        output_format = output_format_of(output_file)
+
+    selection = columns
+    headers, columns, positions = read_merged_columns(excel_files, log=log, tracer=tracer, columns=selection)
+
+    pipeline = MergePipeline(list(headers), dtypes=dtypes, reader_engine=reader_engine,
+                             prefetch=prefetch, queue_size=queue_size, tracer=tracer, duplicates=duplicates,
+                             columns=selection, row_filter=row_filter, parse_cache=parse_cache)
+    write_stats = pipeline.stats["write"]
+    output = StreamingOutput(output_file, columns, output_format, chunk_rows, column_widths)
+    rows_written = 0
+    try:
+        pipeline.start()
+        for idx, (file_path, df) in enumerate(pipeline, 1):
+            if checkpoint is not None:
+                checkpoint()
+            source_name = os.path.basename(file_path)
+            if isinstance(df, Exception):
+                log(f"读取文件失败 {source_name}: {str(df)}")
+            else:
+                start = time.perf_counter()
+                with tracer.span("merge.write_block", file=source_name):
+                    # 不修改 df 本身：重复文件可能还要使用同一个 DataFrame
+                    block = df.astype(object)
+                    block.columns = [str(column) for column in block.columns]
+                    unknown = [column for column in block.columns if column not in positions]
+                    if unknown:
+                        log(f"警告: {source_name} 的列 {unknown} 与表头不一致，已忽略")
+                    block = block.reindex(columns=columns)
+                    block = block.where(block.notna(), None)
+                    for row_count, values in enumerate(block.itertuples(index=False, name=None), 1):
+                        output.write_row(values)
+                        if checkpoint is not None and row_count % 1000 == 0:
+                            checkpoint()
+                write_stats.busy += time.perf_counter() - start
+                if summary is not None:
+                    with tracer.span("merge.summary", file=source_name):
+                        summary.update_frame(df)
+                rows_written += len(df)
+                tracer.count("rows", len(df))
+                tracer.count("cells", frame_cells(df))
+                tracer.count_file_bytes("input_bytes", file_path)
+                log(f"已读取 [{idx}/{len(headers)}]: {source_name} - {df.shape[0]} 行, {df.shape[1]} 列")
+            df = block = None
+            if progress is not None:
+                progress(idx, len(headers), rows_written)
+    finally:
+        pipeline.close()
+        with tracer.span("merge.write"):
+            output_files = output.close()
+    for path in output_files:
+        tracer.count_file_bytes("output_bytes", path)
+    log(pipeline.format_report())
+    return rows_written, columns, output_files, pipeline.report()
@@ -0,0 +1,317 @@
+"""
+合并时的分组汇总 - 数据经过时逐个文件（流式合并时逐行）累加，合并结束后写出汇总表，不需要再读一遍结果
+
+汇总定义（JSON，可以有多个）:
+    [
+        {"name": "按文件", "group_by": ["源文件"], "values": {"金额": ["sum", "mean"]}},
+        {"name": "按部门", "group_by": ["部门", "城市"], "values": {"金额": ["sum", "min", "max"], "编号": ["count"]}}
+    ]
+
+统计方式: sum 合计、count 非空个数、mean 平均值、min 最小值、max 最大值；每个汇总都有“行数”列。
+sum / mean 只计算数字，文字不计入；min / max 可用于数字或日期。分组列为空的行归入空值一组。
+
+内存只保存每组的累加值（个数、合计、最小、最大），与行数无关。
+"""
+
+import os
+import json
+import math
+import datetime
+
+import pandas as pd
+
+AGGREGATES = {
+    "sum": "合计",
+    "count": "计数",
+    "mean": "平均值",
+    "min": "最小值",
+    "max": "最大值",
+}
+
+ROW_COUNT_COLUMN = "行数"
+
+SOURCE_COLUMN = "源文件"
+
+
+def normalize_key(value):
+    # pandas 读取时空值为 NaN / NaT，整数列有空值时变成小数；统一后不同文件的同一个值归入同一组
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    if value.__class__.__name__ == "NaTType":
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and not \
+        (isinstance(value, float) and math.isnan(value))
+
+
+def validate_summaries(definitions):
+    """检查汇总定义，有问题时抛出 ValueError；返回补全名称后的定义列表"""
+    if isinstance(definitions, dict):
+        definitions = [definitions]
+    if not isinstance(definitions, list) or not definitions:
+        raise ValueError("汇总定义必须是 JSON 对象或对象列表")
+    result = []
+    for idx, definition in enumerate(definitions, 1):
+        if not isinstance(definition, dict):
+            raise ValueError(f"汇总定义必须是 JSON 对象: {definition}")
+        unknown = set(definition) - {"name", "group_by", "values"}
+        if unknown:
+            raise ValueError(f"汇总定义中有未知的字段: {', '.join(sorted(unknown))}")
+        group_by = definition.get("group_by")
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        if not group_by or not all(isinstance(name, str) for name in group_by):
+            raise ValueError(f"汇总定义缺少分组列 group_by: {definition}")
+        values = definition.get("values") or {}
+        if not isinstance(values, dict):
+            raise ValueError(f"汇总定义的 values 必须是 {{列名: [统计方式, ...]}}: {definition}")
+        normalized = {}
+        for column, functions in values.items():
+            if isinstance(functions, str):
+                functions = [functions]
+            unknown = [f for f in functions if f not in AGGREGATES]
+            if unknown:
+                raise ValueError(f"不支持的统计方式: {', '.join(map(str, unknown))}（可用 {', '.join(AGGREGATES)}）")
+            normalized[column] = list(functions)
+        name = definition.get("name") or f"汇总{idx}"
+        result.append({"name": str(name), "group_by": list(group_by), "values": normalized})
+    names = [definition["name"] for definition in result]
+    if len(set(names)) != len(names):
+        raise ValueError("汇总名称不能重复")
+    return result
+
+
+def load_summaries(path):
+    """从 JSON 文件读取汇总定义"""
+    with open(path, encoding="utf-8") as f:
+        return validate_summaries(json.load(f))
+
+
+def parse_summary_spec(group_by, aggregates):
+    """
+    命令行写法转换成汇总定义
+
+    group_by: "部门,城市"
+    aggregates: ["金额:sum,mean", "编号:count"]
+    """
+    values = {}
+    for spec in aggregates or []:
+        column, sep, functions = spec.rpartition(":")
+        if not sep or not column.strip():
+            raise ValueError(f"统计写法应为 列名:统计方式，如 金额:sum,mean: {spec}")
+        values.setdefault(column.strip(), []).extend(f.strip() for f in functions.split(",") if f.strip())
+    group_columns = [name.strip() for name in group_by.split(",") if name.strip()]
+    return validate_summaries([{"name": "汇总", "group_by": group_columns, "values": values}])
+
+
+class _Accumulator:
+    """一组中一列的累加值"""
+
+    __slots__ = ("count", "numbers", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0      # 非空个数
+        self.numbers = 0    # 数字个数（用于平均值）
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return
+        self.count += 1
+        if _is_number(value):
+            self.numbers += 1
+            self.total += value
+        elif not isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return
+        self._extend(value, value)
+
+    def _extend(self, low, high):
+        try:
+            if self.minimum is None or low < self.minimum:
+                self.minimum = low
+            if self.maximum is None or high > self.maximum:
+                self.maximum = high
+        except TypeError:
+            pass  # 数字和日期混在一列时不比较
+
+    def merge(self, count, numbers, total, low, high):
+        self.count += count
+        self.numbers += numbers
+        self.total += total
+        if low is not None:
+            self._extend(low, high)
+
+    def result(self, function):
+        if function == "count":
+            return self.count
+        if function == "sum":
+            return self.total if self.numbers else None
+        if function == "mean":
+            return self.total / self.numbers if self.numbers else None
+        return self.minimum if function == "min" else self.maximum
+
+
+class GroupSummary:
+    """一个汇总定义的累加状态"""
+
+    def __init__(self, definition):
+        self.name = definition["name"]
+        self.group_by = definition["group_by"]
+        self.values = definition["values"]
+        self.groups = {}  # {分组值: [行数, {列名: _Accumulator}]}
+
+    def _group(self, key):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, {column: _Accumulator() for column in self.values}]
+        return group
+
+    def bind(self, columns):
+        """按合并后的列名返回逐行累加的函数 update(row)"""
+        positions = {name: idx for idx, name in enumerate(columns)}
+        key_positions = [positions.get(name) for name in self.group_by]
+        value_positions = [(column, positions.get(column)) for column in self.values]
+
+        def update(row):
+            key = tuple(normalize_key(row[idx]) if idx is not None else None for idx in key_positions)
+            group = self._group(key)
+            group[0] += 1
+            accumulators = group[1]
+            for column, idx in value_positions:
+                if idx is not None:
+                    accumulators[column].add(row[idx])
+        return update
+
+    def update_frame(self, df):
+        """累加一个文件的 DataFrame（按组计算后合并到累加值）"""
+        if df.empty:
+            return
+        names = {str(column): column for column in df.columns}
+        keys = pd.DataFrame({f"k{idx}": df[names[name]] if name in names else None
+                             for idx, name in enumerate(self.group_by)}, index=df.index)
+        key_columns = list(keys.columns)
+        frame = keys
+        parts = {}
+        for idx, column in enumerate(self.values):
+            if column not in names:
+                continue
+            series = df[names[column]]
+            numeric = pd.to_numeric(series.where(series.map(_is_number, na_action="ignore").astype(bool)),
+                                    errors="coerce") if series.dtype == object else \
+                (series if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                 else pd.Series(float("nan"), index=df.index))
+            orderable = series if pd.api.types.is_datetime64_any_dtype(series) else numeric
+            frame = frame.assign(**{f"c{idx}": series.notna(), f"n{idx}": numeric, f"o{idx}": orderable})
+            parts[column] = idx
+        grouped = frame.groupby(key_columns, dropna=False, sort=False)
+        sizes = grouped.size()
+        aggregations = {}
+        for idx in parts.values():
+            aggregations[f"c{idx}"] = (f"c{idx}", "sum")
+            aggregations[f"numbers{idx}"] = (f"n{idx}", "count")
+            aggregations[f"total{idx}"] = (f"n{idx}", "sum")
+            aggregations[f"low{idx}"] = (f"o{idx}", "min")
+            aggregations[f"high{idx}"] = (f"o{idx}", "max")
+        stats = grouped.agg(**aggregations) if aggregations else None
+        for position, (key, size) in enumerate(sizes.items()):
+            if not isinstance(key, tuple):
+                key = (key,)
+            group = self._group(tuple(normalize_key(value) for value in key))
+            group[0] += int(size)
+            if stats is None:
+                continue
+            record = stats.iloc[position]
+            for column, idx in parts.items():
+                numbers = int(record[f"numbers{idx}"])
+                low, high = normalize_key(record[f"low{idx}"]), normalize_key(record[f"high{idx}"])
+                total = record[f"total{idx}"] if numbers else 0
+                group[1][column].merge(int(record[f"c{idx}"]), numbers, total.item() if hasattr(total, "item")
+                                       else total, low, high)
+
+    def to_frame(self):
+        """汇总结果：分组列、行数和各统计列，按分组值排序"""
+        columns = list(self.group_by) + [ROW_COUNT_COLUMN]
+        for column, functions in self.values.items():
+            columns.extend(f"{column}_{AGGREGATES[function]}" for function in functions)
+        rows = []
+        for key, (row_count, accumulators) in self.groups.items():
+            row = list(key) + [row_count]
+            for column, functions in self.values.items():
+                row.extend(accumulators[column].result(function) for function in functions)
+            rows.append(row)
+        # 空值排在最后；类型不同的值按文字排序
+        rows.sort(key=lambda row: tuple((value is None, str(value) if not _is_number(value) else "", value
+                                         if _is_number(value) else 0) for value in row[:len(self.group_by)]))
+        return pd.DataFrame(rows, columns=columns)
+
+
+class MergeSummary:
+    """
+    多个汇总定义
+
+        summary = MergeSummary(definitions)
+        summary.update_frame(df)            # 内存合并：每个文件读取后
+        update = summary.bind(columns)      # 流式合并：合并后的列确定后
+        update(row)                         # 每写出一行
+        files = summary.write(output_file)  # 合并结束后
+    """
+
+    def __init__(self, definitions):
+        self.summaries = [GroupSummary(definition) for definition in validate_summaries(definitions)]
+
+    @property
+    def group_count(self):
+        return sum(len(summary.groups) for summary in self.summaries)
+
+    def bind(self, columns):
+        updates = [summary.bind(columns) for summary in self.summaries]
+
+        def update(row):
+            for summary_update in updates:
+                summary_update(row)
+        return update
+
+    def update_frame(self, df):
+        for summary in self.summaries:
+            summary.update_frame(df)
+
+    def frames(self):
+        return {summary.name: summary.to_frame() for summary in self.summaries}
+
+    def write(self, output_file, output_format=None):
+        """
+        写出汇总表，返回写出的文件路径列表
+
+        合并结果为 xlsx 时写到“名称_汇总.xlsx”，每个汇总一个工作表；
+        为 csv 时每个汇总一个文件“名称_汇总.csv”（多个汇总时为“名称_汇总_汇总名.csv”）
+        """
+        name, ext = os.path.splitext(output_file)
+        if output_format is None:
+            output_format = "csv" if ext.lower() == ".csv" else "xlsx"
+        frames = self.frames()
+        if output_format == "csv":
+            files = []
+            for sheet_name, frame in frames.items():
+                path = f"{name}_汇总.csv" if len(frames) == 1 else f"{name}_汇总_{sheet_name}.csv"
+                frame.to_csv(path, index=False, encoding="utf-8-sig")
+                files.append(path)
+            return files
+        path = f"{name}_汇总.xlsx"
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for sheet_name, frame in frames.items():
+                # 工作表名最多 31 个字符，不能包含 []:*?/\
+                safe_name = "".join("_" if c in "[]:*?/\\" else c for c in sheet_name)[:31]
+                frame.to_excel(writer, sheet_name=safe_name, index=False)
+        return [path]
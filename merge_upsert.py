@@ -0,0 +1,243 @@
+"""
+按键列去重合并（upsert）- 同一个键（如订单号）出现在多个文件中时只保留一行
+
+    keep='first'   保留文件顺序中第一次出现的行
+    keep='last'    保留文件顺序中最后出现的行，后面的文件覆盖前面的文件（默认）
+    keep='latest'  保留时间列最新的行；时间相同时保留后出现的行，时间为空的行不覆盖有时间的行
+
+逐行读取（与流式合并相同），一遍完成：first 只记住见过的键，读到新键就写出；
+last / latest 记住每个键当前保留的行，读完所有文件后写出。内存与不同键的个数有关，与总行数无关。
+结果按每个键第一次出现的位置排列（与数据库的 upsert 相同）。
+键值比较前统一空值和数字（1 与 1.0 相同，见 merge_summary.normalize_key）；
+键列都为空的行无法判断是否重复，全部保留。
+"""
+
+import os
+import datetime
+
+from perf_trace import NULL_TRACER
+from merge_excel import read_merged_columns, iter_file_rows, output_format_of, StreamingOutput
+from merge_summary import normalize_key
+from row_filter import project
+
+KEEP_FIRST = "first"
+KEEP_LAST = "last"
+KEEP_LATEST = "latest"
+KEEP_POLICIES = (KEEP_FIRST, KEEP_LAST, KEEP_LATEST)
+
+KEEP_LABELS = {
+    KEEP_FIRST: "保留第一次出现的行",
+    KEEP_LAST: "保留最后出现的行",
+    KEEP_LATEST: "保留时间最新的行",
+}
+
+
+def _timestamp_order(value):
+    """时间列的比较值：空值最小；日期时间按 ISO 文字比较，可以与“2024-01-05 10:00”这样的文字比较"""
+    value = normalize_key(value)
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, datetime.datetime):
+        return (2, value.isoformat(" "))
+    if isinstance(value, (datetime.date, datetime.time)):
+        return (2, value.isoformat())
+    return (2, str(value).strip())
+
+
+def validate_upsert(key_columns, keep=KEEP_LAST, timestamp_column=None):
+    """检查键列和保留方式，有问题时抛出 ValueError；返回 (键列列表, 保留方式)"""
+    if isinstance(key_columns, str):
+        key_columns = [key_columns]
+    key_columns = list(key_columns or [])
+    if not key_columns:
+        raise ValueError("按键去重需要指定键列")
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"不支持的保留方式: {keep}（可用 {', '.join(KEEP_POLICIES)}）")
+    if keep == KEEP_LATEST and not timestamp_column:
+        raise ValueError("保留时间最新的行时需要指定时间列")
+    return key_columns, keep
+
+
+class UpsertReport:
+    """按键去重的统计：每个文件读取、保留、覆盖了之前的行、被覆盖（或因重复被丢弃）的行数"""
+
+    def __init__(self, key_columns, keep, timestamp_column=None):
+        self.key_columns = key_columns
+        self.keep = keep
+        self.timestamp_column = timestamp_column
+        self.files = []          # [{'file', 'rows', 'replaced', 'superseded'}]
+        self.distinct_keys = 0
+        self.empty_keys = 0
+
+    def add_file(self, file_path):
+        self.files.append({"file": os.path.basename(file_path), "rows": 0, "replaced": 0, "superseded": 0})
+        return len(self.files) - 1
+
+    @property
+    def rows_read(self):
+        return sum(entry["rows"] for entry in self.files)
+
+    @property
+    def rows_kept(self):
+        return sum(entry["rows"] - entry["superseded"] for entry in self.files)
+
+    def to_dict(self):
+        return {
+            "key_columns": self.key_columns,
+            "keep": self.keep,
+            "timestamp_column": self.timestamp_column,
+            "rows_read": self.rows_read,
+            "rows_kept": self.rows_kept,
+            "duplicates": self.rows_read - self.rows_kept,
+            "distinct_keys": self.distinct_keys,
+            "empty_keys": self.empty_keys,
+            "files": [dict(entry, kept=entry["rows"] - entry["superseded"]) for entry in self.files],
+        }
+
+    def describe(self):
+        """多行文字：总计和每个文件的明细"""
+        lines = [f"按键去重（{', '.join(map(str, self.key_columns))}，{KEEP_LABELS[self.keep]}）: "
+                 f"读取 {self.rows_read} 行，保留 {self.rows_kept} 行，{self.distinct_keys} 个不同的键"
+                 + (f"，{self.empty_keys} 行键为空（全部保留）" if self.empty_keys else "")]
+        for entry in self.files:
+            lines.append(f"  {entry['file']}: 读取 {entry['rows']} 行，保留 {entry['rows'] - entry['superseded']} 行，"
+                         f"覆盖之前的行 {entry['replaced']} 行，被覆盖或重复 {entry['superseded']} 行")
+        return "\n".join(lines)
+
+
+def merge_excel_upsert(excel_files, output_file, key_columns, keep=KEEP_LAST, timestamp_column=None, log=print,
+                       progress=None, checkpoint=None, column_widths=None, output_format=None, chunk_rows=None,
+                       tracer=NULL_TRACER, columns=None, row_filter=None, summary=None):
+    """
+    按键列去重合并，一遍读取所有文件
+
+    参数:
+        key_columns: 键列的列名列表
+        keep / timestamp_column: 保留方式（见模块说明），keep 为 'latest' 时按 timestamp_column 比较
+        columns / row_filter: 只合并这些列和满足条件的行，见 merge_excel_streaming
+        summary: merge_summary.MergeSummary，按去重后写出的行累加分组汇总
+
+    返回:
+        (写出的数据行数, 列名列表, 写出的文件路径列表, UpsertReport)
+    """
+    key_columns, keep = validate_upsert(key_columns, keep, timestamp_column)
+    if keep != KEEP_LATEST:
+        timestamp_column = None
+    needed = key_columns + ([timestamp_column] if timestamp_column else [])
+    if output_format is None:
+        output_format = output_format_of(output_file)
+
+    selection = columns
+    extra = []
+    if selection is not None:
+        # 键列和时间列没有选择时也要读取，写出时不包括
+        extra = [name for name in needed if name not in selection]
+        selection = list(selection) + extra
+    headers, all_columns, positions = read_merged_columns(excel_files, log=log, tracer=tracer, columns=selection)
+    missing = [name for name in needed if name not in positions]
+    if missing:
+        raise ValueError(f"所有文件中都没有这些列: {', '.join(map(str, missing))}")
+    # 源文件列总在最前并且总是写出，其余补读的列排在选择的列之后，所以写出的列是合并后的列的前几列
+    columns = [name for name in all_columns if name not in extra or name == '源文件']
+    width = len(columns)
+    key_positions = [positions[name] for name in key_columns]
+    timestamp_position = positions[timestamp_column] if timestamp_column else None
+
+    report = UpsertReport(key_columns, keep, timestamp_column)
+    log(f"按键去重: {', '.join(map(str, key_columns))}，{KEEP_LABELS[keep]}"
+        + (f"（时间列: {timestamp_column}）" if timestamp_column else ""))
+    output = StreamingOutput(output_file, columns, output_format, chunk_rows, column_widths)
+    update_summary = summary.bind(columns) if summary is not None else None
+    seen = set()     # first: 见过的键
+    kept = {}        # last / latest: 键 -> [行, 文件序号]；键列都为空的行用各自的 object() 作键
+    rows_written = 0
+
+    def write(row):
+        nonlocal rows_written
+        output.write_row(row[:width])
+        if update_summary is not None:
+            update_summary(row[:width])
+        rows_written += 1
+
+    try:
+        rows_read = 0
+        for idx, file_path in enumerate(excel_files, 1):
+            if checkpoint is not None:
+                checkpoint()
+            header = headers.get(file_path)
+            if header is not None:
+                source_name = os.path.basename(file_path)
+                file_index = report.add_file(file_path)
+                stats = report.files[file_index]
+                indices = predicate_indices = None
+                if selection is not None or row_filter is not None:
+                    header, indices, predicate_indices = project(header, selection, row_filter)
+                targets = [positions[name] for name in header]
+                add_source = '源文件' not in header
+                try:
+                    with tracer.span("merge.upsert_file", file=source_name):
+                        for values in iter_file_rows(file_path, indices, row_filter, predicate_indices):
+                            if indices is not None and all(value is None for value in values):
+                                continue  # 选择的列都没有内容
+                            row = [None] * len(all_columns)
+                            for target, value in zip(targets, values):
+                                row[target] = value
+                            if add_source:
+                                row[0] = source_name
+                            stats["rows"] += 1
+                            if checkpoint is not None and stats["rows"] % 1000 == 0:
+                                checkpoint()
+                            key = tuple(normalize_key(row[position]) for position in key_positions)
+                            if all(value is None for value in key):
+                                report.empty_keys += 1
+                                if keep == KEEP_FIRST:
+                                    write(row)
+                                else:
+                                    kept[object()] = [row, file_index]
+                                continue
+                            if keep == KEEP_FIRST:
+                                if key in seen:
+                                    stats["superseded"] += 1
+                                else:
+                                    seen.add(key)
+                                    write(row)
+                                continue
+                            entry = kept.get(key)
+                            if entry is None:
+                                kept[key] = [row, file_index]
+                                continue
+                            if keep == KEEP_LATEST and _timestamp_order(row[timestamp_position]) < \
+                                    _timestamp_order(entry[0][timestamp_position]):
+                                stats["superseded"] += 1
+                                continue
+                            # 保留原来的位置，只替换行的内容
+                            report.files[entry[1]]["superseded"] += 1
+                            stats["replaced"] += 1
+                            entry[0], entry[1] = row, file_index
+                    log(f"已读取 [{idx}/{len(excel_files)}]: {source_name} - {stats['rows']} 行，"
+                        f"覆盖之前的行 {stats['replaced']} 行，被覆盖或重复 {stats['superseded']} 行")
+                except Exception as e:
+                    # keep='first' 时已写出的行无法撤回；其他方式已读取的行保留
+                    log(f"读取文件失败 {source_name}（已读取 {stats['rows']} 行）: {str(e)}")
+                rows_read += stats["rows"]
+                tracer.count("cells", stats["rows"] * len(header))
+                tracer.count_file_bytes("input_bytes", file_path)
+            if progress is not None:
+                progress(idx, len(excel_files), rows_read)
+
+        report.distinct_keys = len(seen) + len(kept) - (report.empty_keys if keep != KEEP_FIRST else 0)
+        if keep != KEEP_FIRST:
+            with tracer.span("merge.upsert_write"):
+                for row, _ in kept.values():
+                    write(row)
+                    if checkpoint is not None and rows_written % 10000 == 0:
+                        checkpoint()
+        tracer.count("rows", rows_written)
+    finally:
+        with tracer.span("merge.write"):
+            output_files = output.close()
+    for path in output_files:
+        tracer.count_file_bytes("output_bytes", path)
+    return rows_written, columns, output_files, report
@@ -0,0 +1,343 @@
+"""
+解析结果缓存 - 同一个工作簿多次拆分、合并、预览时，不再重复解析 xlsx
+
+缓存项按文件内容的哈希和读取选项（读取方式、引擎、读取的列等）区分，文件内容不变时无论路径、
+文件名如何都能命中。每项保存为一个目录:
+    meta.json    格式、列名、表头等信息；修改时间用于 LRU 淘汰
+    data.arrow   Arrow IPC（Feather v2）文件，不压缩，读取时内存映射（安装了 pyarrow 时）
+    c0.npy ...   没有 pyarrow，或某列类型混杂无法转换成 Arrow 时，每列一个 .npy 文件，数值列内存映射
+
+缓存目录的总大小超过上限时，按最近使用时间删除最旧的项。缓存目录见 app_paths.user_cache_dir，
+大小上限默认 2GB，可用环境变量 EXCEL_TOOL_PARSE_CACHE_SIZE（如 500MB）修改。
+
+缓存两种内容:
+    load_frame  pandas.read_excel 的结果（合并）
+    load_sheet  openpyxl 读取的表头和各行单元格值（拆分、预览），读取后单元格值与直接读取时相同
+"""
+
+import os
+import json
+import math
+import time
+import shutil
+import hashlib
+import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from app_paths import user_cache_dir
+from memory_budget import parse_size
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 2 << 30
+MAX_BYTES_ENV = "EXCEL_TOOL_PARSE_CACHE_SIZE"
+
+# 计算内容哈希时每次读取的字节数
+HASH_BLOCK_SIZE = 1 << 20
+
+FORMAT_ARROW = "arrow"
+FORMAT_NPY = "npy"
+
+ROW_COLUMN = "_row"
+
+# 单元格值类型一致时才能无损保存为 Arrow 列（如整数和小数混在一列时，整数会读回成小数）
+_ARROW_CELL_TYPES = (str, int, float, bool, datetime.datetime, datetime.time)
+
+
+def content_digest(file_path=None, data=None):
+    """文件内容的哈希（逐块读取）；data 为已读入内存的内容时不再读取文件"""
+    digest = hashlib.blake2b(digest_size=16)
+    if data is not None:
+        digest.update(data)
+        return digest.hexdigest()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+def default_max_bytes():
+    """缓存大小上限：环境变量 EXCEL_TOOL_PARSE_CACHE_SIZE，默认 2GB"""
+    text = os.environ.get(MAX_BYTES_ENV)
+    if text:
+        try:
+            return parse_size(text)
+        except ValueError:
+            pass
+    return DEFAULT_MAX_BYTES
+
+
+def _directory_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def _arrow_safe(values):
+    """一列单元格值是否能无损转换成 Arrow（空值以外只有一种类型）"""
+    kinds = {type(value) for value in values if value is not None}
+    return len(kinds) <= 1 and all(kind in _ARROW_CELL_TYPES for kind in kinds)
+
+
+def _encode_value(value):
+    # 表头保存在 meta.json 中；JSON 没有的类型（日期时间）按 ISO 文字保存并标明类型
+    if isinstance(value, (datetime.datetime, datetime.time)):
+        return {type(value).__name__: value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        (kind, text), = value.items()
+        return getattr(datetime, kind).fromisoformat(text)
+    return value
+
+
+def _cell_value(value):
+    # Arrow 中的空值读回时可能为 NaN（工作表中没有 NaN），日期时间读回为 pandas.Timestamp
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+class ParseCache:
+    """
+    解析结果缓存；可以传给子进程（只保存目录和大小上限）
+
+        cache = ParseCache()
+        df = cache.load_frame(path, lambda: pd.read_excel(path), reader="pandas")
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or user_cache_dir("parsed")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, digest, **options):
+        """内容哈希和读取选项组成的缓存键"""
+        text = json.dumps({"digest": digest, "version": CACHE_FORMAT_VERSION, "options": options},
+                          sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _read_entry(self, key, columns=None, objects=False):
+        """返回 (meta, DataFrame)；没有缓存或缓存已损坏时返回 None"""
+        path = self._entry_path(key)
+        meta_path = os.path.join(path, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            names = meta["names"]
+            wanted = names if columns is None else [name for name in names if name in columns]
+            if meta["format"] == FORMAT_ARROW:
+                if pa is None:
+                    return None
+                # 内存映射：数值列不复制，只读取用到的列
+                with pa.memory_map(os.path.join(path, "data.arrow")) as source:
+                    table = pa.ipc.open_file(source).read_all().select(wanted)
+                if objects:
+                    df = table.to_pandas(integer_object_nulls=True, date_as_object=True,
+                                         timestamp_as_object=True, split_blocks=True)
+                else:
+                    df = table.to_pandas(split_blocks=True)
+            else:
+                data = {}
+                for name in wanted:
+                    idx = names.index(name)
+                    file_name = os.path.join(path, f"c{idx}.npy")
+                    dtype = meta["dtypes"][idx]
+                    if dtype == "object":
+                        data[name] = np.load(file_name, allow_pickle=True)
+                    else:
+                        data[name] = np.load(file_name, mmap_mode="r")
+                df = pd.DataFrame(data, columns=wanted, copy=False)
+                for name in wanted:
+                    dtype = meta["dtypes"][names.index(name)]
+                    if str(df[name].dtype) != dtype:
+                        df[name] = df[name].astype(dtype)
+        except (OSError, ValueError, KeyError):
+            return None
+        # 更新修改时间，用于 LRU 淘汰
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return meta, df
+
+    def _write_entry(self, key, df, meta):
+        """写入临时目录后改名，多个进程同时写同一项时只保留一个"""
+        path = self._entry_path(key)
+        temp_path = f"{path}.tmp-{os.getpid()}-{time.perf_counter_ns()}"
+        os.makedirs(temp_path)
+        try:
+            names = [f"c{idx}" for idx in range(df.shape[1])]
+            frame = df.set_axis(names, axis=1)
+            meta = dict(meta, names=names, format=FORMAT_NPY)
+            written = False
+            if pa is not None and meta.pop("arrow", True):
+                try:
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    with pa.OSFile(os.path.join(temp_path, "data.arrow"), "wb") as sink:
+                        with pa.ipc.new_file(sink, table.schema) as writer:
+                            writer.write_table(table)
+                    meta["format"] = FORMAT_ARROW
+                    written = True
+                except (pa.ArrowException, TypeError, ValueError):
+                    pass
+            if not written:
+                dtypes = []
+                for idx, name in enumerate(names):
+                    column = frame[name]
+                    values = column.to_numpy()
+                    np.save(os.path.join(temp_path, f"c{idx}.npy"), values, allow_pickle=values.dtype == object)
+                    dtypes.append(str(column.dtype))
+                meta["dtypes"] = dtypes
+            with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, default=str)
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                # 其他进程已经写好了同一项
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        self.evict()
+
+    def entries(self):
+        """[(缓存键, 字节数, 最近使用时间), ...]"""
+        result = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or ".tmp-" in entry.name:
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, "meta.json")).st_mtime
+                result.append((entry.name, _directory_size(entry.path), used))
+            except OSError:
+                pass
+        return result
+
+    def evict(self):
+        """总大小超过上限时按最近使用时间删除最旧的项，返回删除的项数"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            # Windows 上正在内存映射的文件无法删除，留到下次
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            if not os.path.exists(self._entry_path(key)):
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self):
+        """删除所有缓存项"""
+        for key, _, _ in self.entries():
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def load_frame(self, file_path, parse, data=None, columns=None, **options):
+        """
+        读取 DataFrame：有缓存时直接读取，否则调用 parse() 解析并写入缓存
+
+        data: 已读入内存的文件内容（bytes），用于计算内容哈希
+        columns: 只读取这些列（列名列表）；缓存中保存 parse() 返回的所有列
+        options: 读取选项（读取方式、引擎等），不同选项的结果分别缓存
+        """
+        key = self.key(content_digest(file_path, data), kind="frame", **options)
+        entry = self._read_entry(key)
+        if entry is not None:
+            meta, df = entry
+            self.hits += 1
+            df.columns = meta["columns"]
+        else:
+            self.misses += 1
+            df = parse()
+            try:
+                self._write_entry(key, df, {"columns": list(df.columns)})
+            except OSError:
+                pass  # 缓存写不进去时不影响读取
+        if columns is not None:
+            names = {str(column): column for column in df.columns}
+            df = df[[names[name] for name in columns if name in names]]
+        return df
+
+    def sheet_key(self, file_path, data=None, **options):
+        """工作表缓存的键，见 get_sheet / put_sheet"""
+        return self.key(content_digest(file_path, data), kind="sheet", **options)
+
+    def get_sheet(self, key):
+        """读取缓存的 (表头, [(行号, 值列表), ...], 附加信息)；没有缓存时返回 None"""
+        entry = self._read_entry(key, objects=True)
+        if entry is None:
+            self.misses += 1
+            return None
+        meta, df = entry
+        self.hits += 1
+        row_numbers = df.iloc[:, 0].tolist()
+        columns = [[_cell_value(value) for value in df.iloc[:, idx].tolist()] for idx in range(1, df.shape[1])]
+        if columns:
+            rows = [(row_number, list(values)) for row_number, values in zip(row_numbers, zip(*columns))]
+        else:
+            rows = [(row_number, []) for row_number in row_numbers]
+        return [_decode_value(value) for value in meta["header"]], rows, meta["info"]
+
+    def put_sheet(self, key, header, rows, info=None):
+        """写入工作表的表头和各行；写不进去时忽略"""
+        width = max([len(header)] + [len(values) for _, values in rows])
+        columns = [[values[idx] if idx < len(values) else None for _, values in rows] for idx in range(width)]
+        frame = pd.concat([pd.Series([row_number for row_number, _ in rows], dtype="int64", name=ROW_COLUMN)] +
+                          [pd.Series(values, dtype=object, name=f"v{idx}") for idx, values in enumerate(columns)],
+                          axis=1)
+        meta = {
+            "header": [_encode_value(value) for value in header],
+            "info": info or {},
+            "columns": list(frame.columns),
+            "arrow": all(_arrow_safe(values) for values in columns),
+        }
+        try:
+            self._write_entry(key, frame, meta)
+        except OSError:
+            pass
+
+    def load_sheet(self, file_path, parse, data=None, **options):
+        """
+        读取工作表的表头和各行：有缓存时直接读取，否则调用 parse() 解析并写入缓存
+
+        parse() 返回 (表头列表, [(行号, 值列表), ...], 附加信息 dict)，本函数返回相同的结构
+        """
+        key = self.sheet_key(file_path, data, **options)
+        cached = self.get_sheet(key)
+        if cached is not None:
+            return cached
+        header, rows, info = parse()
+        self.put_sheet(key, header, rows, info)
+        return header, rows, info
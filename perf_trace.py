@@ -0,0 +1,194 @@
+"""
+分阶段计时 - 记录拆分/合并各阶段的耗时和行数、单元格数、字节数等计数
+
+用法:
+    tracer = Tracer()
+    with tracer.span("split.save"):
+        wb.save(path)
+    tracer.count("rows")
+    tracer.write_chrome_trace("trace.json")   # 用 chrome://tracing 或 Perfetto 打开
+    print(tracer.format_summary())
+
+不需要计时时使用 NULL_TRACER，span() 返回同一个空对象，几乎没有开销。
+
+各处理方式的计数含义相同，可以直接比较：合并的 cells 为读取的单元格数（行数 × 文件中的列数，
+不含添加的源文件列，空单元格也计入）；拆分的 cells 为写出的单元格数（含表头行）。
+"""
+
+import os
+import json
+import time
+import threading
+
+
+# Chrome trace 中最多保留的事件数；超过后只累计汇总，避免逐行拆分时占用过多内存
+MAX_TRACE_EVENTS = 200000
+
+
+def _pad(text, width, right=False):
+    """按显示宽度（中文占2格）补齐空格"""
+    padding = " " * max(width - sum(2 if ord(c) > 127 else 1 for c in text), 0)
+    return padding + text if right else text + padding
+
+
+class _Span:
+    """一次计时，用作 with 语句"""
+
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    """记录各阶段耗时和计数，可导出 Chrome trace-event JSON 和汇总表"""
+
+    enabled = True
+
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped_events = 0
+        self.stages = {}  # {名称: [次数, 总秒数, 最长秒数]}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **args):
+        """计时一个阶段：with tracer.span("merge.read", file=...)"""
+        return _Span(self, name, args)
+
+    def _record(self, name, start, end, args):
+        seconds = end - start
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [1, seconds, seconds]
+            else:
+                stage[0] += 1
+                stage[1] += seconds
+                if seconds > stage[2]:
+                    stage[2] = seconds
+            if len(self.events) < self.max_events:
+                self.events.append((name, start, seconds, threading.get_ident(), args))
+            else:
+                self.dropped_events += 1
+
+    def count(self, name, value=1):
+        """累加计数，如 rows、cells、bytes"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_file_bytes(self, name, path):
+        """把文件大小累加到计数"""
+        try:
+            self.count(name, os.path.getsize(path))
+        except OSError:
+            pass
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def summary(self):
+        """按总耗时从大到小的各阶段统计"""
+        total = self.elapsed
+        rows = []
+        for name, (calls, seconds, longest) in self.stages.items():
+            rows.append({
+                "stage": name,
+                "calls": calls,
+                "seconds": round(seconds, 4),
+                "mean_ms": round(seconds / calls * 1000, 3),
+                "max_ms": round(longest * 1000, 3),
+                "percent": round(seconds / total * 100, 1) if total > 0 else 0.0,
+            })
+        rows.sort(key=lambda row: row["seconds"], reverse=True)
+        return rows
+
+    def format_summary(self):
+        """汇总表文本，用于日志"""
+        lines = [_pad("阶段", 26) + _pad("次数", 10, True) + _pad("总耗时(秒)", 14, True)
+                 + _pad("平均(毫秒)", 14, True) + _pad("占比", 10, True)]
+        for row in self.summary():
+            lines.append(f"{row['stage']:<26}{row['calls']:>10}{row['seconds']:>14.3f}"
+                         f"{row['mean_ms']:>14.3f}{row['percent']:>9.1f}%")
+        if self.counters:
+            lines.append("计数: " + ", ".join(f"{name}={value}" for name, value in self.counters.items()))
+        lines.append(f"总耗时: {self.elapsed:.3f} 秒")
+        return "\n".join(lines)
+
+    def to_chrome_trace(self):
+        """Chrome trace-event 格式（时间单位为微秒）"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 3),
+                "dur": round(seconds * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, seconds, tid, args in self.events
+        ]
+        if self.counters:
+            events.append({
+                "name": "counters",
+                "ph": "C",
+                "ts": round(self.elapsed * 1e6, 3),
+                "pid": pid,
+                "args": dict(self.counters),
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": self.dropped_events, "summary": self.summary()},
+        }
+
+    def write_chrome_trace(self, output_file):
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """不计时的 Tracer，所有方法都不做任何事"""
+
+    enabled = False
+
+    def span(self, name, **args):
+        return _NULL_SPAN
+
+    def count(self, name, value=1):
+        pass
+
+    def count_file_bytes(self, name, path):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,305 @@
+"""
+列画像 - 单次流式扫描统计每列的类型分布、空值、不同值个数、显示宽度和取值范围
+
+基于 check_excel_structure / sheet_reader 的流式读取，内存占用与行数无关：
+不同值个数用固定大小的 HyperLogLog 估算。结果可直接用于合并时的列类型和列宽。
+"""
+
+import os
+import json
+import math
+import time
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from check_excel_structure import find_excel_files
+from sheet_reader import XlsxSheetSource
+from split_excel import cell_display_width
+
+
+# HyperLogLog 寄存器个数为 2**HLL_PRECISION，标准误差约 1.04 / sqrt(2**HLL_PRECISION)
+HLL_PRECISION = 12
+
+# 类型名称
+TYPE_EMPTY = "空"
+TYPE_INT = "整数"
+TYPE_FLOAT = "小数"
+TYPE_TEXT = "文本"
+TYPE_DATETIME = "日期"
+TYPE_BOOL = "布尔"
+
+
+def value_type(value):
+    """单元格值的类型名称"""
+    if value is None or value == "":
+        return TYPE_EMPTY
+    if isinstance(value, bool):
+        return TYPE_BOOL
+    if isinstance(value, int):
+        return TYPE_INT
+    if isinstance(value, float):
+        return TYPE_FLOAT
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return TYPE_DATETIME
+    return TYPE_TEXT
+
+
+class HyperLogLog:
+    """固定内存的不同值个数估算"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value):
+        # 64 位哈希：低位选寄存器，其余位计算前导零
+        hashed = int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "little")
+        index = hashed & (self.size - 1)
+        rest = hashed >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # 小基数修正
+        return int(round(estimate))
+
+
+class ColumnProfile:
+    """单列的统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.types = {}
+        self.distinct = HyperLogLog()
+        self.max_width = cell_display_width(name)
+        self.min_number = None
+        self.max_number = None
+        self.min_date = None
+        self.max_date = None
+
+    def add(self, value):
+        self.count += 1
+        kind = value_type(value)
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if kind == TYPE_EMPTY:
+            return
+        self.distinct.add(value)
+        width = cell_display_width(value)
+        if width > self.max_width:
+            self.max_width = width
+        if kind in (TYPE_INT, TYPE_FLOAT):
+            if self.min_number is None or value < self.min_number:
+                self.min_number = value
+            if self.max_number is None or value > self.max_number:
+                self.max_number = value
+        elif kind == TYPE_DATETIME and isinstance(value, datetime.datetime):
+            if self.min_date is None or value < self.min_date:
+                self.min_date = value
+            if self.max_date is None or value > self.max_date:
+                self.max_date = value
+
+    def merge(self, other):
+        """合并另一份（通常来自另一个文件的）同名列统计"""
+        self.count += other.count
+        for kind, n in other.types.items():
+            self.types[kind] = self.types.get(kind, 0) + n
+        self.distinct.merge(other.distinct)
+        self.max_width = max(self.max_width, other.max_width)
+        for attr, pick in (("min_number", min), ("max_number", max), ("min_date", min), ("max_date", max)):
+            values = [v for v in (getattr(self, attr), getattr(other, attr)) if v is not None]
+            setattr(self, attr, pick(values) if values else None)
+
+    @property
+    def null_count(self):
+        return self.types.get(TYPE_EMPTY, 0)
+
+    @property
+    def suggested_dtype(self):
+        """合并时建议使用的 pandas 列类型"""
+        kinds = set(self.types) - {TYPE_EMPTY}
+        if not kinds:
+            return "object"
+        if kinds == {TYPE_INT}:
+            return "Int64"
+        if kinds <= {TYPE_INT, TYPE_FLOAT}:
+            return "float64"
+        if kinds == {TYPE_DATETIME}:
+            return "datetime64[ns]"
+        if kinds == {TYPE_BOOL}:
+            return "boolean"
+        if kinds == {TYPE_TEXT}:
+            return "string"
+        return "object"
+
+    @property
+    def mixed(self):
+        """是否同时包含文本和非文本的值"""
+        kinds = set(self.types) - {TYPE_EMPTY}
+        return len(kinds) > 1 and not kinds <= {TYPE_INT, TYPE_FLOAT}
+
+    @property
+    def suggested_width(self):
+        """与拆分时相同规则的列宽：最小8，最大50"""
+        return min(max(self.max_width + 2, 8), 50)
+
+    def to_dict(self):
+        return {
+            "column": self.name,
+            "rows": self.count,
+            "types": self.types,
+            "null_count": self.null_count,
+            "distinct_estimate": self.distinct.count(),
+            "max_width": self.max_width,
+            "min_number": self.min_number,
+            "max_number": self.max_number,
+            "min_date": self.min_date.isoformat() if self.min_date else None,
+            "max_date": self.max_date.isoformat() if self.max_date else None,
+            "mixed_types": self.mixed,
+            "suggested_dtype": self.suggested_dtype,
+            "suggested_width": self.suggested_width,
+        }
+
+
+def column_names(header):
+    """表头转换成列名（与 pandas 读取时一致：空表头为 Unnamed: n，重复列名加 .1、.2）"""
+    names = []
+    seen = {}
+    for idx, value in enumerate(header):
+        name = str(value) if value is not None else f"Unnamed: {idx}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def profile_columns(input_file):
+    """单次流式扫描活动工作表，返回 {列名: ColumnProfile}（按列顺序）"""
+    with XlsxSheetSource(input_file) as source:
+        rows = source.iter_rows()
+        first = next(rows, None)
+        header = column_names(first[1]) if first else []
+        profiles = [ColumnProfile(name) for name in header]
+        for row_number, values in rows:
+            if len(values) > len(profiles):
+                for idx in range(len(profiles), len(values)):
+                    profiles.append(ColumnProfile(f"Unnamed: {idx}"))
+            for idx, profile in enumerate(profiles):
+                profile.add(values[idx] if idx < len(values) else None)
+    return {profile.name: profile for profile in profiles}
+
+
+def _profile_file(input_file):
+    """进程池中运行：返回 (文件, 列统计, 错误, 用时)"""
+    start = time.perf_counter()
+    try:
+        return input_file, profile_columns(input_file), None, time.perf_counter() - start
+    except Exception as e:
+        return input_file, {}, str(e), time.perf_counter() - start
+
+
+def profile_files(files, jobs=None):
+    """
+    并行画像多个文件
+
+    返回 (每个文件的结果列表, 按列名合并后的 {列名: ColumnProfile})
+    """
+    if jobs == 1 or len(files) <= 1:
+        results = [_profile_file(file) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_profile_file, files))
+
+    combined = {}
+    for _, profiles, error, _ in results:
+        for name, profile in profiles.items():
+            if name in combined:
+                combined[name].merge(profile)
+            else:
+                merged = ColumnProfile(name)
+                merged.merge(profile)
+                combined[name] = merged
+    return results, combined
+
+
+def merge_dtypes(profiles):
+    """从列统计得到合并时使用的列类型（混合类型的列保持 object）"""
+    return {name: profile.suggested_dtype for name, profile in profiles.items()
+            if profile.suggested_dtype != "object"}
+
+
+def column_widths(profiles):
+    """从列统计得到输出文件的列宽"""
+    return {name: profile.suggested_width for name, profile in profiles.items()}
+
+
+def load_profile_report(report_file):
+    """从画像报告中读取合并用的列类型和列宽"""
+    with open(report_file, encoding="utf-8") as f:
+        report = json.load(f)
+    columns = report["combined"]
+    dtypes = {c["column"]: c["suggested_dtype"] for c in columns if c["suggested_dtype"] != "object"}
+    widths = {c["column"]: c["suggested_width"] for c in columns}
+    return dtypes, widths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计Excel文件每列的类型、空值、不同值个数和宽度")
+    parser.add_argument("paths", nargs="+", help="Excel 文件或包含 Excel 文件的文件夹")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数（默认CPU核数）")
+    parser.add_argument("-o", "--output", help="把画像报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    files = find_excel_files(args.paths)
+    results, combined = profile_files(files, jobs=args.jobs)
+
+    for input_file, profiles, error, seconds in results:
+        if error:
+            print(f"{os.path.basename(input_file)}: 出错: {error}")
+        else:
+            print(f"{os.path.basename(input_file)}: {len(profiles)} 列, 用时 {seconds:.2f} 秒")
+
+    print(f"\n合并后共 {len(combined)} 列:")
+    for name, profile in combined.items():
+        types = ", ".join(f"{kind} {n}" for kind, n in profile.types.items())
+        warning = "  ⚠ 混合类型" if profile.mixed else ""
+        print(f"  {name}: {types}; 约 {profile.distinct.count()} 个不同值; "
+              f"建议类型 {profile.suggested_dtype}, 列宽 {profile.suggested_width}{warning}")
+
+    if args.output:
+        report = {
+            "files": [
+                {
+                    "file": os.path.abspath(input_file),
+                    "error": error,
+                    "seconds": round(seconds, 4),
+                    "columns": [profile.to_dict() for profile in profiles.values()],
+                }
+                for input_file, profiles, error, seconds in results
+            ],
+            "combined": [profile.to_dict() for profile in combined.values()],
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n画像报告: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+列选择和行筛选 - 拆分、合并时只读取需要的列和满足条件的行
+
+筛选条件写法与 Python 表达式相同，只允许比较和 and / or / not:
+    状态 == "已完成"
+    金额 >= 1000 and 城市 in ("北京", "上海")
+    not (备注 == None) or `客户 名称` != "测试"
+    "2024-01-01" <= 日期 < "2024-07-01"
+
+列名直接写（中文列名可以直接写），含空格等符号或以数字开头的列名用反引号括起来。
+值为空的单元格为 None；大小比较中有一边为空时不成立；文字与数字、日期比较时先把文字转换成数字或日期，
+无法比较时条件不成立。
+
+流式读取时（sheet_reader.XlsxSheetSource.iter_rows）先只转换筛选用到的列，不满足条件的行其他单元格不再转换，
+未选择的列始终不转换。
+"""
+
+import re
+import ast
+import math
+import datetime
+import operator
+
+# 比较运算
+_ORDERING = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_EQUALITY = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Is: operator.eq,
+    ast.IsNot: operator.ne,
+}
+
+BACKTICK_RE = re.compile(r"`([^`]+)`")
+_PLACEHOLDER = "__column_{}__"
+
+
+def parse_column_list(text):
+    """'编号, 姓名,金额' 转换成列名列表；空文本返回 None"""
+    if not text:
+        return None
+    if isinstance(text, (list, tuple)):
+        return list(text) or None
+    names = [name.strip() for name in str(text).split(",")]
+    return [name for name in names if name] or None
+
+
+def _coerce(value, other):
+    """文字与数字、日期比较时，把文字转换成对方的类型"""
+    if isinstance(value, str) and not isinstance(other, str) and other is not None:
+        try:
+            if isinstance(other, datetime.datetime):
+                return datetime.datetime.fromisoformat(value)
+            if isinstance(other, datetime.date):
+                return datetime.date.fromisoformat(value)
+            if isinstance(other, (int, float)) and not isinstance(other, bool):
+                return float(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _normalize(value):
+    # pandas 读取时空单元格为 NaN / NaT
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if value.__class__.__name__ == "NaTType":
+        return None
+    return value
+
+
+def _compare(op, left, right):
+    left, right = _normalize(left), _normalize(right)
+    left, right = _coerce(left, right), _coerce(right, left)
+    if isinstance(op, (ast.In, ast.NotIn)):
+        # 右边只能是列表（如 列 in ["A", "B"]）；是列或其他值时不匹配
+        if not isinstance(right, (list, tuple)):
+            return False
+        found = any(_compare(ast.Eq(), left, item) for item in right)
+        return found if isinstance(op, ast.In) else not found
+    if type(op) in _EQUALITY:
+        return _EQUALITY[type(op)](left, right)
+    if left is None or right is None:
+        return False
+    try:
+        return _ORDERING[type(op)](left, right)
+    except TypeError:
+        return False
+
+
+class RowFilter:
+    """
+    编译好的筛选条件
+
+    columns: 条件中用到的列名（按出现顺序，不重复）
+    predicate(values): values 为这些列的值（顺序与 columns 相同，缺少的列为 None），返回是否保留该行
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        names = {}
+
+        def replace(match):
+            placeholder = _PLACEHOLDER.format(len(names))
+            names[placeholder] = match.group(1)
+            return placeholder
+
+        source = BACKTICK_RE.sub(replace, expression.strip())
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"筛选条件无效: {expression} ({e.msg})")
+        self.columns = []
+        self._names = names
+        self.predicate = self._compile_bool(tree.body)
+
+    def __reduce__(self):
+        # 传给子进程时重新编译
+        return RowFilter, (self.expression,)
+
+    def __repr__(self):
+        return f"RowFilter({self.expression!r})"
+
+    def _column_position(self, node):
+        name = self._names.get(node.id, node.id)
+        if name not in self.columns:
+            self.columns.append(name)
+        return self.columns.index(name)
+
+    def _error(self, node):
+        return ValueError(f"筛选条件中不支持: {ast.dump(node)}；只能使用比较和 and / or / not")
+
+    def _compile_bool(self, node):
+        if isinstance(node, ast.BoolOp):
+            parts = [self._compile_bool(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda values: all(part(values) for part in parts)
+            return lambda values: any(part(values) for part in parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            part = self._compile_bool(node.operand)
+            return lambda values: not part(values)
+        if isinstance(node, ast.Compare):
+            operands = [self._compile_value(node.left)] + [self._compile_value(c) for c in node.comparators]
+            ops = node.ops
+            for op in ops:
+                if type(op) not in _ORDERING and type(op) not in _EQUALITY and \
+                        not isinstance(op, (ast.In, ast.NotIn)):
+                    raise self._error(op)
+
+            def compare(values):
+                left = operands[0](values)
+                for op, operand in zip(ops, operands[1:]):
+                    right = operand(values)
+                    if not _compare(op, left, right):
+                        return False
+                    left = right
+                return True
+            return compare
+        # 单独一个列名或常量：按是否有值判断
+        value = self._compile_value(node)
+        return lambda values: bool(_normalize(value(values)))
+
+    def _compile_value(self, node):
+        if isinstance(node, ast.Name):
+            position = self._column_position(node)
+            return lambda values: values[position]
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float, bool, type(None))):
+            constant = node.value
+            return lambda values: constant
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) \
+                and isinstance(node.operand, ast.Constant) and isinstance(node.operand.value, (int, float)):
+            constant = -node.operand.value
+            return lambda values: constant
+        if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+            items = [self._compile_value(item) for item in node.elts]
+            return lambda values: [item(values) for item in items]
+        raise self._error(node)
+
+
+def make_row_filter(where):
+    """筛选条件文本转换成 RowFilter；None 或空文本返回 None"""
+    if where is None or isinstance(where, RowFilter):
+        return where
+    return RowFilter(where) if str(where).strip() else None
+
+
+def project(header, columns=None, row_filter=None, strict=False):
+    """
+    按表头确定要读取的列
+
+    参数:
+        header: 列名列表
+        columns: 选择的列名；None 表示全部列
+        row_filter: RowFilter 或 None
+        strict: 为 True 时选择的列或筛选条件中的列不在表头中就抛出 ValueError
+
+    返回:
+        (选择的列名, 对应的列号列表（从1开始）, 筛选条件各列的列号列表（缺少的列为0）或 None)
+    """
+    positions = {}
+    for idx, name in enumerate(header, 1):
+        positions.setdefault(name, idx)
+    if columns is None:
+        selected = list(header)
+    else:
+        missing = [name for name in columns if name not in positions]
+        if missing and strict:
+            raise ValueError(f"列不存在: {', '.join(map(str, missing))}")
+        selected = [name for name in columns if name in positions]
+    indices = [positions[name] for name in selected]
+    predicate_indices = None
+    if row_filter is not None:
+        missing = [name for name in row_filter.columns if name not in positions]
+        if missing and strict:
+            raise ValueError(f"筛选条件中的列不存在: {', '.join(map(str, missing))}")
+        predicate_indices = [positions.get(name, 0) for name in row_filter.columns]
+    return selected, indices, predicate_indices
+
+
+def pick(values, indices):
+    """按列号（从1开始，0 表示缺少的列）取出一行中的值"""
+    size = len(values)
+    return [values[idx - 1] if 0 < idx <= size else None for idx in indices]
+
+
+def filter_rows(rows, indices, row_filter=None, predicate_indices=None):
+    """对 (行号, 值列表) 逐行筛选并只保留选择的列"""
+    predicate = row_filter.predicate if row_filter is not None else None
+    for row_number, values in rows:
+        if predicate is not None and not predicate(pick(values, predicate_indices)):
+            continue
+        yield row_number, pick(values, indices)
+
+
+def filter_frame(df, row_filter):
+    """按筛选条件过滤 DataFrame 的行（缺少的列按空值处理）"""
+    names = {str(column): column for column in df.columns}
+    series = [df[names[name]].tolist() if name in names else [None] * len(df) for name in row_filter.columns]
+    predicate = row_filter.predicate
+    mask = [predicate(list(values)) for values in zip(*series)] if series else [predicate([])] * len(df)
+    # 用 loc 按行选择：空 DataFrame 的 mask 为 []，df[[]] 会变成选择列
+    return df.loc[mask].reset_index(drop=True)
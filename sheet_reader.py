@@ -0,0 +1,437 @@
+"""
+流式工作表读取 - 直接解析 xlsx 中的 XML
+
+只按需解析行，不创建 openpyxl 单元格对象；读取前几行时读到即停。
+"""
+
+import re
+import posixpath
+import zipfile
+import datetime
+import xml.etree.ElementTree as ET
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+from openpyxl.utils.datetime import from_excel, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+
+
+# 字节级扫描使用的正则，适用于 Excel / openpyxl / pandas 等常见写法
+# （默认命名空间，单元格的 r 属性写在第一位）
+SCAN_CHUNK_SIZE = 1 << 20
+# 单元格只有包含 <v> 值或内联字符串 <is> 时才算有内容，<c r="A5"></c> 这样的空元素不算
+# （子元素顺序为 f、v、is，公式没有缓存值时也不算）
+_CELL_VALUE = rb'[^>]*(?<!/)>(?:<f[^>]*/>|<f[^>]*>[^<]*</f>)?(?:<v>[^<]|<is>)'
+A_CELL_RE = re.compile(rb'<c r="A(\d+)"' + _CELL_VALUE)
+CELL_COLUMN_RE = re.compile(rb'<c r="([A-Z]+)\d+"' + _CELL_VALUE)
+VALUE_RE = re.compile(rb'<v>[^<]|<is>')
+ROW_RE = re.compile(rb'<row r="(\d+)"[^>]*?(/?)>')
+MERGE_CELL_RE = re.compile(rb'<mergeCell ref="([^"]+)"')
+DIMENSION_RE = re.compile(rb'<dimension ref="([^"]+)"')
+
+
+def local_name(tag):
+    """去掉命名空间的标签名（同时兼容 Transitional 和 Strict 格式）"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def column_index(cell_ref):
+    """单元格引用（如 'AB12'）对应的列号，从1开始"""
+    letters = cell_ref.rstrip("0123456789")
+    return column_index_from_string(letters)
+
+
+def _has_value(cell):
+    """<c> 元素是否有值（<v> 或内联字符串 <is>）"""
+    for child in cell:
+        name = local_name(child.tag)
+        if name == "is" or name == "v" and child.text:
+            return True
+    return False
+
+
+class XlsxSheetSource:
+    """xlsx 文件中的工作表信息及流式读取"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.zip = zipfile.ZipFile(file_path)
+        self._shared_strings = None
+        self._date_styles = None
+        self._epoch = CALENDAR_WINDOWS_1900
+        self.sheets = []  # [(工作表名, XML路径)]
+        self.active_index = 0
+        self._read_workbook()
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_workbook(self):
+        """读取工作表名称、XML 路径和活动工作表"""
+        rels = {}
+        rels_root = ET.fromstring(self.zip.read("xl/_rels/workbook.xml.rels"))
+        for rel in rels_root:
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            rels[rel.get("Id")] = target
+
+        root = ET.fromstring(self.zip.read("xl/workbook.xml"))
+        for element in root.iter():
+            name = local_name(element.tag)
+            if name == "sheet":
+                rel_id = next((v for k, v in element.attrib.items() if local_name(k) == "id"), None)
+                if rel_id in rels:
+                    self.sheets.append((element.get("name"), rels[rel_id]))
+            elif name == "workbookView":
+                self.active_index = int(element.get("activeTab", 0))
+            elif name == "workbookPr":
+                if element.get("date1904") in ("1", "true"):
+                    self._epoch = CALENDAR_MAC_1904
+        if not 0 <= self.active_index < len(self.sheets):
+            self.active_index = 0
+
+    @property
+    def sheet_names(self):
+        return [name for name, _ in self.sheets]
+
+    def sheet_path(self, sheet=None):
+        """工作表的 XML 路径；sheet 为名称或序号，默认活动工作表"""
+        if sheet is None:
+            return self.sheets[self.active_index][1]
+        if isinstance(sheet, int):
+            return self.sheets[sheet][1]
+        for name, path in self.sheets:
+            if name == sheet:
+                return path
+        raise KeyError(f"工作表不存在: {sheet}")
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if "xl/sharedStrings.xml" in self.zip.namelist():
+                with self.zip.open("xl/sharedStrings.xml") as f:
+                    for event, element in ET.iterparse(f):
+                        if local_name(element.tag) == "si":
+                            self._shared_strings.append(self._rich_text(element))
+                            element.clear()
+        return self._shared_strings
+
+    @staticmethod
+    def _rich_text(element):
+        """<si> 或 <is> 中的文字（忽略拼音注音）"""
+        parts = []
+        for child in element:
+            name = local_name(child.tag)
+            if name == "t":
+                parts.append(child.text or "")
+            elif name == "r":
+                for t in child:
+                    if local_name(t.tag) == "t":
+                        parts.append(t.text or "")
+        return "".join(parts)
+
+    @property
+    def date_styles(self):
+        """数字格式为日期的单元格样式序号"""
+        if self._date_styles is None:
+            self._date_styles = set()
+            if "xl/styles.xml" in self.zip.namelist():
+                root = ET.fromstring(self.zip.read("xl/styles.xml"))
+                custom_formats = {}
+                cell_xfs = []
+                for element in root:
+                    name = local_name(element.tag)
+                    if name == "numFmts":
+                        for fmt in element:
+                            custom_formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+                    elif name == "cellXfs":
+                        cell_xfs = [int(xf.get("numFmtId", 0)) for xf in element]
+                for index, fmt_id in enumerate(cell_xfs):
+                    code = custom_formats.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+                    if code and is_date_format(code):
+                        self._date_styles.add(index)
+        return self._date_styles
+
+    def _cell_value(self, cell):
+        """把 <c> 元素转换成 Python 值"""
+        cell_type = cell.get("t", "n")
+        value = None
+        for child in cell:
+            name = local_name(child.tag)
+            if name == "v":
+                value = child.text
+            elif name == "is":
+                return self._rich_text(child)
+        if value is None:
+            return None
+        if cell_type == "s":
+            return self.shared_strings[int(value)]
+        if cell_type == "b":
+            return value == "1"
+        if cell_type in ("str", "e", "inlineStr"):
+            return value
+        if cell_type == "d":
+            return datetime.datetime.fromisoformat(value)
+        number = float(value) if any(c in value for c in ".eE") else int(value)
+        style = cell.get("s")
+        if style is not None and int(style) in self.date_styles:
+            return from_excel(number, self._epoch)
+        return number
+
+    def probe_sheet(self, sheet=None):
+        """
+        不解析单元格，返回 {'xml_bytes', 'dimension', 'max_row', 'max_column'}
+
+        xml_bytes 是解压后的工作表 XML 大小；行列数来自 dimension，未记录时为 None。
+        """
+        path = self.sheet_path(sheet)
+        with self.zip.open(path) as f:
+            match = DIMENSION_RE.search(f.read(1 << 16))
+        dimension = match.group(1).decode() if match else None
+        max_row = max_column = None
+        if dimension:
+            last = dimension.split(":")[-1]
+            max_column = column_index(last)
+            max_row = int(last[len(last.rstrip("0123456789")):] or 0) or None
+        return {
+            "xml_bytes": self.zip.getinfo(path).file_size,
+            "dimension": dimension,
+            "max_row": max_row,
+            "max_column": max_column,
+        }
+
+    def iter_rows(self, sheet=None, min_row=1, max_row=None, columns=None, predicate=None, predicate_columns=None):
+        """
+        流式读取行，生成 (行号, [单元格值, ...])
+
+        没有内容的行不会生成；读到 max_row 后立即停止解析。
+
+        columns: 只读取这些列（列号从1开始），值的顺序与 columns 相同；其他列的单元格不转换
+        predicate / predicate_columns: 先转换 predicate_columns 中的列（0 表示缺少的列，值为 None），
+            predicate(值列表) 为假的行不生成，其余单元格也不转换（见 row_filter.RowFilter）
+        """
+        if columns is not None or predicate is not None:
+            yield from self._iter_projected_rows(sheet, min_row, max_row, columns, predicate, predicate_columns)
+            return
+        with self.zip.open(self.sheet_path(sheet)) as f:
+            row_number = 0
+            sheet_data = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if sheet_data is None and local_name(element.tag) == "sheetData":
+                        sheet_data = element
+                    continue
+                if local_name(element.tag) != "row":
+                    continue
+                row_number = int(element.get("r", row_number + 1))
+                if max_row is not None and row_number > max_row:
+                    break
+                if row_number >= min_row:
+                    values = []
+                    col = 0
+                    for cell in element:
+                        ref = cell.get("r")
+                        col = column_index(ref) if ref else col + 1
+                        if col > len(values) + 1:
+                            values.extend([None] * (col - len(values) - 1))
+                        values.append(self._cell_value(cell))
+                    yield row_number, values
+                # 已处理的行从树中移除，内存占用与行数无关
+                sheet_data.clear()
+
+    def _iter_projected_rows(self, sheet, min_row, max_row, columns, predicate, predicate_columns):
+        """iter_rows 只读取部分列或筛选行时的实现"""
+        wanted = set(columns or ())
+        if predicate is not None:
+            wanted.update(c for c in predicate_columns if c)
+        last_wanted = max(wanted) if columns is not None else None
+        with self.zip.open(self.sheet_path(sheet)) as f:
+            row_number = 0
+            sheet_data = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if sheet_data is None and local_name(element.tag) == "sheetData":
+                        sheet_data = element
+                    continue
+                if local_name(element.tag) != "row":
+                    continue
+                row_number = int(element.get("r", row_number + 1))
+                if max_row is not None and row_number > max_row:
+                    break
+                if row_number >= min_row:
+                    # 只记下需要的单元格元素，转换推迟到筛选之后
+                    cells = {}
+                    col = 0
+                    for cell in element:
+                        ref = cell.get("r")
+                        col = column_index(ref) if ref else col + 1
+                        if last_wanted is not None and col > last_wanted:
+                            break
+                        if columns is None or col in wanted:
+                            cells[col] = cell
+                    converted = {}
+
+                    def value(col):
+                        if col not in converted:
+                            cell = cells.get(col)
+                            converted[col] = self._cell_value(cell) if cell is not None else None
+                        return converted[col]
+
+                    if predicate is None or predicate([value(c) for c in predicate_columns]):
+                        if columns is None:
+                            size = max(cells, default=0)
+                            yield row_number, [value(c) for c in range(1, size + 1)]
+                        else:
+                            yield row_number, [value(c) for c in columns]
+                sheet_data.clear()
+
+    def scan_sheet(self, sheet=None):
+        """
+        扫描整个工作表的结构，不转换单元格的值
+
+        返回 {'dimension', 'max_row', 'max_column', 'merged_ranges', 'empty_a_rows'}，
+        empty_a_rows 为第2行到最后一行中A列为空的行数（与拆分时跳过的行一致）。
+        只统计有值（<v> 或 <is>）的单元格：没有值的 <c> 元素不计入行数、列数和A列有内容的行。
+        常见写法的工作表按字节扫描，其他写法退回到逐元素解析。
+        """
+        result = self._scan_sheet_bytes(sheet)
+        if result is None:
+            result = self._scan_sheet_xml(sheet)
+        return result
+
+    def _scan_sheet_bytes(self, sheet=None):
+        """按字节扫描解压后的 XML；不是常见写法时返回 None"""
+        dimension = None
+        merged_ranges = []
+        last_row = 0
+        columns = set()
+        filled_a_rows = 0
+        checked_layout = False
+
+        with self.zip.open(self.sheet_path(sheet)) as f:
+            buffer = b""
+            while True:
+                chunk = f.read(SCAN_CHUNK_SIZE)
+                buffer += chunk
+                # 只处理到最后一行（或最后一个标签）之前，剩余部分留到下一块
+                cut = len(buffer)
+                if chunk:
+                    cut = buffer.rfind(b"<row ")
+                    if cut <= 0:
+                        # 一行超过一块时在单元格开始处切开，保证单元格完整
+                        cut = buffer.rfind(b"<c ")
+                    if cut <= 0:
+                        cut = buffer.rfind(b"<")
+                if cut <= 0 and chunk:
+                    continue
+                segment, buffer = buffer[:cut], buffer[cut:]
+
+                if not checked_layout:
+                    if b"<worksheet" not in segment:
+                        return None
+                    if b"<sheetData" in segment and b"<row" in segment and b'<row r="' not in segment:
+                        return None
+                    if b"<c " in segment and b'<c r="' not in segment:
+                        return None
+                    checked_layout = b"<row" in segment or b"</sheetData>" in segment
+                    match = DIMENSION_RE.search(segment)
+                    if match:
+                        dimension = match.group(1).decode()
+
+                for row in A_CELL_RE.findall(segment):
+                    if row != b"1":
+                        filled_a_rows += 1
+                if dimension is None:
+                    columns.update(CELL_COLUMN_RE.findall(segment))
+                if b"<mergeCell" in segment:
+                    merged_ranges.extend(ref.decode() for ref in MERGE_CELL_RE.findall(segment))
+
+                # 最后一个有内容的行
+                pos = end = len(segment)
+                while True:
+                    pos = segment.rfind(b'<row r="', 0, pos)
+                    if pos < 0:
+                        break
+                    match = ROW_RE.match(segment, pos)
+                    if match and not match.group(2) and VALUE_RE.search(segment, match.end(), end):
+                        last_row = max(last_row, int(match.group(1)))
+                        break
+                    end = pos
+
+                if not chunk:
+                    break
+
+        if dimension is not None:
+            max_column = column_index(dimension.split(":")[-1])
+        else:
+            max_column = max((column_index_from_string(c.decode()) for c in columns), default=0)
+
+        return {
+            "dimension": dimension,
+            "max_row": last_row,
+            "max_column": max_column,
+            "merged_ranges": merged_ranges,
+            "empty_a_rows": max(last_row - 1, 0) - filled_a_rows,
+        }
+
+    def _scan_sheet_xml(self, sheet=None):
+        """逐元素解析 XML 扫描工作表结构"""
+        dimension = None
+        merged_ranges = []
+        last_row = 0
+        max_column = 0
+        filled_a_rows = 0
+
+        with self.zip.open(self.sheet_path(sheet)) as f:
+            row_number = 0
+            sheet_data = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                name = local_name(element.tag)
+                if event == "start":
+                    if name == "sheetData":
+                        sheet_data = element
+                    continue
+                if name == "row":
+                    row_number = int(element.get("r", row_number + 1))
+                    filled = [(idx, cell) for idx, cell in enumerate(element, 1) if _has_value(cell)]
+                    if filled:
+                        last_row = row_number
+                        idx, last = filled[-1]
+                        last_ref = last.get("r")
+                        max_column = max(max_column, column_index(last_ref) if last_ref else idx)
+                        idx, first = filled[0]
+                        first_ref = first.get("r")
+                        is_column_a = coordinate_from_string(first_ref)[0] == "A" if first_ref else idx == 1
+                        if row_number >= 2 and is_column_a:
+                            filled_a_rows += 1
+                    sheet_data.clear()
+                elif name == "dimension":
+                    dimension = element.get("ref")
+                elif name == "mergeCell":
+                    merged_ranges.append(element.get("ref"))
+                    element.clear()
+
+        return {
+            "dimension": dimension,
+            "max_row": last_row,
+            "max_column": max_column,
+            "merged_ranges": merged_ranges,
+            "empty_a_rows": max(last_row - 1, 0) - filled_a_rows,
+        }
+
+
+def open_sheet_source(file_path):
+    """xlsx 返回 XlsxSheetSource，CSV / TSV 返回 csv_reader.CsvSource（接口相同）"""
+    from csv_reader import CsvSource, is_csv_file
+    if is_csv_file(file_path):
+        return CsvSource(file_path)
+    return XlsxSheetSource(file_path)
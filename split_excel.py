@@ -1,124 +1,411 @@
-import pandas as pd
 import os
 from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 import shutil
+import time
 
-def split_excel_by_rows(input_file):
+from perf_trace import NULL_TRACER
+from memory_budget import ENGINE_AUTO, ENGINE_MEMORY, ENGINE_STREAMING, calibration_job, plan_memory
+from job_planner import record_run
+from memory_monitor import MemorySampler
+from header_style import compile_header_style, styled_cell
+from row_filter import make_row_filter, project, filter_rows
+from csv_reader import is_csv_file
+
+
+def cell_display_width(value):
+    """计算单元格内容的显示宽度，中文等非ASCII字符按2个字符计算"""
+    if not value:
+        return 0
+    length = 0
+    for char in str(value):
+        if ord(char) > 127:  # 中文字符
+            length += 2
+        else:
+            length += 1
+    return length
+
+
+# 分块拆分时默认的文件名模板
+DEFAULT_CHUNK_TEMPLATE = "{first}-{last}"
+
+
+def clean_filename(text):
+    """清理文件名中的非法字符"""
+    return "".join(c for c in str(text) if c.isalnum() or c in (' ', '-', '_', '(', ')', '（', '）', '，', '。')).strip()
+
+
+def unique_output_path(output_dir, filename):
+    """文件名已存在时添加序号，返回 (文件名, 路径)"""
+    output_path = os.path.join(output_dir, filename)
+    counter = 1
+    original_filename = filename
+    while os.path.exists(output_path):
+        name, ext = os.path.splitext(original_filename)
+        filename = f"{name}_{counter}{ext}"
+        output_path = os.path.join(output_dir, filename)
+        counter += 1
+    return filename, output_path
+
+
+def format_chunk_filename(template, first, last, index, count):
+    """
+    按模板生成分块文件名（不含扩展名）
+    
+    可用字段: {first} 第一行的A列, {last} 最后一行的A列, {index} 文件序号, {count} 行数
+    """
+    return template.format(first=first, last=last, index=index, count=count)
+
+
+def fit_column_widths(header, rows):
+    """按表头和所有数据行计算列宽：最小宽度为8，最大宽度为50"""
+    lengths = [cell_display_width(value) for value in header]
+    for values in rows:
+        for idx, value in enumerate(values):
+            if value is not None:
+                length = cell_display_width(value)
+                if length > lengths[idx]:
+                    lengths[idx] = length
+    return [min(max(length + 2, 8), 50) for length in lengths]
+
+
+def write_chunk(output_path, header, rows, widths, style_table):
+    """
+    用 write_only 模式写出一个分块：带样式的表头和多行数据
+    
+    只有设置了数字格式的列才创建单元格对象，其余数据直接写值
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet")
+    # write_only 模式下列宽和冻结窗格必须在写入第一行之前设置
+    for col, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    style_table.apply_sheet(ws)
+    header_styles, data_styles = style_table.register(ws)
+    
+    header_cells = []
+    for col, value in enumerate(header, 1):
+        cell = WriteOnlyCell(ws, value=value)
+        if col in header_styles:
+            styled_cell(cell, header_styles[col])
+        header_cells.append(cell)
+    ws.append(header_cells)
+    
+    if data_styles:
+        styled_columns = [(col - 1, style) for col, style in data_styles.items() if col <= len(header)]
+        for values in rows:
+            values = list(values)
+            for idx, style in styled_columns:
+                values[idx] = styled_cell(WriteOnlyCell(ws, value=values[idx]), style)
+            ws.append(values)
+    else:
+        for values in rows:
+            ws.append(values)
+    wb.save(output_path)
+
+
+def iter_streaming_rows(source, max_column, columns=None, row_filter=None, predicate_columns=None):
+    """
+    流式读取第2行起的数据行，每行补齐或截断到 max_column 列
+    
+    columns / row_filter / predicate_columns: 只读取这些列、只生成满足条件的行（见 row_filter.project），
+    筛选在解析时进行，不需要的单元格不转换
+    """
+    predicate = row_filter.predicate if row_filter is not None else None
+    for row_number, values in source.iter_rows(min_row=2, columns=columns, predicate=predicate,
+                                               predicate_columns=predicate_columns):
+        if len(values) < max_column:
+            values.extend([None] * (max_column - len(values)))
+        yield row_number, values[:max_column]
+
+
+def select_columns(header, columns=None, row_filter=None):
+    """
+    按列名选择列：返回 (选择后的表头, 列号列表, 筛选条件各列的列号列表)
+    
+    列名与合并时相同（空表头为 Unnamed: n，重复列名加 .1、.2）；列不存在时抛出 ValueError
+    """
+    from profile_excel import column_names
+    names = column_names(header)
+    selected, indices, predicate_indices = project(names, columns, row_filter, strict=True)
+    if not indices:
+        raise ValueError("没有选择任何列")
+    return [header[idx - 1] for idx in indices], indices, predicate_indices
+
+
+def read_sheet_values(input_file):
+    """读入整个工作簿，返回活动工作表的 (表头, [(行号, 值列表), ...], {'max_row', 'max_column'})"""
+    if is_csv_file(input_file):
+        from csv_reader import CsvSource
+        with CsvSource(input_file) as source:
+            records = list(source.iter_rows())
+        max_column = max((len(values) for _, values in records), default=0)
+        padded = [(row_num, values + [None] * (max_column - len(values))) for row_num, values in records]
+        header = padded[0][1] if padded else []
+        max_row = padded[-1][0] if padded else 1
+        return header, padded[1:], {"max_row": max_row, "max_column": max_column}
+    source_wb = load_workbook(input_file)
+    source_ws = source_wb.active
+    max_row, max_column = source_ws.max_row, source_ws.max_column
+    header = [source_ws.cell(row=1, column=col).value for col in range(1, max_column + 1)]
+    rows = [(row_num, list(values)) for row_num, values in
+            enumerate(source_ws.iter_rows(min_row=2, max_col=max_column, values_only=True), 2)]
+    return header, rows, {"max_row": max_row, "max_column": max_column}
+
+
+@calibration_job()
+def split_excel_by_rows(input_file, output_dir=None, log=print, progress=None, checkpoint=None,
+                        tracer=None, engine=ENGINE_AUTO, memory_budget=None, memory_report=None,
+                        rows_per_file=1, filename_template=None, header_style=None, columns=None, where=None,
+                        parse_cache=None):
     """
     按照表头分割Excel文件，每一行对应一个文件
     表头只有第1行
     文件名按照分割后文件的A2单元格内容命名
-    F1~K1需要蓝色填充，L1~M1需要红色填充
+    表头样式由 header_style 配置决定，默认F1~K1蓝色填充，L1~M1红色填充
     所有列宽根据字符长度自动适应宽度
+    
+    参数:
+        input_file: 要拆分的 Excel 文件路径，也可以是 CSV / TSV 文件（自动判断编码和分隔符，见 csv_reader.py）
+        output_dir: 输出目录，默认为源文件所在目录下的 split_files
+        log: 输出日志消息的函数
+        progress: 进度回调 progress(已处理行数, 总行数, 已处理行数)
+        checkpoint: 每行调用一次，用于暂停或取消任务
+        tracer: perf_trace.Tracer，记录各阶段耗时和 rows/cells/bytes 计数
+        engine: 'memory' 读入整个工作簿，'streaming' 逐行解析（公式单元格取缓存的计算结果），
+                'auto' 按内存预算选择；CSV / TSV 只有指定 'memory' 时才整个读入，否则总是逐行读取
+        memory_budget: 内存预算（字节），见 memory_budget.plan_memory
+        memory_report: 指定处理方式或预算时，结束后以 MemoryPlan.to_dict() 调用
+        rows_per_file: 每个文件的数据行数；大于1时把连续的多行写入同一个文件（write_only 写出），
+                       列宽按整个文件的内容计算
+        filename_template: 文件名模板（见 format_chunk_filename），默认每行一个文件时用A列内容，
+                           分块时为 "{first}-{last}"
+        header_style: 表头样式配置（见 header_style.py），默认为 DEFAULT_HEADER_STYLE
+        columns: 只保留这些列（列名列表，按此顺序），第一个列作为A列决定文件名；默认全部列
+        where: 筛选条件（见 row_filter.py），如 '地区 == "华东"'，只拆分满足条件的行
+        parse_cache: parse_cache.ParseCache，读入整个工作簿时缓存读取到的单元格值，
+                     内容相同的文件再次拆分时不再解析；流式拆分（包括 CSV / TSV）不使用缓存
+    
+    返回:
+        创建的文件数
     """
+    if tracer is None:
+        tracer = NULL_TRACER
+    if rows_per_file < 1:
+        raise ValueError("每个文件的行数必须大于0")
+    if filename_template is None and rows_per_file > 1:
+        filename_template = DEFAULT_CHUNK_TEMPLATE
+    if filename_template is not None:
+        try:
+            format_chunk_filename(filename_template, "A", "B", 1, 1)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"文件名模板无效: {filename_template} ({e})")
+    row_filter = make_row_filter(where)
+    plan = sampler = source = None
+    start = time.perf_counter()
+    # CSV / TSV 可以逐行读取：除非明确指定 memory，都不整个读入内存
+    csv_streaming = is_csv_file(input_file) and engine != ENGINE_MEMORY
+    if engine != ENGINE_AUTO or memory_budget:
+        plan = plan_memory("split", [input_file], memory_budget, ENGINE_STREAMING if csv_streaming else engine)
+        log(plan.describe())
+        sampler = MemorySampler().start()
+    streaming = csv_streaming or plan is not None and plan.engine == ENGINE_STREAMING
     try:
-        # 使用openpyxl读取原始文件
-        source_wb = load_workbook(input_file)
-        source_ws = source_wb.active
+        if streaming:
+            # 逐行解析 XML（CSV / TSV 逐行读取），不把整个文件读入内存
+            from sheet_reader import open_sheet_source
+            with tracer.span("split.open_stream"):
+                source = open_sheet_source(input_file)
+                info = source.probe_sheet()
+                if info["max_row"] is None:
+                    info = source.scan_sheet()
+                max_row, max_column = info["max_row"], info["max_column"]
+                input_cells = max_row * max_column
+                first = next(source.iter_rows(max_row=1), None)
+                header = first[1] if first and first[0] == 1 else []
+                header = (header + [None] * max_column)[:max_column]
+            if columns is not None or row_filter is not None:
+                header, indices, predicate_indices = select_columns(header, columns, row_filter)
+                max_column = len(header)
+                data_rows = iter_streaming_rows(source, max_column, indices, row_filter, predicate_indices)
+            else:
+                data_rows = iter_streaming_rows(source, max_column)
+        elif parse_cache is not None or is_csv_file(input_file):
+            # 缓存或明确指定 memory 的 CSV / TSV
+            with tracer.span("split.load_workbook"):
+                if parse_cache is not None:
+                    header, data_rows, info = parse_cache.load_sheet(
+                        input_file, lambda: read_sheet_values(input_file), reader="openpyxl")
+                else:
+                    header, data_rows, info = read_sheet_values(input_file)
+            max_row, max_column = info["max_row"], info["max_column"]
+            input_cells = max_row * max_column
+            if columns is not None or row_filter is not None:
+                header, indices, predicate_indices = select_columns(header, columns, row_filter)
+                max_column = len(header)
+                data_rows = filter_rows(data_rows, indices, row_filter, predicate_indices)
+        else:
+            # 使用openpyxl读取原始文件
+            with tracer.span("split.load_workbook"):
+                source_wb = load_workbook(input_file)
+                source_ws = source_wb.active
+            max_row, max_column = source_ws.max_row, source_ws.max_column
+            input_cells = max_row * max_column
+            header = [source_ws.cell(row=1, column=col).value for col in range(1, max_column + 1)]
+            data_rows = enumerate(source_ws.iter_rows(min_row=2, max_col=max_column, values_only=True), 2)
+            if columns is not None or row_filter is not None:
+                header, indices, predicate_indices = select_columns(header, columns, row_filter)
+                max_column = len(header)
+                data_rows = filter_rows(data_rows, indices, row_filter, predicate_indices)
+        tracer.count_file_bytes("input_bytes", input_file)
         
-        print(f"Excel文件结构:")
-        print(f"最大行数: {source_ws.max_row}")
-        print(f"最大列数: {source_ws.max_column}")
+        log(f"Excel文件结构: 最大行数={max_row}, 最大列数={max_column}")
+        if columns is not None:
+            log(f"只保留 {len(columns)} 列: {', '.join(map(str, columns))}")
+        if row_filter is not None:
+            log(f"筛选条件: {row_filter.expression}")
         
         # 创建输出目录
-        output_dir = os.path.join(os.path.dirname(input_file), "split_files")
+        if output_dir is None:
+            output_dir = os.path.join(os.path.dirname(input_file), "split_files")
         if os.path.exists(output_dir):
             try:
                 shutil.rmtree(output_dir)  # 删除旧文件
             except PermissionError:
-                print("无法删除旧文件，将覆盖现有文件")
+                log("警告: 无法删除旧文件，将覆盖现有文件")
         os.makedirs(output_dir, exist_ok=True)
         
-        # 定义颜色填充
-        blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")  # 浅蓝色
-        red_fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")    # 浅红色
+        # 表头样式每个任务只编译一次
+        style_table = compile_header_style(header_style, header)
         
-        # 遍历每一行数据（从第2行开始，因为第1行是表头）
         file_count = 0
-        for row_num in range(2, source_ws.max_row + 1):
+        rows_written = 0
+        chunk = []
+        
+        def write_chunk_file():
+            """写出当前分块"""
+            nonlocal file_count, rows_written
+            with tracer.span("split.fit_widths"):
+                widths = style_table.apply_widths(fit_column_widths(header, chunk))
+            with tracer.span("split.filename"):
+                filename_base = clean_filename(format_chunk_filename(
+                    filename_template, chunk[0][0], chunk[-1][0], file_count + 1, len(chunk)))
+                if not filename_base:
+                    filename_base = f"file_{file_count + 1}"
+                filename, output_path = unique_output_path(output_dir, f"{filename_base}.xlsx")
+            with tracer.span("split.save"):
+                write_chunk(output_path, header, chunk, widths, style_table)
+            log(f"已创建文件: {filename}（{len(chunk)} 行）")
+            file_count += 1
+            rows_written += len(chunk)
+            tracer.count("rows", len(chunk))
+            tracer.count("cells", (len(chunk) + 1) * max_column)
+            if tracer.enabled:
+                tracer.count_file_bytes("output_bytes", output_path)
+            chunk.clear()
+        
+        # 遍历每一行数据（从第2行开始，因为第1行是表头）
+        total_rows = max_row - 1  # 排除表头行
+        for row_num, values in data_rows:
+            if checkpoint is not None:
+                checkpoint()
+            if progress is not None:
+                progress(row_num - 1, total_rows, row_num - 1)
+            
             # 检查该行是否有数据（检查A列是否有内容）
-            if source_ws.cell(row=row_num, column=1).value is None:
+            if values[0] is None:
                 continue
             
-            # 创建新的工作簿
-            wb = Workbook()
-            ws = wb.active
+            if rows_per_file > 1:
+                # 分块：攒够 rows_per_file 行再写出一个文件
+                chunk.append(list(values))
+                if len(chunk) >= rows_per_file:
+                    write_chunk_file()
+                continue
             
-            # 复制表头第1行
-            for col in range(1, source_ws.max_column + 1):
-                source_cell = source_ws.cell(row=1, column=col)
-                target_cell = ws.cell(row=1, column=col)
-                target_cell.value = source_cell.value
+            with tracer.span("split.copy_cells"):
+                # 创建新的工作簿
+                wb = Workbook()
+                ws = wb.active
+                style_table.apply_sheet(ws)
+                header_styles, data_styles = style_table.register(ws)
+                
+                # 复制表头第1行并应用表头样式
+                for col in range(1, max_column + 1):
+                    target_cell = ws.cell(row=1, column=col)
+                    target_cell.value = header[col - 1]
+                    if col in header_styles:
+                        styled_cell(target_cell, header_styles[col])
                 
-                # 应用颜色填充
-                if 6 <= col <= 11:  # F1~K1 (列6-11)
-                    target_cell.fill = blue_fill
-                elif 12 <= col <= 13:  # L1~M1 (列12-13)
-                    target_cell.fill = red_fill
+                # 复制数据行（第2行）
+                for col in range(1, max_column + 1):
+                    target_cell = ws.cell(row=2, column=col)
+                    target_cell.value = values[col - 1]
+                    if col in data_styles:
+                        styled_cell(target_cell, data_styles[col])
             
-            # 复制数据行（第2行）
-            for col in range(1, source_ws.max_column + 1):
-                source_cell = source_ws.cell(row=row_num, column=col)
-                target_cell = ws.cell(row=2, column=col)
-                target_cell.value = source_cell.value
+            with tracer.span("split.fit_widths"):
+                # 自动调整列宽
+                for col in range(1, max_column + 1):
+                    column_letter = ws.cell(row=1, column=col).column_letter
+                    
+                    # 检查表头和数据行的内容长度（检查第1行和第2行）
+                    max_length = max(cell_display_width(ws.cell(row=row, column=col).value) for row in range(1, 3))
+                    
+                    # 设置列宽，最小宽度为8，最大宽度为50
+                    adjusted_width = min(max(max_length + 2, 8), 50)
+                    ws.column_dimensions[column_letter].width = style_table.widths.get(col, adjusted_width)
             
-            # 自动调整列宽
-            for col in range(1, source_ws.max_column + 1):
-                column_letter = ws.cell(row=1, column=col).column_letter
-                max_length = 0
+            with tracer.span("split.filename"):
+                # 获取该文件A2单元格的内容作为文件名
+                key = ws.cell(row=2, column=1).value
+                if filename_template is not None:
+                    filename_base = format_chunk_filename(filename_template, key, key, file_count + 1, 1)
+                else:
+                    filename_base = str(key) if key else f"file_{file_count + 1}"
                 
-                # 检查表头和数据行的内容长度
-                for row in range(1, 3):  # 检查第1行和第2行
-                    cell_value = ws.cell(row=row, column=col).value
-                    if cell_value:
-                        # 计算字符长度，中文字符按2个字符计算
-                        length = 0
-                        for char in str(cell_value):
-                            if ord(char) > 127:  # 中文字符
-                                length += 2
-                            else:
-                                length += 1
-                        max_length = max(max_length, length)
+                # 清理文件名中的非法字符
+                filename_base = clean_filename(filename_base)
+                if not filename_base:
+                    filename_base = f"file_{file_count + 1}"
                 
-                # 设置列宽，最小宽度为8，最大宽度为50
-                adjusted_width = min(max(max_length + 2, 8), 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # 获取该文件A2单元格的内容作为文件名
-            filename_base = str(ws.cell(row=2, column=1).value) if ws.cell(row=2, column=1).value else f"file_{file_count + 1}"
-            
-            # 清理文件名中的非法字符
-            filename_base = "".join(c for c in filename_base if c.isalnum() or c in (' ', '-', '_', '(', ')', '（', '）', '，', '。')).strip()
-            if not filename_base:
-                filename_base = f"file_{file_count + 1}"
-            
-            # 生成文件名
-            filename = f"{filename_base}.xlsx"
-            output_path = os.path.join(output_dir, filename)
-            
-            # 如果文件名已存在，添加序号
-            counter = 1
-            original_filename = filename
-            while os.path.exists(output_path):
-                name, ext = os.path.splitext(original_filename)
-                filename = f"{name}_{counter}{ext}"
-                output_path = os.path.join(output_dir, filename)
-                counter += 1
+                # 生成文件名，如果文件名已存在，添加序号
+                filename, output_path = unique_output_path(output_dir, f"{filename_base}.xlsx")
             
             # 保存文件
-            wb.save(output_path)
-            print(f"已创建文件: {filename}")
+            with tracer.span("split.save"):
+                wb.save(output_path)
+            log(f"已创建文件: {filename}")
             file_count += 1
+            rows_written += 1
+            tracer.count("rows")
+            tracer.count("cells", 2 * max_column)
+            if tracer.enabled:
+                tracer.count_file_bytes("output_bytes", output_path)
+        
+        if chunk:
+            write_chunk_file()
         
-        print(f"\n分割完成！共创建了 {file_count} 个文件")
-        print(f"文件保存在: {output_dir}")
+        log(f"\n分割完成！共创建了 {file_count} 个文件")
+        log(f"文件保存在: {output_dir}")
+        if parse_cache is None:
+            # 校准 job_planner 的用时估算（使用解析缓存时读取不花时间，不参与校准）
+            record_run("split", ENGINE_STREAMING if streaming else ENGINE_MEMORY, time.perf_counter() - start,
+                       input_cells, (rows_written + file_count) * max_column, 1, file_count)
+        return file_count
         
     except Exception as e:
-        print(f"处理文件时出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log(f"处理文件时出错: {str(e)}")
+        raise
+    finally:
+        if source is not None:
+            source.close()
+        if plan is not None:
+            sampler.stop()
+            plan.finish(sampler)
+            if memory_report is not None:
+                memory_report(plan.to_dict())
 
 if __name__ == "__main__":
     input_file = r"c:\Users\AllenHu\excel data\工作簿1.xlsx"
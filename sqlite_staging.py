@@ -0,0 +1,451 @@
+"""
+SQLite 暂存合并 - 把各文件的行流式写入本地 SQLite 数据库，再从数据库排序、去重、分片导出
+
+数据量超过内存时 pd.concat 无法完成合并；暂存时逐行解析（sheet_reader）、分批插入，
+排序和去重由 SQLite 在磁盘上完成，内存占用与数据量无关。
+
+暂存文件可以保留：再次合并相同的文件时，大小和修改时间没有变化的文件不再解析；
+也可以直接从暂存文件导出（excel-tool export），完全不读取 Excel。
+
+数据库结构:
+    meta     (key, value)                  读取选项（列选择、筛选条件），不同时重新暂存
+    columns  (position, name, temporal)    合并后的列，temporal 表示该列有日期时间（ISO 文字按 BLOB 保存，与文字单元格区分）
+    files    (id, path, size, mtime, ordinal, rows)
+    rows     (_file, _row, c0, c1, ...)    每个文件的数据行，cN 对应 columns 中的 position
+
+SQLite 按存储类型排序（数字 < 文字 < BLOB），有日期时间的列排序时把 BLOB 当作文字比较，
+日期和“2024-01-05 10:00”这样的文字按内容排在一起；去重仍区分日期和相同内容的文字。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import datetime
+
+from perf_trace import NULL_TRACER
+from merge_excel import read_file_header, iter_file_rows, output_format_of, StreamingOutput
+from row_filter import project
+
+# 暂存格式版本，不同时重新暂存
+STAGING_VERSION = 3
+
+# 每批插入的行数
+INSERT_BATCH_ROWS = 5000
+
+# SQLite 页缓存（KB）；排序超过缓存时使用磁盘上的临时文件
+CACHE_SIZE_KB = 65536
+
+SOURCE_COLUMN = "源文件"
+
+TEMPORAL_TYPES = (datetime.datetime, datetime.date, datetime.time)
+
+
+def _to_isoformat(value):
+    """日期时间按 ISO 文字（BLOB）暂存；日期和时间之间用空格，与文字单元格中的常见写法按相同顺序排列"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ").encode("ascii")
+    return value.isoformat().encode("ascii")
+
+
+def _from_isoformat(value):
+    """暂存时按 ISO 文字（BLOB）保存的日期时间转换回来"""
+    text = value.decode("ascii")
+    parser = datetime.time if "-" not in text else datetime.datetime
+    return parser.fromisoformat(text)
+
+
+class StagingStore:
+    """一个 SQLite 暂存文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        self.conn.execute("PRAGMA temp_store = FILE")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self._create_tables()
+        self._load_columns()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS columns "
+                              "(position INTEGER PRIMARY KEY, name TEXT UNIQUE, temporal INTEGER DEFAULT 0)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, "
+                              "size INTEGER, mtime REAL, ordinal INTEGER, rows INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS rows (_file INTEGER, _row INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS rows_file ON rows (_file, _row)")
+
+    def _load_columns(self):
+        self.columns = []
+        self.positions = {}
+        self.temporal = set()
+        for position, name, temporal in self.conn.execute(
+                "SELECT position, name, temporal FROM columns ORDER BY position"):
+            self.columns.append(name)
+            self.positions[name] = position
+            if temporal:
+                self.temporal.add(position)
+
+    def reset(self):
+        """清空所有暂存数据"""
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS rows")
+            self.conn.execute("DELETE FROM columns")
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("DELETE FROM meta")
+        self._create_tables()
+        self._load_columns()
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              (key, json.dumps(value, ensure_ascii=False)))
+
+    def ensure_columns(self, names):
+        """添加还没有的列，返回各列的 position；在调用者的事务中执行，回滚后需要 _load_columns()"""
+        for name in names:
+            if name not in self.positions:
+                position = len(self.columns)
+                self.conn.execute("INSERT INTO columns (position, name) VALUES (?, ?)", (position, name))
+                self.conn.execute(f"ALTER TABLE rows ADD COLUMN c{position}")
+                self.columns.append(name)
+                self.positions[name] = position
+        return [self.positions[name] for name in names]
+
+    def _mark_temporal(self, positions):
+        """在调用者的事务中标记有日期时间的列"""
+        new = set(positions) - self.temporal
+        if new:
+            self.conn.executemany("UPDATE columns SET temporal = 1 WHERE position = ?",
+                                  [(position,) for position in new])
+            self.temporal |= new
+
+    def file_entry(self, file_path):
+        """(id, size, mtime, rows)；没有暂存过时返回 None"""
+        return self.conn.execute("SELECT id, size, mtime, rows FROM files WHERE path = ?",
+                                 (os.path.abspath(file_path),)).fetchone()
+
+    def is_current(self, file_path):
+        """文件已暂存且大小、修改时间都没有变化"""
+        entry = self.file_entry(file_path)
+        if entry is None or entry[3] is None:
+            return False
+        stat = os.stat(file_path)
+        return entry[1] == stat.st_size and entry[2] == stat.st_mtime
+
+    def keep_files(self, excel_files):
+        """删除不在本次文件列表中的文件，并按列表顺序设置导出顺序"""
+        paths = [os.path.abspath(f) for f in excel_files]
+        with self.conn:
+            for file_id, path in self.conn.execute("SELECT id, path FROM files").fetchall():
+                if path not in paths:
+                    self.conn.execute("DELETE FROM rows WHERE _file = ?", (file_id,))
+                    self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            for ordinal, path in enumerate(paths):
+                self.conn.execute("UPDATE files SET ordinal = ? WHERE path = ?", (ordinal, path))
+
+    def remove_file(self, file_path):
+        """删除一个文件暂存的数据"""
+        path = os.path.abspath(file_path)
+        with self.conn:
+            self.conn.execute("DELETE FROM rows WHERE _file IN (SELECT id FROM files WHERE path = ?)", (path,))
+            self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def stage_file(self, file_path, ordinal, selection=None, row_filter=None, checkpoint=None,
+                   tracer=NULL_TRACER):
+        """
+        解析一个文件并写入暂存库（替换该文件以前的数据），返回 (行数, 列数)
+
+        失败（包括取消）时删除该文件以前暂存的数据：文件已经变化，旧的行不能再导出。
+        """
+        try:
+            return self._stage_file(file_path, ordinal, selection, row_filter, checkpoint, tracer)
+        except BaseException:
+            # 事务回滚后内存中的列信息与数据库重新同步，再单独删除旧数据
+            self._load_columns()
+            try:
+                self.remove_file(file_path)
+            except sqlite3.Error:
+                pass
+            raise
+
+    def _stage_file(self, file_path, ordinal, selection, row_filter, checkpoint, tracer):
+        header = read_file_header(file_path)
+        indices = predicate_indices = None
+        if selection is not None or row_filter is not None:
+            header, indices, predicate_indices = project(header, selection, row_filter)
+        add_source = SOURCE_COLUMN not in header
+        names = ([SOURCE_COLUMN] if add_source else []) + list(header)
+        source_name = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        width = len(header)
+        temporal = set()
+        file_rows = 0
+        # 新增的列、日期时间标记和数据在同一个事务中写入，读取失败时一起回滚
+        with self.conn:
+            # 行数为 NULL 表示没有暂存完，下次会重新暂存
+            self.conn.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (path,))
+            file_id = self.conn.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()[0]
+            self.conn.execute("DELETE FROM rows WHERE _file = ?", (file_id,))
+            self.conn.execute("UPDATE files SET size = ?, mtime = ?, ordinal = ?, rows = NULL WHERE id = ?",
+                              (stat.st_size, stat.st_mtime, ordinal, file_id))
+            targets = self.ensure_columns(names)
+            columns_sql = ", ".join(["_file", "_row"] + [f"c{position}" for position in targets])
+            insert_sql = f"INSERT INTO rows ({columns_sql}) VALUES ({', '.join('?' * (len(targets) + 2))})"
+            batch = []
+            for values in iter_file_rows(file_path, indices, row_filter, predicate_indices):
+                if indices is not None and all(value is None for value in values):
+                    continue
+                file_rows += 1
+                row = [file_id, file_rows]
+                if add_source:
+                    row.append(source_name)
+                for idx in range(width):
+                    value = values[idx] if idx < len(values) else None
+                    if isinstance(value, TEMPORAL_TYPES):
+                        temporal.add(targets[idx + add_source])
+                        value = _to_isoformat(value)
+                    row.append(value)
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    with tracer.span("merge.stage_insert"):
+                        self.conn.executemany(insert_sql, batch)
+                    batch = []
+                    if checkpoint is not None:
+                        checkpoint()
+            if batch:
+                with tracer.span("merge.stage_insert"):
+                    self.conn.executemany(insert_sql, batch)
+            self._mark_temporal(temporal)
+            self.conn.execute("UPDATE files SET rows = ? WHERE id = ?", (file_rows, file_id))
+        return file_rows, width
+
+    @property
+    def row_count(self):
+        return self.conn.execute("SELECT COALESCE(SUM(rows), 0) FROM files").fetchone()[0]
+
+    def _column_refs(self, names, prefix="r."):
+        refs = []
+        for name in names:
+            if name not in self.positions:
+                raise ValueError(f"列不存在: {name}")
+            refs.append(f"{prefix}c{self.positions[name]}")
+        return refs
+
+    def _sort_refs(self, names, prefix="r."):
+        """排序用的表达式：有日期时间的列把 BLOB 当作文字，与文字单元格按内容比较"""
+        refs = []
+        for name, ref in zip(names, self._column_refs(names, prefix)):
+            if self.positions[name] in self.temporal:
+                ref = f"(CASE WHEN typeof({ref}) = 'blob' THEN CAST({ref} AS TEXT) ELSE {ref} END)"
+            refs.append(ref)
+        return refs
+
+    def ensure_index(self, names, sort=False):
+        """为排序（sort 为 True）、去重用到的列建立索引，保留暂存文件时下次导出可以直接使用"""
+        refs = self._sort_refs(names, "") if sort else self._column_refs(names, "")
+        # 日期时间列按表达式建立索引，名称中加 t 与普通索引区分
+        index_name = "rows_" + "_".join(ref if ref.startswith("c") else f"t{self.positions[name]}"
+                                        for name, ref in zip(names, refs))
+        with self.conn:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON rows ({', '.join(refs)})")
+
+    def export_columns(self):
+        """导出的列：只暂存部分列时为源文件列加上选择的列（按选择的顺序，与流式合并相同），否则为全部列"""
+        options = self.get_meta("options") or {}
+        selection = options.get("columns")
+        if selection is None:
+            return list(self.columns)
+        return [SOURCE_COLUMN] + [name for name in selection if name in self.positions and name != SOURCE_COLUMN]
+
+    def iter_export_rows(self, sort_by=None, descending=False, dedup_by=None):
+        """
+        按导出顺序生成各行（列顺序与 export_columns() 相同，日期时间列转换回 datetime）
+
+        sort_by: 排序的列名列表，默认按文件顺序和行号
+        dedup_by: 去重的列名列表，这些列的值都相同的行只保留（文件顺序中）第一行
+        """
+        positions = [self.positions[name] for name in self.export_columns()]
+        select = ", ".join(f"r.c{position}" for position in positions)
+        file_order = "f.ordinal, r._row"
+        # 没有暂存完（行数为 NULL）的文件不导出
+        source = "rows r JOIN files f ON f.id = r._file AND f.rows IS NOT NULL"
+        if dedup_by:
+            keys = ", ".join(self._column_refs(dedup_by))
+            source = (f"(SELECT r.*, ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY {file_order}) AS _rank "
+                      f"FROM {source}) r JOIN files f ON f.id = r._file")
+        sql = f"SELECT {select} FROM {source}"
+        if dedup_by:
+            sql += " WHERE r._rank = 1"
+        order = [f"{ref} {'DESC' if descending else 'ASC'}" for ref in self._sort_refs(sort_by or [])]
+        sql += " ORDER BY " + ", ".join(order + [file_order])
+
+        temporal = [idx for idx, position in enumerate(positions) if position in self.temporal]
+        for row in self.conn.execute(sql):
+            if temporal:
+                row = list(row)
+                for idx in temporal:
+                    if isinstance(row[idx], bytes):
+                        row[idx] = _from_isoformat(row[idx])
+            yield row
+
+    def export(self, output_file, output_format=None, chunk_rows=None, column_widths=None, sort_by=None,
+               descending=False, dedup_by=None, checkpoint=None, tracer=NULL_TRACER, summary=None):
+        """
+        导出到 xlsx / csv（超过 chunk_rows 或工作表行数上限时分成多个文件），返回 (行数, 文件列表)
+
+        summary: merge_summary.MergeSummary，按导出的行（去重后）累加分组汇总
+        """
+        if output_format is None:
+            output_format = output_format_of(output_file)
+        if sort_by:
+            self.ensure_index(sort_by, sort=True)
+        if dedup_by:
+            self.ensure_index(dedup_by)
+        columns = self.export_columns()
+        output = StreamingOutput(output_file, columns, output_format, chunk_rows, column_widths)
+        update_summary = summary.bind(columns) if summary is not None else None
+        rows = 0
+        try:
+            with tracer.span("merge.export"):
+                for values in self.iter_export_rows(sort_by, descending, dedup_by):
+                    output.write_row(values)
+                    if update_summary is not None:
+                        update_summary(values)
+                    rows += 1
+                    if checkpoint is not None and rows % 10000 == 0:
+                        checkpoint()
+        finally:
+            with tracer.span("merge.write"):
+                files = output.close()
+        for path in files:
+            tracer.count_file_bytes("output_bytes", path)
+        return rows, files
+
+
+def dedup_columns(store, dedup_rows):
+    """dedup_rows 为 True 时按除源文件外的所有列去重，为列表时按这些列去重"""
+    if not dedup_rows:
+        return None
+    if dedup_rows is True:
+        return [name for name in store.export_columns() if name != SOURCE_COLUMN]
+    return list(dedup_rows)
+
+
+def merge_excel_staged(excel_files, output_file, staging_file=None, log=print, progress=None, checkpoint=None,
+                       column_widths=None, output_format=None, chunk_rows=None, tracer=NULL_TRACER,
+                       columns=None, row_filter=None, sort_by=None, descending=False, dedup_rows=None,
+                       summary=None):
+    """
+    通过 SQLite 暂存合并：逐个文件流式写入暂存库，再排序、去重并分片导出
+
+    参数:
+        staging_file: 暂存文件路径，保留供以后导出或再次合并；None 时使用输出目录下的临时文件，结束后删除
+        columns / row_filter: 只暂存这些列和满足条件的行（见 row_filter.py）
+        sort_by: 排序的列名列表；descending 为 True 时从大到小
+        dedup_rows: True 按除源文件外的所有列去重，列名列表按这些列去重，只保留第一行
+        summary: merge_summary.MergeSummary，导出时按导出的行累加分组汇总
+
+    返回:
+        (导出的行数, 列名列表, 写出的文件路径列表)
+    """
+    keep = staging_file is not None
+    if staging_file is None:
+        staging_file = os.path.splitext(output_file)[0] + f".staging-{os.getpid()}.sqlite"
+    store = StagingStore(staging_file)
+    try:
+        # 读取选项不同时，已暂存的数据不能复用
+        options = {"version": STAGING_VERSION, "columns": columns,
+                   "where": row_filter.expression if row_filter is not None else None}
+        if store.get_meta("options") != options:
+            if store.columns:
+                log("读取选项与暂存文件不同，重新暂存所有文件")
+            store.reset()
+            store.set_meta("options", options)
+
+        store.keep_files(excel_files)
+        staged_rows = 0
+        staged_files = 0
+        for idx, file_path in enumerate(excel_files, 1):
+            if checkpoint is not None:
+                checkpoint()
+            source_name = os.path.basename(file_path)
+            try:
+                if store.is_current(file_path):
+                    file_rows = store.file_entry(file_path)[3]
+                    log(f"已暂存 [{idx}/{len(excel_files)}]: {source_name} - {file_rows} 行（未变化，不再读取）")
+                else:
+                    start = time.perf_counter()
+                    with tracer.span("merge.stage_file", file=source_name):
+                        file_rows, width = store.stage_file(file_path, idx - 1, columns, row_filter,
+                                                            checkpoint, tracer)
+                    tracer.count("cells", file_rows * width)
+                    tracer.count_file_bytes("input_bytes", file_path)
+                    log(f"已暂存 [{idx}/{len(excel_files)}]: {source_name} - {file_rows} 行, {width} 列, "
+                        f"{time.perf_counter() - start:.2f} 秒")
+                staged_rows += file_rows
+                staged_files += 1
+            except Exception as e:
+                log(f"读取文件失败 {source_name}: {str(e)}")
+            if progress is not None:
+                progress(idx, len(excel_files), staged_rows)
+        if not staged_files:
+            raise Exception("没有成功读取任何文件")
+
+        if checkpoint is not None:
+            checkpoint()
+        log(f"\n正在从暂存库导出到: {output_file}")
+        rows, output_files = store.export(output_file, output_format, chunk_rows, column_widths, sort_by,
+                                          descending, dedup_columns(store, dedup_rows), checkpoint, tracer, summary)
+        tracer.count("rows", rows)
+        if dedup_rows:
+            log(f"去重后 {rows} 行（去掉 {store.row_count - rows} 行）")
+        return rows, store.export_columns(), output_files
+    finally:
+        store.close()
+        if keep:
+            log(f"暂存文件: {staging_file}")
+        else:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(staging_file + suffix)
+                except OSError:
+                    pass
+
+
+def export_staging(staging_file, output_file, log=print, output_format=None, chunk_rows=None, column_widths=None,
+                   sort_by=None, descending=False, dedup_rows=None, checkpoint=None, tracer=NULL_TRACER,
+                   summary=None):
+    """
+    直接从保留的暂存文件导出，不读取任何 Excel；返回 (行数, 列名列表, 写出的文件路径列表)
+
+    summary: merge_summary.MergeSummary，按导出的行累加分组汇总
+    """
+    if not os.path.isfile(staging_file):
+        raise FileNotFoundError(f"暂存文件不存在: {staging_file}")
+    with StagingStore(staging_file) as store:
+        if not store.columns:
+            raise Exception("暂存文件中没有数据")
+        log(f"暂存文件: {staging_file}（{store.row_count} 行, {len(store.columns)} 列）")
+        rows, output_files = store.export(output_file, output_format, chunk_rows, column_widths, sort_by,
+                                          descending, dedup_columns(store, dedup_rows), checkpoint, tracer, summary)
+        tracer.count("rows", rows)
+        log(f"已导出 {rows} 行到: {output_file}")
+        return rows, store.export_columns(), output_files
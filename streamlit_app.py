@@ -15,173 +15,280 @@ st.set_page_config(
 import pandas as pd
 import os
 import tempfile
-import zipfile
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill
-import shutil
 import io
+import json
+from excel_preview import open_sheet_pager, merged_schema, PREVIEW_BLOCK_ROWS
+from split_excel import split_excel_by_rows, DEFAULT_CHUNK_TEMPLATE
+from header_style import DEFAULT_HEADER_STYLE, validate_header_style
+from row_filter import make_row_filter
+from profile_excel import column_names
+from merge_excel import merge_excel_files
+from merge_summary import AGGREGATES
+from merge_upsert import KEEP_POLICIES, KEEP_LABELS, KEEP_LATEST
+from perf_trace import Tracer
+from memory_budget import default_memory_budget
+from job_planner import plan_split, plan_merge, format_seconds
+from memory_monitor import format_bytes
+from parse_cache import ParseCache
+from zip_package import LEVEL_AUTO, LEVEL_STORE, package_directory, package_files
 
+# 下载按钮的 MIME 类型（按输出文件扩展名）
+OUTPUT_MIME_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".csv": "text/csv",
+}
 
-def split_excel_by_rows(input_file, output_dir):
-    """按照表头分割Excel文件，每一行对应一个文件"""
+
+class ProgressDisplay:
+    """拆分/合并时的进度条和状态文字，作为引擎函数的 log 和 progress 回调"""
+    
+    def __init__(self, unit):
+        self.unit = unit
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        self.messages = []
+    
+    def log(self, message):
+        self.messages.append(message)
+    
+    def progress(self, done, total, rows):
+        if total > 0:
+            self.progress_bar.progress(min(done / total, 1.0))
+        self.status_text.text(f"已处理 {done}/{total} {self.unit}，共 {rows} 行...")
+    
+    def close(self):
+        self.progress_bar.empty()
+        self.status_text.empty()
+
+
+def render_timing(tracer, key, memory=None):
+    """显示各阶段耗时和内存占用，并提供 Chrome trace 下载"""
+    with st.expander("⏱ 各阶段耗时"):
+        if memory:
+            budget = format_bytes(memory["budget_bytes"]) if memory["budget_bytes"] else "未设置"
+            st.caption(f"处理方式: {memory['engine']}（{memory['reason']}）；内存预算 {budget}，"
+                       f"预计 {format_bytes(memory['estimated_bytes'][memory['engine']])}，"
+                       f"实际峰值 {format_bytes(memory['actual_peak_bytes'])}")
+        st.dataframe(pd.DataFrame(tracer.summary()), use_container_width=True, hide_index=True)
+        if tracer.counters:
+            st.caption("计数: " + ", ".join(f"{name}={value}" for name, value in tracer.counters.items()))
+        st.download_button(
+            label="下载 trace（chrome://tracing 或 Perfetto 打开）",
+            data=json.dumps(tracer.to_chrome_trace(), ensure_ascii=False, default=str),
+            file_name="trace.json",
+            mime="application/json",
+            key=key
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def get_parse_cache():
+    """解析结果缓存：同一个文件再次上传后预览、拆分、合并时不再解析"""
+    return ParseCache()
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_sheet_pager(file_id, _file_bytes, file_name):
+    """为上传的文件创建分页读取器，同一次上传在多次重跑之间复用"""
+    return open_sheet_pager(io.BytesIO(_file_bytes), get_parse_cache(), name=file_name)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_merged_schema(file_ids, _uploaded_files):
+    """只读取表头得到合并后的列结构"""
+    return merged_schema([(f.name, io.BytesIO(f.getvalue())) for f in _uploaded_files])
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_split_plan(file_id, _file_path, rows_per_file, columns, where):
+    """拆分预估：只读取表头、dimension 和开头几行；临时文件名每次重跑都不同，按上传的文件和选项缓存"""
+    return plan_split(_file_path, rows_per_file=rows_per_file, columns=columns, where=where,
+                      memory_budget=default_memory_budget())
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_merge_plan(file_ids, _uploaded_files, output_filename, columns, where):
+    """合并预估：上传的文件先保存到临时目录再抽样，同一组文件和选项在多次重跑之间复用"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        excel_files = []
+        for uploaded_file in _uploaded_files:
+            file_path = os.path.join(tmp_dir, uploaded_file.name)
+            with open(file_path, 'wb') as f:
+                f.write(uploaded_file.getbuffer())
+            excel_files.append(file_path)
+        return plan_merge(excel_files, output_filename, columns=columns, where=where,
+                          memory_budget=default_memory_budget(), jobs=[1])
+
+
+def list_merge_outputs(output_dir, output_path):
+    """合并结果目录中引擎实际写出的文件，返回 (合并结果或各分片, 分组汇总)，分片按序号排列"""
+    summary_prefix = os.path.splitext(os.path.basename(output_path))[0] + "_汇总"
+    outputs, summaries = [], []
+    for name in sorted(os.listdir(output_dir), key=lambda name: (len(name), name)):
+        (summaries if name.startswith(summary_prefix) else outputs).append(os.path.join(output_dir, name))
+    return outputs, summaries
+
+
+def render_plan(get_plan, *args):
+    """开始前显示预计的输出文件数、大小、峰值内存和用时；估算失败时只提示，不影响运行"""
     try:
-        # 使用openpyxl读取原始文件
-        source_wb = load_workbook(input_file)
-        source_ws = source_wb.active
-        
-        # 创建输出目录
-        if os.path.exists(output_dir):
-            try:
-                shutil.rmtree(output_dir)
-            except PermissionError:
-                pass
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 定义颜色填充
-        blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
-        red_fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")
-        
-        # 进度条
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # 遍历每一行数据（从第2行开始，因为第1行是表头）
-        file_count = 0
-        total_rows = source_ws.max_row - 1  # 排除表头行
-        
-        for row_num in range(2, source_ws.max_row + 1):
-            # 检查该行是否有数据（检查A列是否有内容）
-            if source_ws.cell(row=row_num, column=1).value is None:
-                continue
-            
-            # 创建新的工作簿
-            wb = Workbook()
-            ws = wb.active
-            
-            # 复制表头第1行
-            for col in range(1, source_ws.max_column + 1):
-                source_cell = source_ws.cell(row=1, column=col)
-                target_cell = ws.cell(row=1, column=col)
-                target_cell.value = source_cell.value
-                
-                # 应用颜色填充
-                if 6 <= col <= 11:  # F1~K1 (列6-11)
-                    target_cell.fill = blue_fill
-                elif 12 <= col <= 13:  # L1~M1 (列12-13)
-                    target_cell.fill = red_fill
-            
-            # 复制数据行（第2行）
-            for col in range(1, source_ws.max_column + 1):
-                source_cell = source_ws.cell(row=row_num, column=col)
-                target_cell = ws.cell(row=2, column=col)
-                target_cell.value = source_cell.value
-            
-            # 自动调整列宽
-            for col in range(1, source_ws.max_column + 1):
-                column_letter = ws.cell(row=1, column=col).column_letter
-                max_length = 0
-                
-                # 检查表头和数据行的内容长度
-                for row in range(1, 3):
-                    cell_value = ws.cell(row=row, column=col).value
-                    if cell_value:
-                        # 计算字符长度，中文字符按2个字符计算
-                        length = 0
-                        for char in str(cell_value):
-                            if ord(char) > 127:
-                                length += 2
-                            else:
-                                length += 1
-                        max_length = max(max_length, length)
-                
-                # 设置列宽，最小宽度为8，最大宽度为50
-                adjusted_width = min(max(max_length + 2, 8), 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # 获取该文件A2单元格的内容作为文件名
-            filename_base = str(ws.cell(row=2, column=1).value) if ws.cell(row=2, column=1).value else f"file_{file_count + 1}"
-            
-            # 清理文件名中的非法字符
-            filename_base = "".join(c for c in filename_base if c.isalnum() or c in (' ', '-', '_', '(', ')', '（', '）', '，', '。')).strip()
-            if not filename_base:
-                filename_base = f"file_{file_count + 1}"
-            
-            # 生成文件名
-            filename = f"{filename_base}.xlsx"
-            output_path = os.path.join(output_dir, filename)
-            
-            # 如果文件名已存在，添加序号
-            counter = 1
-            original_filename = filename
-            while os.path.exists(output_path):
-                name, ext = os.path.splitext(original_filename)
-                filename = f"{name}_{counter}{ext}"
-                output_path = os.path.join(output_dir, filename)
-                counter += 1
-            
-            # 保存文件
-            wb.save(output_path)
-            file_count += 1
-            
-            # 更新进度
-            if total_rows > 0:
-                progress = file_count / total_rows
-                progress_bar.progress(min(progress, 1.0))
-                status_text.text(f"已创建 {file_count} 个文件...")
-        
-        progress_bar.empty()
-        status_text.empty()
-        
-        return file_count
-        
+        plan = get_plan(*args)
     except Exception as e:
-        st.error(f"处理文件时出错: {str(e)}")
-        raise
+        st.caption(f"无法估算任务: {e}")
+        return
+    with st.expander(f"任务预估：约 {plan.output_files} 个文件，"
+                     f"{format_seconds(plan.recommended['seconds'])}", expanded=bool(plan.warnings)):
+        st.code(plan.describe(), language=None)
+    for warning in plan.warnings:
+        st.warning(warning)
+
+
+def unique_columns(header):
+    """生成可用作 DataFrame 列名的唯一表头"""
+    columns = []
+    seen = {}
+    for idx, value in enumerate(header, 1):
+        name = str(value) if value is not None else f"列{idx}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
 
 
-def merge_excel_files(excel_files):
-    """合并多个Excel文件"""
+def render_filter_options(key, options):
+    """列选择和筛选条件；返回 (列名列表或 None, 筛选条件或 None, 是否有效)"""
+    with st.expander("列选择和筛选"):
+        selected = st.multiselect(
+            "只保留的列（按选择顺序，不选表示全部列）",
+            options,
+            key=f"{key}_columns"
+        )
+        where = st.text_input(
+            "筛选条件",
+            key=f"{key}_where",
+            placeholder='状态 == "已完成" and 金额 >= 1000',
+            help="比较运算 == != < <= > >= in，可用 and / or / not 组合；"
+                 "含空格的列名用反引号括起来，如 `客户 名称` == \"张三\""
+        )
     try:
-        dataframes = []
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # 读取每个Excel文件
-        for idx, file_path in enumerate(excel_files, 1):
-            try:
-                # 读取Excel文件，使用第一行作为列名
-                df = pd.read_excel(file_path, header=0)
-                
-                # 添加源文件名列，用于追踪数据来源
-                if '源文件' not in df.columns:
-                    df.insert(0, '源文件', os.path.basename(file_path))
-                
-                dataframes.append(df)
-                status_text.text(f"已读取 [{idx}/{len(excel_files)}]: {os.path.basename(file_path)} - {df.shape[0]} 行, {df.shape[1]} 列")
-                
-                # 更新进度
-                progress = idx / len(excel_files)
-                progress_bar.progress(progress)
-                
-            except Exception as e:
-                st.warning(f"读取文件失败 {os.path.basename(file_path)}: {str(e)}")
-                continue
-        
-        progress_bar.empty()
-        status_text.empty()
-        
-        if not dataframes:
-            raise Exception("没有成功读取任何文件")
-        
-        # 合并所有数据框
-        merged_df = pd.concat(dataframes, ignore_index=True, sort=False)
-        
-        return merged_df
-        
+        make_row_filter(where)
+    except ValueError as e:
+        st.error(str(e))
+        return None, None, False
+    return selected or None, where.strip() or None, True
+
+
+def render_summary_options(key, options):
+    """合并时的分组汇总；返回汇总定义列表，未选择分组列时为 None"""
+    with st.expander("分组汇总"):
+        group_by = st.multiselect(
+            "分组列",
+            options,
+            key=f"{key}_group_by",
+            help="合并时逐个文件累加，结束后另外生成“输出文件名_汇总”文件，不需要再读一遍合并结果"
+        )
+        value_columns = st.multiselect("统计列", [name for name in options if name not in group_by],
+                                       key=f"{key}_values")
+        functions = st.multiselect(
+            "统计方式",
+            list(AGGREGATES),
+            default=["sum"],
+            format_func=lambda name: AGGREGATES[name],
+            key=f"{key}_functions"
+        )
+    if not group_by:
+        return None
+    return [{"name": "汇总", "group_by": group_by,
+             "values": {column: functions for column in value_columns if functions}}]
+
+
+def render_upsert_options(key, options):
+    """按键去重；返回 (键列列表或 None, 保留方式, 时间列或 None, 是否有效)"""
+    with st.expander("按键去重"):
+        key_columns = st.multiselect(
+            "键列",
+            options,
+            key=f"{key}_columns",
+            help="同一个键（如订单号）在多个文件中出现时只保留一行，结果按键第一次出现的位置排列"
+        )
+        keep = st.radio(
+            "保留哪一行",
+            list(KEEP_POLICIES),
+            index=1,
+            format_func=lambda name: KEEP_LABELS[name],
+            horizontal=True,
+            key=f"{key}_keep",
+            help="最后出现的行按文件顺序，后面的文件覆盖前面的文件"
+        )
+        timestamp_column = None
+        if keep == KEEP_LATEST:
+            timestamp_column = st.selectbox("时间列", [name for name in options if name not in key_columns],
+                                            index=None, key=f"{key}_timestamp")
+    if not key_columns:
+        return None, keep, None, True
+    if keep == KEEP_LATEST and timestamp_column is None:
+        st.error("保留时间最新的行时需要选择时间列")
+        return key_columns, keep, None, False
+    return key_columns, keep, timestamp_column, True
+
+
+def render_sheet_preview(uploaded_file, key):
+    """分页预览上传文件的数据，只读取当前页的行"""
+    try:
+        pager = get_sheet_pager(uploaded_file.file_id, uploaded_file.getvalue(), uploaded_file.name)
     except Exception as e:
-        st.error(f"处理过程中出错: {str(e)}")
-        raise
+        st.warning(f"无法预览该文件: {str(e)}")
+        return
+
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    with col_size:
+        page_size = st.selectbox(
+            "每页行数",
+            [PREVIEW_BLOCK_ROWS * n for n in (1, 2, 4, 10)],
+            key=f"{key}_page_size"
+        )
+
+    # 已完整经过时使用准确行数，否则使用 dimension 中的估算值
+    known_rows = pager.total_rows
+    if known_rows is None:
+        known_rows = max(pager.estimated_rows or 0, pager.scanned_rows)
+    page_count = max((known_rows + page_size - 1) // page_size, 1)
+
+    with col_page:
+        page = st.number_input(
+            "页码",
+            min_value=1,
+            max_value=page_count if pager.total_rows is not None or pager.estimated_rows else None,
+            value=1,
+            step=1,
+            key=f"{key}_page"
+        )
+
+    rows = pager.read_rows((page - 1) * page_size, page_size)
+    with col_info:
+        if pager.total_rows is not None:
+            total_text = f"共 {pager.total_rows} 行"
+        elif pager.estimated_rows is not None:
+            total_text = f"约 {pager.estimated_rows} 行"
+        else:
+            total_text = f"至少 {pager.scanned_rows} 行"
+        st.caption(f"{total_text}，已读取 {pager.scanned_rows} 行")
+
+    if not rows:
+        st.info("该页没有数据")
+        return
+
+    width = max(len(pager.header), max(len(values) for _, values in rows))
+    header = list(pager.header) + [None] * (width - len(pager.header))
+    preview_df = pd.DataFrame(
+        [list(values) + [None] * (width - len(values)) for _, values in rows],
+        columns=unique_columns(header),
+        index=pd.Index([row_num for row_num, _ in rows], name="行号")
+    )
+    st.dataframe(preview_df, use_container_width=True)
 
 
 # 自定义CSS样式（iOS风格）
@@ -250,51 +357,138 @@ if mode == "拆分 Excel 文件":
     
     uploaded_file = st.file_uploader(
         "请选择要拆分的 Excel 文件",
-        type=['xlsx', 'xls'],
-        help="上传一个Excel文件，程序将按行拆分成多个文件"
+        type=['xlsx', 'xls', 'csv', 'tsv'],
+        help="上传一个Excel文件（也可以是 CSV / TSV），程序将按行拆分成多个文件"
     )
     
     if uploaded_file is not None:
         # 创建临时文件保存上传的文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_file:
+        # 保留扩展名，CSV / TSV 按扩展名识别
+        suffix = os.path.splitext(uploaded_file.name)[1].lower() or '.xlsx'
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
             tmp_file.write(uploaded_file.getvalue())
             tmp_file_path = tmp_file.name
         
         try:
-            # 显示文件信息
-            wb = load_workbook(tmp_file_path)
-            ws = wb.active
-            st.info(f"📄 文件结构: {ws.max_row} 行, {ws.max_column} 列")
+            # 显示文件信息（只读取表头和 dimension，不解析整个文件）
+            header_names = []
+            try:
+                pager = get_sheet_pager(uploaded_file.file_id, uploaded_file.getvalue(), uploaded_file.name)
+                row_text = pager.estimated_rows + 1 if pager.estimated_rows is not None else "未知"
+                st.info(f"📄 文件结构: {row_text} 行, {len(pager.header)} 列")
+                header_names = column_names(pager.header)
+            except Exception:
+                pass
+            
+            with st.expander("预览数据"):
+                render_sheet_preview(uploaded_file, "split_preview")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                rows_per_file = st.number_input(
+                    "每个文件的行数",
+                    min_value=1,
+                    value=1,
+                    step=1,
+                    help="1 表示每行一个文件；大于1时把连续的多行放在同一个文件中"
+                )
+            with col2:
+                filename_template = st.text_input(
+                    "文件名模板",
+                    value="" if rows_per_file == 1 else DEFAULT_CHUNK_TEMPLATE,
+                    help="可用 {first}（第一行A列）、{last}（最后一行A列）、{index}（序号）、{count}（行数）；"
+                         "留空时每行一个文件按A列内容命名"
+                )
+            
+            with st.expander("表头样式"):
+                style_text = st.text_area(
+                    "表头样式配置（JSON）",
+                    value=json.dumps(DEFAULT_HEADER_STYLE, ensure_ascii=False, indent=2),
+                    height=200,
+                    help="rules 中每条规则按 columns（列范围，如 F:K）或 header（表头正则）匹配列，"
+                         "可设置 fill、font、border、number_format、width；freeze_panes 设置冻结窗格，如 A2"
+                )
+            split_columns, split_where, filter_valid = render_filter_options("split_filter", header_names)
+            with st.expander("打包选项"):
+                zip_level = st.selectbox(
+                    "压缩级别",
+                    [LEVEL_AUTO, LEVEL_STORE, 1, 6, 9],
+                    format_func=lambda level: {LEVEL_AUTO: "自动（xlsx 不再压缩）", LEVEL_STORE: "不压缩",
+                                               1: "1 最快", 6: "6 默认", 9: "9 最小"}[level],
+                    help="拆分出的 xlsx 本身已经压缩，再压缩几乎不变小；多个文件用多线程同时压缩"
+                )
+                zip_volume_mb = st.number_input(
+                    "每个压缩包的大小上限（MB，0 表示不分卷）",
+                    min_value=0,
+                    value=0,
+                    step=100,
+                    help="文件很多时分成多个独立的压缩包分别下载，避免浏览器下载超大文件失败"
+                )
             
-            if st.button("▶ 开始拆分", type="primary", use_container_width=True):
+            header_style = None
+            try:
+                header_style = json.loads(style_text)
+                validate_header_style(header_style)
+            except ValueError as e:
+                header_style = None
+                st.error(f"表头样式配置无效: {e}")
+            
+            if filter_valid:
+                render_plan(get_split_plan, uploaded_file.file_id, tmp_file_path, int(rows_per_file),
+                            split_columns, split_where)
+            
+            if st.button("▶ 开始拆分", type="primary", use_container_width=True,
+                         disabled=header_style is None or not filter_valid):
                 with st.spinner("正在拆分文件，请稍候..."):
                     # 创建临时目录保存拆分后的文件
                     with tempfile.TemporaryDirectory() as tmp_dir:
                         try:
-                            file_count = split_excel_by_rows(tmp_file_path, tmp_dir)
+                            tracer = Tracer()
+                            memory = {}
+                            display = ProgressDisplay("行")
+                            try:
+                                # 容器有内存上限时，预计超出预算就改为流式处理
+                                file_count = split_excel_by_rows(tmp_file_path, tmp_dir, log=display.log,
+                                                                 progress=display.progress, tracer=tracer,
+                                                                 memory_budget=default_memory_budget(),
+                                                                 memory_report=memory.update,
+                                                                 rows_per_file=int(rows_per_file),
+                                                                 filename_template=filename_template or None,
+                                                                 header_style=header_style,
+                                                                 columns=split_columns, where=split_where,
+                                                                 parse_cache=get_parse_cache())
+                            finally:
+                                display.close()
                             
                             if file_count > 0:
-                                # 创建ZIP文件
-                                zip_buffer = io.BytesIO()
-                                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                                    for root, dirs, files in os.walk(tmp_dir):
-                                        for file in files:
-                                            file_path = os.path.join(root, file)
-                                            arc_name = os.path.relpath(file_path, tmp_dir)
-                                            zip_file.write(file_path, arc_name)
-                                
-                                zip_buffer.seek(0)
-                                
-                                st.success(f"✅ 拆分完成！共创建了 {file_count} 个文件")
-                                
-                                # 提供下载按钮
-                                st.download_button(
-                                    label="📥 下载所有拆分文件 (ZIP)",
-                                    data=zip_buffer,
-                                    file_name="拆分后的文件.zip",
-                                    mime="application/zip",
-                                    use_container_width=True
-                                )
+                                # 创建ZIP文件（放在拆分目录之外，多线程压缩）
+                                with tempfile.TemporaryDirectory() as zip_dir:
+                                    with tracer.span("split.zip"):
+                                        package = package_directory(
+                                            tmp_dir, os.path.join(zip_dir, "拆分后的文件.zip"), level=zip_level,
+                                            volume_size=int(zip_volume_mb) << 20 or None, log=display.log,
+                                            tracer=tracer)
+                                    
+                                    st.success(f"✅ 拆分完成！共创建了 {file_count} 个文件")
+                                    st.caption(f"打包: {format_bytes(package['input_bytes'])} → "
+                                               f"{format_bytes(package['output_bytes'])}，"
+                                               f"{package['seconds']:.2f} 秒")
+                                    render_timing(tracer, "split_trace", memory)
+                                    
+                                    # 提供下载按钮（分卷时每个压缩包一个）
+                                    for idx, zip_path in enumerate(package["files"], 1):
+                                        with open(zip_path, 'rb') as f:
+                                            zip_data = f.read()
+                                        label = "📥 下载所有拆分文件 (ZIP)" if len(package["files"]) == 1 else \
+                                            f"📥 下载拆分文件 第 {idx}/{len(package['files'])} 部分 (ZIP)"
+                                        st.download_button(
+                                            label=label,
+                                            data=zip_data,
+                                            file_name=os.path.basename(zip_path),
+                                            mime="application/zip",
+                                            key=f"split_zip_{idx}",
+                                            use_container_width=True
+                                        )
                             else:
                                 st.warning("⚠️ 没有找到需要拆分的数据行")
                                 
@@ -312,9 +506,9 @@ else:
     
     uploaded_files = st.file_uploader(
         "请选择要合并的 Excel 文件（可多选）",
-        type=['xlsx', 'xls'],
+        type=['xlsx', 'xls', 'csv', 'tsv'],
         accept_multiple_files=True,
-        help="可以选择多个Excel文件进行合并"
+        help="可以选择多个Excel文件进行合并，也可以包含 CSV / TSV 文件"
     )
     
     if uploaded_files and len(uploaded_files) > 0:
@@ -325,13 +519,53 @@ else:
             for idx, file in enumerate(uploaded_files, 1):
                 st.text(f"{idx}. {file.name}")
         
+        # 显示合并后的列结构（只读取各文件表头）
+        schema = []
+        with st.expander("合并后的列结构"):
+            try:
+                schema = get_merged_schema(
+                    tuple(f.file_id for f in uploaded_files), uploaded_files
+                )
+                st.dataframe(pd.DataFrame(schema), use_container_width=True, hide_index=True)
+            except Exception as e:
+                st.warning(f"无法读取表头: {str(e)}")
+        
+        with st.expander("预览数据"):
+            preview_file = st.selectbox(
+                "选择要预览的文件",
+                uploaded_files,
+                format_func=lambda f: f.name,
+                key="merge_preview_file"
+            )
+            if preview_file is not None:
+                render_sheet_preview(preview_file, f"merge_preview_{preview_file.file_id}")
+        
         output_filename = st.text_input(
             "输出文件名",
             value="合并后的Excel.xlsx",
             help="合并后文件的名称"
         )
+        merge_columns, merge_where, filter_valid = render_filter_options(
+            "merge_filter", [row["列名"] for row in schema if row["列名"] != "源文件"]
+        )
+        merge_summaries = render_summary_options(
+            "merge_summary", [row["列名"] for row in schema]
+        )
+        key_columns, keep, timestamp_column, upsert_valid = render_upsert_options(
+            "merge_upsert", [row["列名"] for row in schema if row["列名"] != "源文件"]
+        )
+        filter_valid = filter_valid and upsert_valid
+        skip_duplicates = st.checkbox(
+            "跳过内容重复的文件",
+            value=False,
+            help="内容完全相同的文件（如重复上传）默认只读取一次，数据仍按各自的文件名合并；勾选后只保留第一个"
+        )
         
-        if st.button("▶ 开始合并", type="primary", use_container_width=True):
+        if filter_valid:
+            render_plan(get_merge_plan, tuple(f.file_id for f in uploaded_files), uploaded_files,
+                        output_filename, merge_columns, merge_where)
+        
+        if st.button("▶ 开始合并", type="primary", use_container_width=True, disabled=not filter_valid):
             with st.spinner("正在合并文件，请稍候..."):
                 try:
                     # 保存上传的文件到临时目录
@@ -344,28 +578,80 @@ else:
                             excel_files.append(file_path)
                         
                         # 合并文件
-                        merged_df = merge_excel_files(excel_files)
+                        # 合并后的文件保存在单独的目录，避免与上传的文件重名
+                        output_dir = os.path.join(tmp_dir, "output")
+                        os.makedirs(output_dir)
+                        output_path = os.path.join(output_dir, output_filename)
+                        tracer = Tracer()
+                        memory = {}
+                        upsert = {}
+                        display = ProgressDisplay("个文件")
+                        try:
+                            # 容器有内存上限时，预计超出预算就改为流式合并
+                            merged_df = merge_excel_files(excel_files, output_path, log=display.log,
+                                                          progress=display.progress, tracer=tracer,
+                                                          memory_budget=default_memory_budget(),
+                                                          memory_report=memory.update,
+                                                          duplicates="skip" if skip_duplicates else "reuse",
+                                                          columns=merge_columns, where=merge_where,
+                                                          parse_cache=get_parse_cache(),
+                                                          summaries=merge_summaries, key_columns=key_columns,
+                                                          keep=keep, timestamp_column=timestamp_column,
+                                                          upsert_report=upsert.update)
+                        finally:
+                            display.close()
+                        for message in display.messages:
+                            if message.startswith(("读取文件失败", "警告")):
+                                st.warning(message)
+                        rows = tracer.counters.get("rows", 0)
+                        # 按行数分片时写出的是“名称_1.xlsx”“名称_2.xlsx”……，不一定有 output_path
+                        output_files, summary_files = list_merge_outputs(output_dir, output_path)
                         
-                        if merged_df is not None and not merged_df.empty:
-                            # 保存到临时文件
-                            output_path = os.path.join(tmp_dir, output_filename)
-                            merged_df.to_excel(output_path, index=False, engine='openpyxl')
-                            
-                            # 读取文件供下载
-                            with open(output_path, 'rb') as f:
-                                file_data = f.read()
-                            
+                        if rows and output_files:
                             st.success(f"✅ 合并完成！")
-                            st.info(f"📊 统计信息: {len(merged_df)} 行, {len(merged_df.columns)} 列")
+                            if merged_df is not None:
+                                st.info(f"📊 统计信息: {len(merged_df)} 行, {len(merged_df.columns)} 列")
+                            else:
+                                st.info(f"📊 统计信息: {rows} 行")
+                            if upsert:
+                                st.info(f"🔑 按键去重: 读取 {upsert['rows_read']} 行，保留 {upsert['rows_kept']} 行，"
+                                        f"{upsert['distinct_keys']} 个不同的键")
+                                st.dataframe(pd.DataFrame(upsert["files"], columns=[
+                                    "file", "rows", "kept", "replaced", "superseded"
+                                ]).rename(columns={
+                                    "file": "文件", "rows": "读取行数", "kept": "保留行数",
+                                    "replaced": "覆盖之前的行", "superseded": "被覆盖或重复"
+                                }), use_container_width=True, hide_index=True)
+                            render_timing(tracer, "merge_trace", memory)
                             
-                            # 提供下载按钮
-                            st.download_button(
-                                label=f"📥 下载合并后的文件: {output_filename}",
-                                data=file_data,
-                                file_name=output_filename,
-                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                use_container_width=True
-                            )
+                            # 提供下载按钮：只有一个文件时直接下载，分成多个文件时打包成 ZIP
+                            if len(output_files) == 1:
+                                download_path = output_files[0]
+                                label = f"📥 下载合并后的文件: {os.path.basename(download_path)}"
+                            else:
+                                download_path = os.path.join(
+                                    tmp_dir, os.path.splitext(output_filename)[0] + ".zip")
+                                package_files([(path, os.path.basename(path)) for path in output_files],
+                                              download_path, log=lambda message: None)
+                                label = f"📥 下载合并后的文件 ({len(output_files)} 个分片, ZIP)"
+                            with open(download_path, 'rb') as f:
+                                st.download_button(
+                                    label=label,
+                                    data=f.read(),
+                                    file_name=os.path.basename(download_path),
+                                    mime=OUTPUT_MIME_TYPES.get(os.path.splitext(download_path)[1].lower(),
+                                                               "application/zip"),
+                                    use_container_width=True
+                                )
+                            for summary_path in summary_files:
+                                with open(summary_path, 'rb') as f:
+                                    st.download_button(
+                                        label=f"📥 下载分组汇总: {os.path.basename(summary_path)}",
+                                        data=f.read(),
+                                        file_name=os.path.basename(summary_path),
+                                        mime=OUTPUT_MIME_TYPES.get(os.path.splitext(summary_path)[1].lower()),
+                                        use_container_width=True
+                                    )
                         else:
                             st.warning("⚠️ 合并后的数据为空")
                             
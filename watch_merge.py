@@ -0,0 +1,501 @@
+"""
+监视文件夹持续合并 - 新文件写完后只解析这个文件并写入 SQLite 暂存库，合并结果防抖后从暂存库重新导出
+
+    python excel_tool_cli.py watch data/ -o 合并后的Excel.xlsx
+
+- 发现文件: Linux 上用 inotify（通过 ctypes 调用 libc），其他系统或 inotify 不可用时定时扫描文件夹
+- 写完判断: 大小和修改时间连续 settle 秒不变，且没有 Excel 打开时的锁文件（~$文件名）
+- 解析: 只解析新增或变化的文件（StagingStore.stage_file），删除的文件从暂存库中去掉；
+  解析失败的文件（如还没写完的 xlsx）在再次变化后重试
+- 导出: 最后一次变化 debounce 秒后导出，持续有文件到达时最多等待 max_delay 秒；
+  先写到临时目录再替换，读取合并结果的程序不会读到写了一半的文件
+- 延迟: 每个文件从发现到出现在合并结果中的秒数，记录在日志和 status_file 中
+
+数据行保存在暂存文件中，进程内只保留文件夹的文件列表和最近的延迟样本，长时间运行内存不增长。
+暂存文件默认保存在合并结果旁边（名称.watch.sqlite），重新启动后未变化的文件不再解析，
+也可以用 excel_tool_cli.py export 直接导出。
+合并结果、它的分片（名称_N）和分组汇总（名称_汇总）以及暂存文件放在监视的文件夹中时不作为输入。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import shutil
+import collections
+
+from perf_trace import NULL_TRACER
+from csv_reader import CSV_EXTENSIONS
+from merge_excel import output_format_of, write_summary
+from memory_monitor import current_rss_bytes, format_bytes
+
+# 文件大小和修改时间连续不变多少秒后认为已写完
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# 最后一次变化后多少秒导出合并结果；持续有文件到达时最多等待多少秒
+DEFAULT_DEBOUNCE_SECONDS = 5.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+
+# 定时扫描文件夹的间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 每次等待事件的最长时间，决定响应停止请求的速度
+MAX_WAIT_SECONDS = 1.0
+
+# 保留最近多少个文件的延迟用于计算分位数
+LATENCY_SAMPLES = 1000
+
+# inotify 事件
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+    IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """用 inotify 监视文件夹（只用于 Linux）；poll() 返回有变化的文件名"""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "系统不支持 inotify")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            # ENOSPC: 超出 fs.inotify.max_user_watches
+            raise OSError(error, f"inotify_add_watch 失败: {os.strerror(error)}")
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 << 10)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    raise FileNotFoundError(f"监视的文件夹已被删除或移动: {self.directory}")
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失的事件无法知道，检查文件夹中的所有文件
+                    names.update(os.listdir(self.directory))
+                elif name:
+                    names.add(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """定时扫描文件夹，比较文件大小和修改时间；poll() 返回有变化（包括删除）的文件名"""
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.next_scan = time.monotonic() + interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    pass  # 扫描时被删除
+        return snapshot
+
+    def poll(self, timeout):
+        wait = max(self.next_scan - time.monotonic(), 0)
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return set()
+        time.sleep(wait)
+        self.next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = {name for name in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(name) != self.snapshot.get(name)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, polling=False, interval=DEFAULT_POLL_INTERVAL, log=print):
+    """Linux 上优先使用 inotify，不可用时（或 polling 为 True）定时扫描"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            log(f"无法使用 inotify（{e}），改为每 {interval:g} 秒扫描一次文件夹")
+    return PollingWatcher(directory, interval)
+
+
+def is_input_name(name):
+    """参与合并的文件：Excel / CSV，排除 Excel 的锁文件（~$开头）和隐藏文件"""
+    if name.startswith(("~$", ".")):
+        return False
+    # 与 merge_excel.list_excel_files 的扩展名判断相同
+    return name.endswith('.xlsx') or name.endswith('.xls') or name.lower().endswith(CSV_EXTENSIONS)
+
+
+def has_lock_file(directory, name):
+    """Excel 打开文件时在同一文件夹创建 ~$文件名（文件名较长时去掉前两个字符）"""
+    return any(os.path.exists(os.path.join(directory, "~$" + candidate)) for candidate in {name, name[2:]})
+
+
+class LatencyStats:
+    """文件从发现到出现在合并结果中的延迟：累计次数、平均、最大，以及最近若干个样本的分位数"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.recent = collections.deque(maxlen=samples)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.recent.append(seconds)
+
+    def quantile(self, fraction):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+    def to_dict(self):
+        return {
+            "files": self.count,
+            "mean_seconds": round(self.total / self.count, 3) if self.count else None,
+            "p50_seconds": round(self.quantile(0.50), 3) if self.count else None,
+            "p95_seconds": round(self.quantile(0.95), 3) if self.count else None,
+            "max_seconds": round(self.maximum, 3),
+        }
+
+
+class FolderMerger:
+    """
+    监视一个文件夹，把写完的文件增量写入暂存库，并防抖地导出合并结果
+
+        merger = FolderMerger("data", "合并.xlsx")
+        merger.run()          # 一直运行，直到 checkpoint() 抛出异常或按 Ctrl+C
+    """
+
+    def __init__(self, directory, output_file, staging_file=None, log=print, checkpoint=None,
+                 settle=DEFAULT_SETTLE_SECONDS, debounce=DEFAULT_DEBOUNCE_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS,
+                 polling=False, poll_interval=DEFAULT_POLL_INTERVAL, output_format=None, chunk_rows=None,
+                 columns=None, where=None, sort_by=None, descending=False, dedup_rows=None, summaries=None,
+                 status_file=None, tracer=NULL_TRACER):
+        """
+        参数:
+            directory: 监视的文件夹（不包括子文件夹）
+            output_file: 合并结果 .xlsx / .csv
+            staging_file: 暂存文件，默认为合并结果旁边的“名称.watch.sqlite”
+            checkpoint: 每次循环调用，抛出异常时停止（如 job_queue 的取消）
+            settle: 文件大小和修改时间连续不变多少秒后认为已写完
+            debounce / max_delay: 最后一次变化后多少秒导出；持续变化时最多等待多少秒
+            polling: 不使用 inotify，每 poll_interval 秒扫描一次
+            columns / where / sort_by / descending / dedup_rows / summaries / output_format / chunk_rows:
+                与 merge_excel_files 通过暂存库合并时相同
+            status_file: 每次导出后写入状态（JSON）：文件数、行数、延迟、内存
+        """
+        from row_filter import make_row_filter
+        self.directory = os.path.abspath(directory)
+        self.output_file = os.path.abspath(output_file)
+        self.staging_file = os.path.abspath(staging_file or os.path.splitext(self.output_file)[0] + ".watch.sqlite")
+        # 合并结果及其分片、分组汇总的文件名：在监视的文件夹中时不能再作为输入合并进去
+        output_name, _ = os.path.splitext(os.path.basename(self.output_file))
+        self._output_dir = os.path.normcase(os.path.dirname(self.output_file))
+        self._output_pattern = re.compile(re.escape(output_name) + r"(_\d+|_汇总.*)?\.(xlsx|csv)", re.IGNORECASE)
+        self.log = log
+        self.checkpoint = checkpoint
+        self.settle = settle
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self.output_format = output_format or output_format_of(output_file)
+        self.chunk_rows = chunk_rows
+        self.columns = columns
+        self.row_filter = make_row_filter(where)
+        self.sort_by = sort_by
+        self.descending = descending
+        self.dedup_rows = dedup_rows
+        self.summaries = summaries
+        self.status_file = status_file
+        self.tracer = tracer
+
+        self.pending = {}        # 文件名 -> [发现时间, 上次看到的 (大小, 修改时间), 该状态开始不变的时间]
+        self.failed = {}         # 文件名 -> 解析失败时的 (大小, 修改时间)，再次变化前不重试
+        self.waiting = []        # 已写入暂存库、还没有导出的文件: (文件名, 发现时间)
+        self.dirty_since = None  # 第一个未导出变化的时间
+        self.last_change = None
+        self.output_files = []
+        self.latency = LatencyStats()
+        self.exports = 0
+        self.staged_files = 0
+        self.rows = 0
+
+    # ---- 暂存库 ----
+
+    def _open_store(self):
+        from sqlite_staging import StagingStore, STAGING_VERSION
+        store = StagingStore(self.staging_file)
+        options = {"version": STAGING_VERSION, "columns": self.columns,
+                   "where": self.row_filter.expression if self.row_filter is not None else None}
+        if store.get_meta("options") != options:
+            if store.columns:
+                self.log("读取选项与暂存文件不同，重新暂存所有文件")
+            store.reset()
+            store.set_meta("options", options)
+        return store
+
+    def _is_input(self, name):
+        """参与合并的文件：排除合并结果、分片、分组汇总和暂存文件"""
+        if not is_input_name(name):
+            return False
+        path = os.path.normcase(os.path.abspath(os.path.join(self.directory, name)))
+        if path == os.path.normcase(self.staging_file):
+            return False
+        return not (os.path.dirname(path) == self._output_dir and self._output_pattern.fullmatch(name))
+
+    def _input_files(self):
+        names = [name for name in os.listdir(self.directory) if self._is_input(name)]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    # ---- 主循环 ----
+
+    def run(self):
+        """一直运行：启动时先检查文件夹中已有的文件，之后处理新增、变化和删除的文件"""
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"文件夹不存在: {self.directory}")
+        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+        store = self._open_store()
+        watcher = create_watcher(self.directory, self.polling, self.poll_interval, self.log)
+        kind = "inotify" if isinstance(watcher, InotifyWatcher) else f"每 {self.poll_interval:g} 秒扫描"
+        self.log(f"开始监视: {self.directory}（{kind}），合并结果: {self.output_file}")
+        try:
+            now = time.monotonic()
+            for path in self._input_files():
+                name = os.path.basename(path)
+                if store.is_current(path):
+                    continue
+                self._track(name, now)
+            # 暂存库中有已删除的文件，或合并结果不存在时，启动后导出一次
+            if not os.path.exists(self.output_file) or store.row_count and self._has_removed(store):
+                self._mark_dirty(now)
+            while True:
+                if self.checkpoint is not None:
+                    self.checkpoint()
+                for name in watcher.poll(self._wait_seconds()):
+                    if self._is_input(name):
+                        self._track(name, time.monotonic())
+                self._process_ready(store)
+                now = time.monotonic()
+                if self.dirty_since is not None and now >= self._export_due():
+                    try:
+                        self._export(store)
+                    except Exception as e:
+                        # 如磁盘已满、合并结果被其他程序占用：保留未导出状态，debounce 秒后重试
+                        self.log(f"导出合并结果失败: {e}")
+                        self._mark_dirty(time.monotonic())
+        finally:
+            watcher.close()
+            store.close()
+
+    def _has_removed(self, store):
+        paths = {os.path.abspath(path) for path in self._input_files()}
+        return any(path not in paths for path, in store.conn.execute("SELECT path FROM files"))
+
+    def _track(self, name, now):
+        """记录有变化的文件，等待写完"""
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            self.pending.pop(name, None)
+            self.failed.pop(name, None)
+            self._mark_dirty(now)  # 删除的文件在导出前从暂存库中去掉
+            return
+        entry = self.pending.get(name)
+        if entry is None:
+            self.pending[name] = [time.time(), None, now]
+
+    def _mark_dirty(self, now):
+        if self.dirty_since is None:
+            self.dirty_since = now
+        self.last_change = now
+
+    def _export_due(self):
+        return min(self.last_change + self.debounce, self.dirty_since + self.max_delay)
+
+    def _wait_seconds(self):
+        """等待事件的时间：到下一个需要检查的文件或下一次导出为止"""
+        deadlines = [entry[2] + self.settle for entry in self.pending.values()]
+        if self.dirty_since is not None:
+            deadlines.append(self._export_due())
+        wait = MAX_WAIT_SECONDS
+        if deadlines:
+            wait = min(wait, max(min(deadlines) - time.monotonic(), 0.01))
+        return wait
+
+    def _process_ready(self, store):
+        """检查等待中的文件，写完的文件写入暂存库"""
+        now = time.monotonic()
+        for name, entry in list(self.pending.items()):
+            path = os.path.join(self.directory, name)
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                self._track(name, now)
+                continue
+            if signature != entry[1]:
+                # 还在变化：从现在起重新计时
+                entry[1], entry[2] = signature, now
+                continue
+            if now - entry[2] < self.settle:
+                continue
+            if has_lock_file(self.directory, name):
+                entry[2] = now  # 还在 Excel 中打开，锁文件删除后再等 settle 秒
+                continue
+            del self.pending[name]
+            if self.failed.get(name) == signature:
+                continue
+            self._stage(store, name, path, entry[0])
+            now = time.monotonic()
+
+    def _stage(self, store, name, path, found_time):
+        files = self._input_files()
+        ordinal = files.index(path) if path in files else len(files)
+        start = time.perf_counter()
+        try:
+            with self.tracer.span("watch.stage_file", file=name):
+                file_rows, width = store.stage_file(path, ordinal, self.columns, self.row_filter, self.checkpoint,
+                                                    self.tracer)
+        except Exception as e:
+            # 如写了一半的 xlsx（zip 不完整）：文件再次变化后重试
+            try:
+                self.failed[name] = self._signature(path)
+            except OSError:
+                pass
+            self.log(f"读取文件失败 {name}: {e}")
+            # 暂存库已删除该文件以前的数据，重新导出，合并结果中不再保留旧的行
+            self._mark_dirty(time.monotonic())
+            return
+        self.failed.pop(name, None)
+        self.staged_files += 1
+        self.waiting.append((name, found_time))
+        self._mark_dirty(time.monotonic())
+        self.log(f"已暂存: {name} - {file_rows} 行, {width} 列, {time.perf_counter() - start:.2f} 秒")
+
+    def _export(self, store):
+        """从暂存库导出：先写到临时目录，写完后替换合并结果"""
+        from sqlite_staging import dedup_columns
+        from merge_summary import MergeSummary
+        self.dirty_since = None
+        store.keep_files(self._input_files())
+        if not store.columns or not store.row_count and not self.output_files:
+            return
+        start = time.perf_counter()
+        output_dir = os.path.dirname(self.output_file)
+        tmp_dir = os.path.join(output_dir, f".watch-{os.getpid()}")
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            tmp_output = os.path.join(tmp_dir, os.path.basename(self.output_file))
+            summary = MergeSummary(self.summaries) if self.summaries else None
+            with self.tracer.span("watch.export"):
+                rows, files = store.export(tmp_output, self.output_format, self.chunk_rows, None, self.sort_by,
+                                           self.descending, dedup_columns(store, self.dedup_rows), self.checkpoint,
+                                           self.tracer, summary)
+                files = files + write_summary(summary, tmp_output, self.output_format, log=lambda message: None)
+            written = []
+            for path in files:
+                target = os.path.join(output_dir, os.path.basename(path))
+                os.replace(path, target)
+                written.append(target)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        # 行数减少后分片变少时，删除上次多出的分片
+        for path in set(self.output_files) - set(written):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.output_files = written
+        self.rows = rows
+        self.exports += 1
+        done = time.time()
+        latencies = [done - found_time for _, found_time in self.waiting]
+        for seconds in latencies:
+            self.latency.add(seconds)
+        self.waiting = []
+        detail = f"，{len(latencies)} 个新文件，最长延迟 {max(latencies):.2f} 秒" if latencies else ""
+        self.log(f"已更新合并结果: {rows} 行，{len(written)} 个文件，导出 {time.perf_counter() - start:.2f} 秒"
+                 f"{detail}，内存 {format_bytes(current_rss_bytes())}")
+        self._write_status()
+
+    def status(self):
+        return {
+            "directory": self.directory,
+            "output_files": self.output_files,
+            "staging_file": self.staging_file,
+            "rows": self.rows,
+            "staged_files": self.staged_files,
+            "pending_files": len(self.pending),
+            "failed_files": sorted(self.failed),
+            "exports": self.exports,
+            "latency": self.latency.to_dict(),
+            "rss_bytes": current_rss_bytes(),
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def _write_status(self):
+        if not self.status_file:
+            return
+        tmp_path = self.status_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.status(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.status_file)
+
+
+def watch_merge(directory, output_file, **kwargs):
+    """监视文件夹持续合并，参数见 FolderMerger；一直运行到 checkpoint() 抛出异常或按 Ctrl+C"""
+    FolderMerger(directory, output_file, **kwargs).run()
@@ -0,0 +1,333 @@
+"""
+ZIP 打包 - 多线程压缩，按固定顺序写出，可选压缩级别，可按大小分成多个压缩包
+
+zlib 压缩和 CRC 计算时释放 GIL，多个成员在线程池中同时压缩；写出顺序与文件列表相同，
+同样的输入得到同样的压缩包。压缩好的数据直接写成 ZIP 记录（本地文件头、中央目录，需要时使用 ZIP64），
+不经过 zipfile 再压缩一遍。
+
+压缩级别:
+    store   不压缩（xlsx 本身就是压缩过的 ZIP，再压缩几乎不变小，只花时间）
+    1 ~ 9   deflate 级别，1 最快，9 最小
+    auto    xlsx、zip、图片等已压缩的文件不压缩，其他用级别 6（默认）
+压缩后没有变小的成员改为不压缩保存。
+
+分卷: 指定 volume_size 时每个压缩包不超过该大小（单个成员更大时单独一个压缩包），
+文件名为“名称.part01.zip”“名称.part02.zip”……；每个分卷都是独立完整的 ZIP，可以单独打开，
+不需要支持分卷格式的解压工具。
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from perf_trace import NULL_TRACER
+from memory_monitor import format_bytes
+
+LEVEL_STORE = "store"
+LEVEL_AUTO = "auto"
+LEVELS = (LEVEL_STORE, LEVEL_AUTO) + tuple(str(level) for level in range(1, 10))
+
+DEFAULT_DEFLATE_LEVEL = 6
+
+# auto 级别下不压缩的扩展名（内容已经压缩过）
+COMPRESSED_EXTENSIONS = (".xlsx", ".xlsm", ".xlsb", ".docx", ".pptx", ".zip", ".gz", ".bz2", ".xz", ".7z",
+                         ".rar", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4", ".parquet", ".arrow")
+
+# 每个线程最多提前压缩的成员数，限制等待写出的数据占用的内存
+PREFETCH_PER_JOB = 2
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+END_LOCATOR64 = struct.Struct("<IIQI")
+
+# 文件名为 UTF-8（中文文件名在各平台解压时都正确）
+FLAG_UTF8 = 0x800
+
+CREATE_SYSTEM = 0 if sys.platform == "win32" else 3
+
+
+def parse_level(value):
+    """'store' / 'auto' / 0~9 转换成压缩级别（0 即 store）"""
+    text = str(value).strip().lower()
+    if text in (LEVEL_STORE, "0"):
+        return LEVEL_STORE
+    if text == LEVEL_AUTO:
+        return LEVEL_AUTO
+    if text.isdigit() and 1 <= int(text) <= 9:
+        return int(text)
+    raise ValueError(f"无法识别的压缩级别: {value}（可用 store、auto 或 1~9）")
+
+
+def member_level(name, level):
+    """一个成员实际使用的压缩级别：None 为不压缩"""
+    if level == LEVEL_STORE:
+        return None
+    if level == LEVEL_AUTO:
+        return None if name.lower().endswith(COMPRESSED_EXTENSIONS) else DEFAULT_DEFLATE_LEVEL
+    return level
+
+
+def _dos_time(mtime):
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class _Entry:
+    """压缩好的一个成员"""
+
+    __slots__ = ("name", "data", "data_size", "crc", "size", "method", "mtime", "mode", "offset")
+
+    def __init__(self, name, data, crc, size, method, mtime, mode):
+        self.name = name
+        self.data = data
+        self.data_size = len(data)
+        self.crc = crc
+        self.size = size
+        self.method = method
+        self.mtime = mtime
+        self.mode = mode
+        self.offset = 0
+
+    @property
+    def zip64(self):
+        return self.size > ZIP64_LIMIT or self.data_size > ZIP64_LIMIT
+
+    def local_header(self):
+        name = self.name.encode("utf-8")
+        dos_time, dos_date = _dos_time(self.mtime)
+        extra = b""
+        size, compressed = self.size, self.data_size
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 1, 16, self.size, self.data_size)
+            size = compressed = ZIP64_LIMIT
+        return LOCAL_HEADER.pack(0x04034B50, 45 if self.zip64 else 20, FLAG_UTF8, self.method, dos_time,
+                                 dos_date, self.crc, compressed, size, len(name), len(extra)) + name + extra
+
+    def central_header(self):
+        name = self.name.encode("utf-8")
+        dos_time, dos_date = _dos_time(self.mtime)
+        # ZIP64 扩展字段只包含超出范围的字段，顺序固定
+        fields = []
+        size, compressed, offset = self.size, self.data_size, self.offset
+        if size > ZIP64_LIMIT:
+            fields.append(size)
+            size = ZIP64_LIMIT
+        if compressed > ZIP64_LIMIT:
+            fields.append(compressed)
+            compressed = ZIP64_LIMIT
+        if offset > ZIP64_LIMIT:
+            fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+        version = 45 if fields else 20
+        return CENTRAL_HEADER.pack(0x02014B50, (CREATE_SYSTEM << 8) | version, version, FLAG_UTF8, self.method,
+                                   dos_time, dos_date, self.crc, compressed, size, len(name), len(extra), 0,
+                                   0, 0, (self.mode & 0xFFFF) << 16, offset) + name + extra
+
+    def central_size(self):
+        # 按最大的 ZIP64 扩展字段估算，用于分卷
+        return CENTRAL_HEADER.size + len(self.name.encode("utf-8")) + 28
+
+
+def compress_member(file_path, name, level):
+    """读取并压缩一个文件，返回 _Entry（在线程池中调用）"""
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+    size = len(data)
+    method = ZIP_STORED
+    deflate_level = member_level(name, level)
+    if deflate_level is not None and data:
+        compressor = zlib.compressobj(deflate_level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) < size:
+            data, method = compressed, ZIP_DEFLATED
+    return _Entry(name, data, crc, size, method, stat.st_mtime, stat.st_mode)
+
+
+class _ZipWriter:
+    """把压缩好的成员写成一个 ZIP 文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "wb")
+        self.entries = []
+        self.central_bytes = 0
+
+    @property
+    def size(self):
+        return self.f.tell()
+
+    def projected_size(self, entry):
+        """写入 entry 并结束后的文件大小（估算上限）"""
+        local = LOCAL_HEADER.size + len(entry.name.encode("utf-8")) + 20 + entry.data_size
+        return (self.size + local + self.central_bytes + entry.central_size()
+                + END_RECORD64.size + END_LOCATOR64.size + END_RECORD.size)
+
+    def write(self, entry):
+        entry.offset = self.f.tell()
+        self.f.write(entry.local_header())
+        self.f.write(entry.data)
+        # 中央目录只需要文件头信息，写出后释放数据
+        entry.data = None
+        self.entries.append(entry)
+        self.central_bytes += entry.central_size()
+
+    def close(self):
+        start = self.f.tell()
+        for entry in self.entries:
+            self.f.write(entry.central_header())
+        end = self.f.tell()
+        count, central_size = len(self.entries), end - start
+        if count > ZIP_FILECOUNT_LIMIT or start > ZIP64_LIMIT or central_size > ZIP64_LIMIT:
+            self.f.write(END_RECORD64.pack(0x06064B50, END_RECORD64.size - 12, 45, 45, 0, 0, count, count,
+                                           central_size, start))
+            self.f.write(END_LOCATOR64.pack(0x07064B50, 0, end, 1))
+            self.f.write(END_RECORD.pack(0x06054B50, 0, 0, min(count, ZIP_FILECOUNT_LIMIT),
+                                         min(count, ZIP_FILECOUNT_LIMIT), min(central_size, ZIP64_LIMIT),
+                                         min(start, ZIP64_LIMIT), 0))
+        else:
+            self.f.write(END_RECORD.pack(0x06054B50, 0, 0, count, count, central_size, start, 0))
+        self.f.close()
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        self.f.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def volume_path(output_file, index):
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.part{index:02d}{ext or '.zip'}"
+
+
+def list_directory(directory):
+    """目录下的所有文件（按相对路径排序），返回 [(文件路径, 压缩包中的名称)]"""
+    members = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in files:
+            file_path = os.path.join(root, file)
+            members.append((file_path, os.path.relpath(file_path, directory).replace(os.sep, "/")))
+    members.sort(key=lambda member: member[1])
+    return members
+
+
+def package_files(members, output_file, level=LEVEL_AUTO, jobs=None, volume_size=None, log=print,
+                  checkpoint=None, tracer=NULL_TRACER):
+    """
+    把文件打包成 ZIP
+
+    参数:
+        members: [(文件路径, 压缩包中的名称)]，按此顺序写出
+        output_file: 压缩包路径；分成多个分卷时为“名称.partNN.zip”
+        level: 压缩级别，见 parse_level
+        jobs: 压缩线程数，默认 CPU 核数
+        volume_size: 每个分卷的最大字节数，None 不分卷
+        checkpoint: 每写出一个成员调用一次，用于暂停或取消任务
+
+    返回:
+        {'files', 'members', 'input_bytes', 'output_bytes', 'seconds', 'level', 'jobs', 'bytes_per_second'}
+    """
+    level = parse_level(level)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    start = time.perf_counter()
+    volumes = []
+    writer = None
+    input_bytes = output_bytes = member_count = 0
+
+    def open_volume():
+        path = volume_path(output_file, len(volumes) + 1) if volume_size else output_file
+        volumes.append(path)
+        return _ZipWriter(path)
+
+    pending = deque()
+    members = iter(members)
+    try:
+        with tracer.span("zip.package", level=str(level)), ThreadPoolExecutor(max_workers=jobs) as executor:
+            def submit():
+                for file_path, name in members:
+                    pending.append(executor.submit(compress_member, file_path, name, level))
+                    if len(pending) >= jobs * PREFETCH_PER_JOB:
+                        break
+
+            writer = open_volume()
+            submit()
+            while pending:
+                entry = pending.popleft().result()
+                submit()
+                if checkpoint is not None:
+                    checkpoint()
+                if volume_size and writer.entries and writer.projected_size(entry) > volume_size:
+                    output_bytes += writer.close()
+                    writer = open_volume()
+                input_bytes += entry.size
+                member_count += 1
+                writer.write(entry)
+            output_bytes += writer.close()
+            writer = None
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        if writer is not None:
+            writer.abort()
+        for path in volumes[:-1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+    if len(volumes) == 1 and volumes[0] != output_file:
+        # 没有超过分卷大小时只生成一个压缩包，不加分卷序号
+        os.replace(volumes[0], output_file)
+        volumes = [output_file]
+    seconds = time.perf_counter() - start
+    tracer.count("zip_input_bytes", input_bytes)
+    tracer.count("zip_bytes", output_bytes)
+    stats = {
+        "files": volumes,
+        "members": member_count,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "seconds": seconds,
+        "level": level,
+        "jobs": jobs,
+        "bytes_per_second": input_bytes / seconds if seconds > 0 else None,
+    }
+    log(format_stats(stats))
+    return stats
+
+
+def format_stats(stats):
+    """打包结果的一行说明"""
+    ratio = stats["output_bytes"] / stats["input_bytes"] if stats["input_bytes"] else 1
+    speed = format_bytes(stats["bytes_per_second"]) + "/秒" if stats["bytes_per_second"] else "未知"
+    volumes = f"，分成 {len(stats['files'])} 个压缩包" if len(stats["files"]) > 1 else ""
+    return (f"已打包 {stats['members']} 个文件（压缩级别 {stats['level']}，{stats['jobs']} 线程）: "
+            f"{format_bytes(stats['input_bytes'])} → {format_bytes(stats['output_bytes'])}（{ratio:.1%}），"
+            f"{stats['seconds']:.2f} 秒，{speed}{volumes}")
+
+
+def package_directory(directory, output_file, **kwargs):
+    """把目录下的所有文件打包（按相对路径排序），参数见 package_files"""
+    return package_files(list_directory(directory), output_file, **kwargs)